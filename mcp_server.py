@@ -1,15 +1,37 @@
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 import datetime
 from logging import DEBUG, INFO, Formatter, FileHandler, getLogger
 import os
+import time
 from typing import Any
 
-import requests
+import httpx
 from mcp.server.fastmcp import FastMCP
 
 # MCPサーバの起動時に環境変数として事前に設定しておく
 # API_TOKENはTest Managerの然るべきユーザ権限で発行しておく
 API_TOKEN = os.getenv("API_TOKEN")
 DJANGO_API_BASE_URL = os.getenv("DJANGO_API_BASE_URL")
+# Djangoバックエンドへ同時に送るリクエスト数の上限
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "8"))
+REQUEST_TIMEOUT = 10
+# リソースの種類ごとのキャッシュの有効期間（秒）と、キャッシュする件数の上限
+CACHE_TTLS = {
+    "projects": 60,
+    "test_sessions": 10,
+    "test_executions": 5,
+}
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "256"))
+# キャッシュのヒット率をログに出力する間隔（参照回数）
+CACHE_STATS_INTERVAL = 100
+# 結果の一括記録APIが1回に受け付ける件数の上限
+BULK_MAX_RESULTS = 500
+# 一覧APIから1回に取得する件数（APIの上限は200件）と、テストセッション一覧で返す件数の上限（新しい順）
+LIST_PAGE_SIZE = 200
+TEST_SESSIONS_LIMIT = int(os.getenv("TEST_SESSIONS_LIMIT", "100"))
+RESULT_STATUSES = ["PASS", "FAIL", "BLOCKED", "SKIPPED"]
 
 
 logger = getLogger(__name__)
@@ -21,49 +43,189 @@ handler.setFormatter(Formatter("%(asctime)s %(levelname)7s %(message)s"))
 
 logger.info(f"Launching Test Manager MCP Server (url: {DJANGO_API_BASE_URL})")
 
-mcp = FastMCP("Test Manager on MCP")
+# 接続を使い回すため、HTTPクライアントはプロセス内で1つだけ作る
+_client: httpx.AsyncClient | None = None
+_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 
 
-def _api_get(api_url: str, timeout: int = 10) -> Any:
-    headers = {"Authorization": f"Token {API_TOKEN}"}
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=DJANGO_API_BASE_URL or "",
+            headers={"Authorization": f"Token {API_TOKEN}"},
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=MAX_CONCURRENT_REQUESTS,
+                max_keepalive_connections=MAX_CONCURRENT_REQUESTS,
+            ),
+        )
+    return _client
+
+
+@asynccontextmanager
+async def _lifespan(server: FastMCP):
     try:
-        response = requests.get(api_url, headers=headers, timeout=timeout)
-        return response.json()
-    except RuntimeError as e:
-        return {"error": f"get_projects() failed (url: {api_url}, message: {str(e)})"}
+        yield
+    finally:
+        if _client is not None:
+            await _client.aclose()
+
+
+mcp = FastMCP("Test Manager on MCP", lifespan=_lifespan)
+
+
+async def _api_request(method: str, path: str, **kwargs) -> Any:
+    """DjangoバックエンドのAPIを呼び出してJSONを返す。
+    通信できない場合は、そのことをクライアントに伝えるためのエラーを返す"""
+    async with _semaphore:
+        try:
+            response = await _get_client().request(method, path, **kwargs)
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"{method} {path} failed: {e!r}")
+            return {"error": f"{method} {path} failed (message: {str(e)})"}
+
+
+async def _api_get(path: str, **kwargs) -> Any:
+    return await _api_request("GET", path, **kwargs)
+
+
+async def _api_get_list(path: str, max_items: int | None = None) -> Any:
+    """ページングされた一覧APIのresultsを、nextをたどってmax_items件まで取得してリストで返す。
+    エラーの場合はそのレスポンスを返す"""
+    items = []
+    params = {"page_size": LIST_PAGE_SIZE}
+    while path:
+        data = await _api_get(path, params=params)
+        if not (isinstance(data, dict) and "results" in data):
+            return data
+        items.extend(data["results"])
+        if max_items is not None and len(items) >= max_items:
+            return items[:max_items]
+        # nextはpage_sizeとカーソルを含むURL
+        path, params = data["next"], None
+    return items
+
+
+class _ResponseCache:
+    """APIのレスポンスをTTL付きで保持するLRUキャッシュ。
+    キーは(リソースの種類, パス)の組とし、書き込み系のツールから種類・パスを指定して無効化する"""
+
+    def __init__(self, ttls: dict[str, float], max_size: int):
+        self.ttls = ttls
+        self.max_size = max_size
+        self.entries: OrderedDict[tuple[str, str], tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple[str, str]) -> Any:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.entries.pop(key, None)
+            self._count(key, hit=False)
+            return None
+        self.entries.move_to_end(key)
+        self._count(key, hit=True)
+        return entry[1]
+
+    def set(self, key: tuple[str, str], value: Any):
+        self.entries[key] = (time.monotonic() + self.ttls[key[0]], value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, kind: str, path: str | None = None):
+        """指定した種類のエントリを無効化する。pathを指定した場合はそのパスのみ"""
+        for key in list(self.entries):
+            if key[0] == kind and (path is None or key[1] == path):
+                del self.entries[key]
+
+    def _count(self, key: tuple[str, str], hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        logger.debug(f"cache {'hit' if hit else 'miss'}: {key[1]}")
+        if (self.hits + self.misses) % CACHE_STATS_INTERVAL == 0:
+            logger.info(f"cache stats: hits={self.hits}, misses={self.misses}, "
+                        f"hit_rate={self.hits / (self.hits + self.misses):.1%}, "
+                        f"size={len(self.entries)}")
+
+
+_cache = _ResponseCache(CACHE_TTLS, CACHE_MAX_SIZE)
+
+
+async def _cached_get(kind: str, path: str, fetch=_api_get) -> Any:
+    """GETのレスポンスをkindごとの有効期間でキャッシュする。エラーはキャッシュしない"""
+    key = (kind, path)
+    data = _cache.get(key)
+    if data is None:
+        data = await fetch(path)
+        if not (isinstance(data, dict) and "error" in data):
+            _cache.set(key, data)
+    return data
+
+
+def _invalidate_test_session(test_session_id: int):
+    """テストセッションの結果が変わった際に、関連するキャッシュを無効化する"""
+    _cache.invalidate("test_executions", f"/api/test-sessions/{test_session_id}/execute/")
+    # テストセッション一覧は完了状態を含むため、どのプロジェクトの一覧も無効化する
+    _cache.invalidate("test_sessions")
+
+
+async def _api_post(path: str, json_data: Any, **kwargs) -> Any:
+    return await _api_request("POST", path, json=json_data, **kwargs)
 
 
 @mcp.resource("tm://projects")
-def get_projects():
+async def get_projects():
     """シナリオテストのプロジェクト一覧を取得する"""
     logger.debug("get_projects()")
-    return _api_get(f"{DJANGO_API_BASE_URL}/api/projects/")
+    return await _cached_get("projects", "/api/projects/", _api_get_list)
 
 
 @mcp.resource("tm://test_sessions/{project_id}")
-def get_test_sessions(project_id):
-    """指定したプロジェクトIDのテストセッション一覧を取得する"""
+async def get_test_sessions(project_id):
+    """指定したプロジェクトIDのテストセッション一覧を新しい順に取得する"""
     logger.debug(f"get_test_sessions(project_id: {project_id})")
-    return _api_get(f"{DJANGO_API_BASE_URL}/api/projects/{project_id}/test-sessions/")
+    return await _cached_get(
+        "test_sessions",
+        f"/api/projects/{project_id}/test-sessions/",
+        lambda path: _api_get_list(path, max_items=TEST_SESSIONS_LIMIT),
+    )
 
 
 @mcp.resource("tm://test_executions/{session_id}")
-def get_test_execution_detail(session_id: int):
+async def get_test_execution_detail(session_id: int):
     """指定したテストセッションのテスト実行状況を取得する"""
     logger.debug(f"get_test_execution_detail(session_id: {session_id})")
-    return _api_get(f"{DJANGO_API_BASE_URL}/api/test-sessions/{session_id}/execute/")
+    return await _cached_get("test_executions", f"/api/test-sessions/{session_id}/execute/")
+
+
+@mcp.tool()
+async def get_test_session_progresses(test_session_ids: list[int]) -> list:
+    """指定した複数のテストセッションの進捗（件数のみ）をまとめて取得する"""
+    logger.debug(f"get_test_session_progresses(test_session_ids: {test_session_ids})")
+    return await asyncio.gather(
+        *(
+            _api_get(
+                f"/api/test-sessions/{test_session_id}/execute/",
+                params={"counters_only": "true"},
+            )
+            for test_session_id in test_session_ids
+        )
+    )
 
 
 @mcp.tool()
-def create_new_test_session(project_id: int, session_name: str = None) -> int:
+async def create_new_test_session(project_id: int, session_name: str = None) -> int:
     """指定したプロジェクトに対して新しいテストセッションを作成して、そのテストセッションのIDを得る"""
     if not session_name:
         now = datetime.datetime.now()
         session_name = "MCPセッション {}".format(now.strftime("%Y-%m-%d %H:%M"))
     logger.debug(f"create_new_session(project_id: {project_id}, session_name: {session_name})")
 
-    api_url = f"{DJANGO_API_BASE_URL}/api/projects/{project_id}/test-sessions/"
-    headers = {"Authorization": f"Token {API_TOKEN}"}
     json_data = {
         "project": project_id,
         "name": session_name,
@@ -71,58 +233,103 @@ def create_new_test_session(project_id: int, session_name: str = None) -> int:
         "executed_by": "testuser",
         "environment": "Test Env",
     }
-    try:
-
-        response = requests.post(api_url, headers=headers, json=json_data, timeout=10)
-        return response.json()
-    except RuntimeError as e:
-        return {"error": f"Failed to fetch projects: {str(e)}"}
+    response = await _api_post(f"/api/projects/{project_id}/test-sessions/", json_data)
+    _cache.invalidate("test_sessions", f"/api/projects/{project_id}/test-sessions/")
+    return response
 
 
-def mark_as_completed(test_session_id: int, test_case_id: int, status: str):
+async def mark_as_completed(test_session_id: int, test_case_id: int, status: str):
     """指定したテストセッション中のテストケースが完了状態にする。
     statusは"PASS", "FAIL", "BLOCKED", "SKIPPED"のいずれか"""
-    assert status in ["PASS", "FAIL", "BLOCKED", "SKIPPED"]
-    api_url = f"{DJANGO_API_BASE_URL}/api/test-sessions/{test_session_id}/execute/"
-    headers = {"Authorization": f"Token {API_TOKEN}"}
+    assert status in RESULT_STATUSES
     json_data = {
         "test_case_id": test_case_id,
         "status": status,
     }
-    try:
-        response = requests.post(api_url, headers=headers, json=json_data, timeout=10)
-        return response.json()
-    except RuntimeError as e:
-        return {"error": f"Failed to fetch projects: {str(e)}"}
+    response = await _api_post(f"/api/test-sessions/{test_session_id}/execute/", json_data)
+    _invalidate_test_session(test_session_id)
+    return response
 
 
 @mcp.tool()
-def mark_as_passed(test_session_id: int, test_case_id: int) -> int:
+async def mark_as_passed(test_session_id: int, test_case_id: int) -> int:
     """指定したテストセッション中のテストケースが成功したと記録する"""
-    return mark_as_completed(test_session_id=test_session_id,
-                             test_case_id=test_case_id,
-                             status="PASS")
+    return await mark_as_completed(test_session_id=test_session_id,
+                                   test_case_id=test_case_id,
+                                   status="PASS")
 
 
 @mcp.tool()
-def mark_as_failed(test_session_id: int, test_case_id: int) -> int:
+async def mark_as_failed(test_session_id: int, test_case_id: int) -> int:
     """指定したテストセッション中のテストケースが失敗したと記録する"""
-    return mark_as_completed(test_session_id=test_session_id,
-                             test_case_id=test_case_id,
-                             status="FAIL")
+    return await mark_as_completed(test_session_id=test_session_id,
+                                   test_case_id=test_case_id,
+                                   status="FAIL")
 
 
 @mcp.tool()
-def mark_as_blocked(test_session_id: int, test_case_id: int) -> int:
+async def mark_as_blocked(test_session_id: int, test_case_id: int) -> int:
     """指定したテストセッション中のテストケースがブロックされたと記録する"""
-    return mark_as_completed(test_session_id=test_session_id,
-                             test_case_id=test_case_id,
-                             status="BLOCKED")
+    return await mark_as_completed(test_session_id=test_session_id,
+                                   test_case_id=test_case_id,
+                                   status="BLOCKED")
 
 
 @mcp.tool()
-def mark_as_skipped(test_session_id: int, test_case_id: int) -> int:
+async def mark_as_skipped(test_session_id: int, test_case_id: int) -> int:
     """指定したテストセッション中のテストケースをスキップする"""
-    return mark_as_completed(test_session_id=test_session_id,
-                             test_case_id=test_case_id,
-                             status="SKIPPED")
+    return await mark_as_completed(test_session_id=test_session_id,
+                                   test_case_id=test_case_id,
+                                   status="SKIPPED")
+
+
+async def _post_results(test_session_id: int, results: list[dict], **json_data) -> dict:
+    """結果の一括記録APIにresultsを送る。上限を超える場合は分割して送り、
+    項目ごとの結果をまとめて最後の時点の進捗と共に返す。
+    同じテストセッションへの書き込みはバックエンドで直列化されるため、並行には送らない"""
+    api_path = f"/api/test-sessions/{test_session_id}/execute/bulk/"
+    summary = None
+    recorded = []
+    for i in range(0, max(len(results), 1), BULK_MAX_RESULTS):
+        chunk = results[i:i + BULK_MAX_RESULTS]
+        summary = await _api_post(api_path, {"results": chunk, **json_data})
+        if "results" not in summary:
+            break
+        recorded.extend(summary["results"])
+    _invalidate_test_session(test_session_id)
+    if "results" in summary:
+        summary["results"] = recorded
+    return summary
+
+
+@mcp.tool()
+async def mark_results(test_session_id: int, results: list[tuple[int, str]]) -> dict:
+    """指定したテストセッション中の複数のテストケースの結果を1回で記録する。
+    resultsは(test_case_id, status)の組のリストで、statusは"PASS", "FAIL", "BLOCKED", "SKIPPED"のいずれか"""
+    logger.debug(f"mark_results(test_session_id: {test_session_id}, results: {len(results)} items)")
+    return await _post_results(
+        test_session_id,
+        [{"test_case_id": test_case_id, "status": status} for test_case_id, status in results],
+    )
+
+
+@mcp.tool()
+async def mark_test_cases(test_session_id: int, test_case_ids: list[int], status: str) -> dict:
+    """指定したテストセッション中の複数のテストケースを同じstatusで記録する。
+    statusは"PASS", "FAIL", "BLOCKED", "SKIPPED"のいずれか"""
+    logger.debug(f"mark_test_cases(test_session_id: {test_session_id}, "
+                 f"test_case_ids: {test_case_ids}, status: {status})")
+    assert status in RESULT_STATUSES
+    return await _post_results(
+        test_session_id,
+        [{"test_case_id": test_case_id, "status": status} for test_case_id in test_case_ids],
+    )
+
+
+@mcp.tool()
+async def mark_remaining_as(test_session_id: int, status: str) -> dict:
+    """指定したテストセッション中の未実行のテストケースをすべて同じstatusで記録する。
+    statusは"PASS", "FAIL", "BLOCKED", "SKIPPED"のいずれか"""
+    logger.debug(f"mark_remaining_as(test_session_id: {test_session_id}, status: {status})")
+    assert status in RESULT_STATUSES
+    return await _post_results(test_session_id, [], remaining_status=status)
@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import Project, TestSuite, TestCase, TestSession, TestExecution
+from .models import (
+    Project,
+    TestSuite,
+    TestCase,
+    TestSession,
+    TestExecution,
+    ImportJob,
+)
 
 
 @admin.register(TestSession)
@@ -40,3 +47,18 @@ class TestExecutionAdmin(admin.ModelAdmin):
     list_display = ("test_case", "status", "executed_by", "executed_at", "environment")
     list_filter = ("status", "environment")
     search_fields = ("test_case__title", "notes", "executed_by")
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "file_name",
+        "status",
+        "processed_rows",
+        "total_rows",
+        "created_by",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status",)
+    exclude = ("content",)
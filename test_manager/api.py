@@ -1,42 +1,160 @@
 from rest_framework import generics, permissions
 from rest_framework import status
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from .models import Project, TestSuite, TestCase, TestSession, TestExecution
+from django.utils.decorators import method_decorator
+from .conditional import conditional_get, content_state
+from .forms import SearchForm, TestSessionFilterForm, TestSuiteFilterForm
+from .models import Project, TestSuite, TestCase, TestStep, TestSession, TestExecution
 from .serializers import (
     ProjectSerializer,
     TestSuiteSerializer,
     TestSessionSerializer,
     TestCaseSerializer,
+    TestCaseSearchResultSerializer,
+    PROJECT_VALUE_FIELDS,
+    SESSION_VALUE_FIELDS,
+    SUITE_VALUE_FIELDS,
+    build_case_data,
+    build_project_data,
+    build_session_data,
+    build_suite_data,
+    case_value_fields,
 )
+from .search import search_test_cases
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from collections import Counter
+from django.db import transaction
 from django.utils import timezone
 
 
-class ProjectList(generics.ListCreateAPIView):
+def _project_list_state(request):
+    return content_state(Project.objects.all())
+
+
+class FilterFormMixin:
+    """一覧をfilter_form_classのフォームで検証したクエリパラメータで絞り込む。
+    不正な値の場合は400を返す"""
+
+    filter_form_class = None
+
+    def filter_queryset(self, queryset):
+        form = self.filter_form_class(self.request.query_params)
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        return form.filter_queryset(super().filter_queryset(queryset))
+
+
+class ValuesListMixin:
+    """一覧のGETではシリアライザを経由せず、value_fieldsの.values()の行から
+    build_data(rows)で同じ形のレスポンスを組み立てる。作成などの書き込みはシリアライザを使う。
+    value_fieldsとbuild_dataはサブクラスで必ず指定する"""
+
+    value_fields = None
+    build_data = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.value_fields is None or cls.build_data is None:
+            raise ImproperlyConfigured(
+                f"{cls.__name__} must define value_fields and build_data"
+            )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).values(*self.value_fields)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.build_data(page))
+
+
+@method_decorator(conditional_get(_project_list_state), name="get")
+class ProjectList(ValuesListMixin, generics.ListCreateAPIView):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     permission_classes = [permissions.IsAuthenticated]
+    ordering = "id"
+    value_fields = PROJECT_VALUE_FIELDS
+    build_data = staticmethod(build_project_data)
+
+
+def _suite_tree_options(query_params):
+    """テストスイート一覧に含める階層をクエリパラメータから読み取り、
+    (テストケースを含めるか, テストステップを含めるか)を返す。
+
+    include_cases=true: テストケースを含める
+    include_steps: テストケースのステップを含めるか。省略時はtrue
+    depth: 含める階層の上限。0はスイートのみ、1はテストケースまで、2以上はステップまで
+    不正な値の場合はValueErrorを送出する"""
+    include_cases = _is_true(query_params.get("include_cases"))
+    include_steps = include_cases and _is_true(
+        query_params.get("include_steps", "true")
+    )
+    if query_params.get("depth"):
+        depth = int(query_params["depth"])
+        if depth < 0:
+            raise ValueError("depth must not be negative")
+        include_cases = include_cases and depth >= 1
+        include_steps = include_steps and depth >= 2
+    return include_cases, include_steps
+
+
+def _project_test_suites_state(request, project_id):
+    try:
+        include_cases, include_steps = _suite_tree_options(request.GET)
+    except ValueError:
+        # 不正な値の場合は通常どおり処理して400を返す
+        return None
+    sources = [TestSuite.objects.filter(project_id=project_id)]
+    if include_cases:
+        sources.append(TestCase.objects.filter(suite__project_id=project_id))
+    if include_steps:
+        sources.append(TestStep.objects.filter(test_case__suite__project_id=project_id))
+    return content_state(*sources)
+
 
+@method_decorator(conditional_get(_project_test_suites_state), name="get")
+class ProjectTestSuiteList(FilterFormMixin, generics.ListAPIView):
+    """プロジェクトのテストスイートをid順に返す。
+    updated_from, updated_toで更新日の範囲を絞り込める。
+    include_cases, include_steps, depthで含める階層を指定する（_suite_tree_options）"""
 
-class ProjectTestSuiteList(generics.ListAPIView):
     serializer_class = TestSuiteSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_form_class = TestSuiteFilterForm
+    ordering = "id"
+
+    def list(self, request, *args, **kwargs):
+        try:
+            include_cases, include_steps = _suite_tree_options(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # TestSuiteSerializerを経由せず、ページ内のスイートとそのテストケース、
+        # ステップをそれぞれ1回のクエリで取得して同じ形のレスポンスを組み立てる
+        queryset = self.filter_queryset(self.get_queryset()).values(*SUITE_VALUE_FIELDS)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(
+            build_suite_data(page, include_cases, include_steps)
+        )
 
     def get_queryset(self):
         project_id = self.kwargs["project_id"]
         return TestSuite.objects.filter(project_id=project_id)
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        context["request"] = self.request
-        return context
 
+class TestSessionList(ValuesListMixin, FilterFormMixin, generics.ListCreateAPIView):
+    """プロジェクトのテストセッションを新しい順に返す。
+    state(running, completed)で完了状態を、started_from, started_toで開始日の範囲を絞り込める"""
 
-class TestSessionList(generics.ListCreateAPIView):
     serializer_class = TestSessionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_form_class = TestSessionFilterForm
+    ordering = ("-started_at", "-id")
+    value_fields = SESSION_VALUE_FIELDS
+    build_data = staticmethod(build_session_data)
 
     def get_queryset(self):
         # project_id must be part of the URL pattern for this view
@@ -65,16 +183,90 @@ class TestSessionList(generics.ListCreateAPIView):
         )
 
 
+def _is_true(value):
+    return str(value).lower() == "true"
+
+
+def _remaining_cases_options(request):
+    """remaining_test_casesの取得オプションをクエリパラメータから読み取る。
+
+    limit: 返す件数の上限。省略時はすべて
+    cursor: 前のレスポンスのnext_cursor。その続きから返す
+    fields: 返すTestCaseのフィールドをカンマ区切りで指定する。例: fields=id,title
+    不正な値の場合はValueErrorを送出する"""
+    params = request.query_params
+    limit = int(params["limit"]) if params.get("limit") else None
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be positive")
+    cursor = int(params.get("cursor") or 0)
+    fields = TestCaseSerializer.Meta.fields
+    if params.get("fields"):
+        fields = params["fields"].split(",")
+        unknown = set(fields) - set(TestCaseSerializer.Meta.fields)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return limit, cursor, fields
+
+
+def _remaining_test_cases(test_session, limit, cursor, fields):
+    """未実行のTestCaseをposition順にシリアライズし、次のページのカーソルと共に返す"""
+    rows = test_session.executions.filter(
+        status="NOT_TESTED", position__gt=cursor
+    ).values("position", *case_value_fields(fields, "test_case__"))
+    if limit is not None:
+        rows = rows[: limit + 1]
+    rows = list(rows)
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["position"]
+    return build_case_data(rows, fields, "test_case__"), next_cursor
+
+
+def _progress_summary(test_session):
+    """TestSessionの進捗をカウンタから返す。未実行がなければセッションを完了にする"""
+    completed = test_session.not_tested_count == 0
+    if completed and not test_session.completed_at:
+        test_session.complete()
+    return {
+        "test_session_id": test_session.id,
+        "test_session_name": test_session.name,
+        "completed": completed,
+        "total_count": test_session.total_count,
+        "completed_count": test_session.completed_count,
+        "progress": 100 if completed else test_session.progress,
+        "remaining_count": test_session.not_tested_count,
+    }
+
+
 @api_view(["GET", "POST"])
 @permission_classes([IsAuthenticated])
 def execute_test_case(request, test_session_id):
     """
+    TestSessionの進捗と未実行のTestCase(remaining_test_cases)を返す。
     POSTの場合は指定されたTestCaseについて状況を記録する。
+
+    remaining_test_casesはクエリパラメータのlimit, cursor, fieldsで
+    ページングと返すフィールドの絞り込みができる。
+    counters_only=true（クエリパラメータまたはPOSTのボディ）の場合は
+    remaining_test_casesを含めず、件数のみを返す
     """
     try:
         test_session = get_object_or_404(TestSession, pk=test_session_id)
+        try:
+            limit, cursor, fields = _remaining_cases_options(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        counters_only = _is_true(request.query_params.get("counters_only")) or (
+            request.method == "POST" and _is_true(request.data.get("counters_only"))
+        )
 
         if request.method == "POST":
+            if request.data.get("status") not in dict(TestExecution.STATUS_CHOICES):
+                return Response(
+                    {"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST
+                )
             test_case = TestCase.objects.get(id=request.data.get("test_case_id"))
             execution = test_session.executions.get(test_case=test_case)
 
@@ -86,38 +278,15 @@ def execute_test_case(request, test_session_id):
             execution.result_detail = request.data.get("result_detail", "")
             execution.notes = request.data.get("notes", "")
             execution.save()
+            test_session.refresh_from_db(fields=TestSession.COUNTER_FIELDS)
 
-        executions = test_session.executions.all()
-        total_count = executions.count()
-        completed_count = executions.exclude(status="NOT_TESTED").count()
-        progress = (completed_count / total_count) * 100 if total_count > 0 else 0
-
-        remaining_test_cases = [
-            TestCaseSerializer(ne.test_case).data
-            for ne in executions.filter(status="NOT_TESTED")
-        ]
-        if not remaining_test_cases:
-            if not test_session.completed_at:
-                test_session.complete()
-            response_data = {
-                "test_session_id": test_session.id,
-                "test_session_name": test_session.name,
-                "completed": True,
-                "total_count": total_count,
-                "completed_count": completed_count,
-                "progress": 100,
-                "remaining_test_cases": [],
-            }
-        else:
-            response_data = {
-                "test_session_id": test_session.id,
-                "test_session_name": test_session.name,
-                "completed": False,
-                "total_count": total_count,
-                "completed_count": completed_count,
-                "progress": progress,
-                "remaining_test_cases": remaining_test_cases,
-            }
+        response_data = _progress_summary(test_session)
+        if not counters_only:
+            remaining_test_cases, next_cursor = _remaining_test_cases(
+                test_session, limit, cursor, fields
+            )
+            response_data["remaining_test_cases"] = remaining_test_cases
+            response_data["next_cursor"] = next_cursor
         return Response(response_data, status=status.HTTP_200_OK)
     except TestSession.DoesNotExist:
         return Response(
@@ -133,7 +302,163 @@ def execute_test_case(request, test_session_id):
         )
 
 
+# 一括記録APIで1回に受け付ける結果の件数の上限
+MAX_BULK_RESULTS = 500
+
+# 結果の記録時に更新するTestExecutionのフィールド
+RESULT_FIELDS = [
+    "status",
+    "executed_by",
+    "executed_at",
+    "environment",
+    "result_detail",
+    "notes",
+    "updated_at",
+]
+
+
+def _validate_result(item, seen):
+    """一括記録APIの1件分を検証し、エラーがあればそのメッセージを返す"""
+    if not isinstance(item, dict):
+        return "Invalid item"
+    test_case_id = item.get("test_case_id")
+    if not isinstance(test_case_id, int) or isinstance(test_case_id, bool):
+        return "test_case_id is required"
+    if test_case_id in seen:
+        return "Duplicated test_case_id"
+    if item.get("status") not in dict(TestExecution.STATUS_CHOICES):
+        return "Invalid status"
+    return None
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def execute_test_cases_bulk(request, test_session_id):
+    """
+    TestSession内の複数のTestCaseの結果をまとめて記録する。
+
+    ボディのresultsに {test_case_id, status, notes, result_detail} のリストを指定する。
+    エラーのあった項目は記録せず、項目ごとの結果(results)と
+    記録後の進捗をまとめて返す。
+    remaining_statusを指定した場合は、resultsを記録した後に残った
+    未実行のテストケースをすべてそのstatusで記録する
+    """
+    test_session = get_object_or_404(TestSession, pk=test_session_id)
+    data = request.data if isinstance(request.data, dict) else {}
+    items = data.get("results", [] if "remaining_status" in data else None)
+    if not isinstance(items, list):
+        return Response(
+            {"error": "results must be a list"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    remaining_status = data.get("remaining_status")
+    if remaining_status is not None and (
+        remaining_status == "NOT_TESTED"
+        or remaining_status not in dict(TestExecution.STATUS_CHOICES)
+    ):
+        return Response(
+            {"error": "Invalid remaining_status"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > MAX_BULK_RESULTS:
+        return Response(
+            {"error": f"Too many results (max: {MAX_BULK_RESULTS})"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    errors = []
+    valid_items = {}
+    for item in items:
+        error = _validate_result(item, valid_items)
+        if error is None:
+            valid_items[item["test_case_id"]] = item
+        errors.append(error)
+
+    now = timezone.now()
+    with transaction.atomic():
+        executions = {
+            execution.test_case_id: execution
+            for execution in test_session.executions.select_for_update().filter(
+                test_case_id__in=valid_items
+            )
+        }
+        deltas = Counter()
+        for test_case_id, item in valid_items.items():
+            execution = executions.get(test_case_id)
+            if execution is None:
+                continue
+            deltas[execution.status] -= 1
+            deltas[item["status"]] += 1
+            execution.status = item["status"]
+            execution.executed_by = test_session.executed_by
+            execution.executed_at = now
+            execution.environment = test_session.environment
+            execution.result_detail = item.get("result_detail") or ""
+            execution.notes = item.get("notes") or ""
+            execution.updated_at = now
+        # bulk_updateはsave()を経由しないため、カウンタはまとめて更新する
+        TestExecution.objects.bulk_update(executions.values(), RESULT_FIELDS)
+        TestSession.add_to_counters(test_session.pk, deltas)
+        remaining_recorded = 0
+        if remaining_status is not None:
+            remaining_recorded = test_session.record_remainings(remaining_status)
+    test_session.refresh_from_db(fields=TestSession.COUNTER_FIELDS)
+
+    results = []
+    for item, error in zip(items, errors):
+        test_case_id = item.get("test_case_id") if isinstance(item, dict) else None
+        if error is None and test_case_id not in executions:
+            error = "TestExecution not found"
+        if error is None:
+            results.append({"test_case_id": test_case_id, "status": item["status"]})
+        else:
+            results.append({"test_case_id": test_case_id, "error": error})
+    response_data = _progress_summary(test_session)
+    response_data["results"] = results
+    response_data["remaining_recorded"] = remaining_recorded
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+def _test_case_state(request, pk):
+    last_modified, state = content_state(
+        TestCase.objects.filter(pk=pk), TestStep.objects.filter(test_case_id=pk)
+    )
+    # 存在しない場合は通常どおり404を返す
+    return (last_modified, state) if state[0][1] else None
+
+
+@method_decorator(conditional_get(_test_case_state), name="get")
 class TestCaseDetail(generics.RetrieveAPIView):
     queryset = TestCase.objects.all()
     serializer_class = TestCaseSerializer
     permission_classes = [permissions.IsAuthenticated]
+
+    def retrieve(self, request, *args, **kwargs):
+        rows = self.get_queryset().filter(pk=kwargs["pk"]).values(*case_value_fields())
+        if not rows:
+            raise Http404
+        return Response(build_case_data(rows)[0])
+
+
+class SearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class TestCaseSearch(generics.ListAPIView):
+    """テストケースとステップを全文検索し、関連度の高い順にページ単位で返す。
+    qに空白区切りの検索語、projectにプロジェクトIDを指定する"""
+
+    serializer_class = TestCaseSearchResultSerializer
+    pagination_class = SearchPagination
+    permission_classes = [permissions.IsAuthenticated]
+
+    def list(self, request, *args, **kwargs):
+        self.form = SearchForm(request.query_params)
+        if not self.form.is_valid():
+            return Response(self.form.errors, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return search_test_cases(
+            self.form.cleaned_data["q"], self.form.cleaned_data["project"]
+        )
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TestManagerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "test_manager"
+
+    def ready(self):
+        from . import signals  # noqa: F401
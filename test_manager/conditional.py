@@ -0,0 +1,86 @@
+"""更新日時と件数の集計から求めたETag・Last-Modifiedによる条件付きGET"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import Count, IntegerField, Max, Value
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .mixins import permission_key
+
+
+def content_state(*sources):
+    """sourcesの各クエリセットの最終更新日時と件数を1回のクエリで集計し、
+    (全体の最終更新日時, 状態)を返す。
+
+    sourcesには、クエリセットか(クエリセット, 日時のフィールド名)を指定する。
+    フィールド名の省略時はupdated_atとする。削除では最終更新日時が変わらないため、件数も状態に含める"""
+    parts = []
+    for index, source in enumerate(sources):
+        queryset, field = (
+            source if isinstance(source, tuple) else (source, "updated_at")
+        )
+        parts.append(
+            queryset.order_by()
+            .annotate(index=Value(index, output_field=IntegerField()))
+            .values("index")
+            .annotate(last=Max(field), count=Count("pk"))
+            .values("index", "last", "count")
+        )
+    rows = sorted(parts[0].union(*parts[1:], all=True), key=lambda row: row["index"])
+    state = [(row["last"], row["count"]) for row in rows]
+    last_modified = max((last for last, _ in state if last is not None), default=None)
+    return last_modified, state
+
+
+def conditional_get(state_func, per_user=False):
+    """state_func(request, *args, **kwargs)が返す(最終更新日時, 状態)から
+    ETagとLast-Modifiedを求め、If-None-Match・If-Modified-Sinceが一致する場合は
+    ビューを実行せずに304を返すデコレータ。state_funcがNoneを返した場合は通常どおり処理する。
+
+    per_userをTrueにすると、ユーザー・権限・CSRFトークンごとに異なるETagとする（HTML画面向け）。
+    ブラウザが再検証せずに古い内容を表示しないよう、Cache-Control: no-cacheを付ける"""
+
+    def get_state(request, *args, **kwargs):
+        if not hasattr(request, "_content_state"):
+            state = None
+            # 未表示のメッセージがある場合は、表示させるために304を返さない
+            if not (per_user and len(get_messages(request))):
+                state = state_func(request, *args, **kwargs)
+            request._content_state = state
+        return request._content_state
+
+    def etag_func(request, *args, **kwargs):
+        state = get_state(request, *args, **kwargs)
+        if state is None:
+            return None
+        variant = [request.get_full_path(), request.META.get("HTTP_ACCEPT", "")]
+        if per_user:
+            variant += [
+                request.user.pk,
+                permission_key(request.user),
+                request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+            ]
+        return hashlib.md5(repr((state[1], variant)).encode()).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        state = get_state(request, *args, **kwargs)
+        return state[0] if state is not None else None
+
+    def decorator(func):
+        conditional = condition(
+            etag_func=etag_func, last_modified_func=last_modified_func
+        )(func)
+
+        @wraps(func)
+        def inner(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return inner
+
+    return decorator
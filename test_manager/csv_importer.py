@@ -0,0 +1,393 @@
+import csv
+import io
+from itertools import islice
+from logging import getLogger
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import search
+from .models import Project, TestSuite, TestCase, TestStep, ImportJob
+
+_logger = getLogger("views")
+
+# bulk_create/bulk_updateおよびIN句で一度に扱う件数
+IMPORT_BATCH_SIZE = 1000
+
+# ImportJobで1回のトランザクションとしてコミットする行数
+IMPORT_JOB_CHUNK_ROWS = 5000
+
+
+def _chunks(values, size):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+class CSVImporter:
+    """CSVの全行を一度に解釈し、既存データを少数のINクエリで引き当てたうえで
+    bulk_create/bulk_updateでまとめて書き込むインポータ。
+
+    行の種類(project/suite/case/step)ごとの意味は1行ずつupdate_or_createしていた
+    従来の実装と同じで、参照先(スイートから見たプロジェクト、ケースから見たスイート、
+    ステップから見たテストケース)は既にDBに存在するか、CSV内のより前の行で
+    定義されている必要がある。同じ対象を定義する行が複数あれば後の行の内容が優先される"""
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, supports_upsert=None):
+        self.batch_size = batch_size
+        if supports_upsert is None:
+            supports_upsert = connection.features.supports_update_conflicts_with_target
+        self.supports_upsert = supports_upsert
+        # 各定義は {"value": 設定する値, "row_num": 最初に定義された行番号}
+        # プロジェクト名 -> description
+        self.projects = {}
+        # (project_name, suite_name) -> description
+        self.suites = {}
+        # (project_name, suite_name, title) -> テストケースのフィールド
+        self.cases = {}
+        # (project_name, case_title, order) -> テストステップのフィールド
+        self.steps = {}
+        # 参照しているプロジェクト名と、その行番号
+        self.project_refs = []
+        # このインポートで新規作成するテストケース。ステップからの参照可否の判定に使う
+        self.new_cases = set()
+        # 作成・更新したテストケース、またはステップを作成・更新したテストケースのID
+        self.indexed_case_ids = set()
+
+    def run(self, rows, start_row=1):
+        """CSVの行(DictReaderの各要素)を解釈し、1トランザクションで反映する。
+        start_rowはエラーメッセージ等に使う先頭行の行番号"""
+        self.parse(rows, start_row)
+        with transaction.atomic():
+            projects = self._import_projects()
+            suites = self._import_suites(projects)
+            self._import_cases(projects, suites)
+            self._import_steps(projects)
+            search.index_cases(self.indexed_case_ids)
+        # bulk_create/bulk_updateではシグナルが送られないため明示的に破棄する
+        project_ids = [project.pk for project in projects.values()]
+        Project.invalidate_summary(*project_ids)
+        Project.invalidate_content(*project_ids)
+        _logger.debug(
+            f"CSVImporter: {len(self.projects)} projects, {len(self.suites)} suites, "
+            f"{len(self.cases)} cases, {len(self.steps)} steps"
+        )
+
+    def parse(self, rows, start_row=1):
+        for row_num, row in enumerate(rows, start_row):
+            try:
+                self._parse_row(row_num, row)
+            except (KeyError, ValueError) as e:
+                raise ValueError(f"Invalid data format: {str(e)}")
+
+    def _parse_row(self, row_num, row):
+        record_type = row["type"]
+
+        if record_type == "project":
+            self._define(self.projects, row["name"], row_num, row["description"])
+
+        elif record_type == "suite":
+            project_name = row["project_name"]
+            if not project_name:
+                raise ValueError("Suite found without project_name")
+            self.project_refs.append((project_name, row_num))
+            self._define(
+                self.suites, (project_name, row["name"]), row_num, row["description"]
+            )
+
+        elif record_type == "case":
+            project_name = row["project_name"]
+            parent_name = row["parent"]  # スイート名
+            if not project_name or not parent_name:
+                raise ValueError("Case found without project_name or parent")
+            self.project_refs.append((project_name, row_num))
+            self._define(
+                self.cases,
+                (project_name, parent_name, row["name"]),
+                row_num,
+                {
+                    "description": row["description"],
+                    "prerequisites": row["prerequisites"] or "",
+                    "status": row["status"] or "DRAFT",
+                    "priority": row["priority"] or "MEDIUM",
+                },
+            )
+
+        elif record_type == "step":
+            project_name = row["project_name"]
+            parent_name = row["parent"]  # テストケースのタイトル
+            if not project_name or not parent_name:
+                raise ValueError(
+                    f"Step found without project_name or parent (row_num: {row_num})"
+                )
+            if not row["order"]:
+                raise ValueError("Step order is required")
+            self.project_refs.append((project_name, row_num))
+            self._define(
+                self.steps,
+                (project_name, parent_name, int(row["order"])),
+                row_num,
+                {
+                    "description": row["description"],
+                    "expected_result": row["expected_result"] or "",
+                },
+            )
+        else:
+            raise ValueError(f"Invalid record_type {record_type}")
+
+    @staticmethod
+    def _define(definitions, key, row_num, value):
+        """定義を記録する。値は後の行で上書きし、行番号は最初に定義された行を保つ"""
+        if key in definitions:
+            definitions[key]["value"] = value
+        else:
+            definitions[key] = {"value": value, "row_num": row_num}
+
+    @staticmethod
+    def _defined_before(definitions, key, row_num):
+        return key in definitions and definitions[key]["row_num"] < row_num
+
+    def _fetch_in(self, queryset, field, values):
+        """IN句の要素数がbatch_sizeを超えないよう分割して取得する"""
+        for chunk in _chunks(values, self.batch_size):
+            yield from queryset.filter(**{f"{field}__in": chunk})
+
+    def _import_projects(self):
+        names = set(self.projects) | {name for name, _ in self.project_refs}
+        existing = {
+            project.name: project
+            for project in self._fetch_in(Project.objects.all(), "name", names)
+        }
+
+        for name, row_num in self.project_refs:
+            if name not in existing and not self._defined_before(
+                self.projects, name, row_num
+            ):
+                raise ValueError(f"Project not found: {name} (row_num: {row_num})")
+
+        self._save(
+            Project,
+            [
+                Project(name=name, description=definition["value"])
+                for name, definition in self.projects.items()
+            ],
+            existing,
+            lambda project: project.name,
+            unique_fields=["name"],
+            update_fields=["description"],
+        )
+        return {
+            project.name: project
+            for project in self._fetch_in(Project.objects.all(), "name", names)
+        }
+
+    def _import_suites(self, projects):
+        suite_names = {suite_name for _, suite_name in self.suites} | {
+            suite_name for _, suite_name, _ in self.cases
+        }
+        project_names = {project.pk: name for name, project in projects.items()}
+        queryset = TestSuite.objects.filter(project__in=projects.values())
+        existing = {
+            (project_names[suite.project_id], suite.name): suite
+            for suite in self._fetch_in(queryset, "name", suite_names)
+        }
+
+        for (project_name, suite_name, _), definition in self.cases.items():
+            key = (project_name, suite_name)
+            if key not in existing and not self._defined_before(
+                self.suites, key, definition["row_num"]
+            ):
+                raise ValueError(
+                    f"Suite not found: {suite_name} (row_num: {definition['row_num']})"
+                )
+
+        self._save(
+            TestSuite,
+            [
+                TestSuite(
+                    project=projects[project_name],
+                    name=suite_name,
+                    description=definition["value"],
+                )
+                for (project_name, suite_name), definition in self.suites.items()
+            ],
+            {(projects[key[0]].pk, key[1]): suite for key, suite in existing.items()},
+            lambda suite: (suite.project_id, suite.name),
+            unique_fields=["project", "name"],
+            update_fields=["description"],
+        )
+        return {
+            (project_names[suite.project_id], suite.name): suite
+            for suite in self._fetch_in(queryset, "name", suite_names)
+        }
+
+    def _import_cases(self, projects, suites):
+        titles = {title for _, _, title in self.cases}
+        queryset = TestCase.objects.filter(
+            suite__project__in={
+                projects[project_name] for project_name, _, _ in self.cases
+            }
+        )
+        existing = {
+            (case.suite_id, case.title): case
+            for case in self._fetch_in(queryset, "title", titles)
+        }
+
+        cases = []
+        for (project_name, suite_name, title), definition in self.cases.items():
+            suite = suites[project_name, suite_name]
+            if (suite.pk, title) not in existing:
+                self.new_cases.add((project_name, suite_name, title))
+            cases.append(TestCase(suite=suite, title=title, **definition["value"]))
+        self._save(
+            TestCase,
+            cases,
+            existing,
+            lambda case: (case.suite_id, case.title),
+            unique_fields=["suite", "title"],
+            update_fields=["description", "prerequisites", "status", "priority"],
+        )
+        if all(case.pk for case in cases):
+            self.indexed_case_ids.update(case.pk for case in cases)
+        else:
+            # bulk_createで主キーが設定されないバックエンドでは引き当て直す
+            self.indexed_case_ids.update(
+                case.pk for case in self._fetch_in(queryset, "title", titles)
+            )
+
+    def _resolve_step_cases(self, projects):
+        """ステップの親となるテストケースを引き当て、ステップのキーからの辞書で返す。
+
+        従来と同様にプロジェクト内のタイトルで検索し、その行の時点で該当する
+        テストケースが存在しないか複数ある場合はエラーとする"""
+        project_names = {project.pk: name for name, project in projects.items()}
+        titles = {title for _, title, _ in self.steps}
+        queryset = TestCase.objects.filter(
+            suite__project__in={
+                projects[project_name] for project_name, _, _ in self.steps
+            }
+        ).select_related("suite")
+        candidates = {}
+        for case in self._fetch_in(queryset, "title", titles):
+            project_name = project_names[case.suite.project_id]
+            candidates.setdefault((project_name, case.title), []).append(case)
+
+        resolved = {}
+        for key, definition in self.steps.items():
+            project_name, title, _ = key
+            row_num = definition["row_num"]
+            matches = [
+                case
+                for case in candidates.get((project_name, title), [])
+                if self._case_exists_at(project_name, case, row_num)
+            ]
+            if not matches:
+                raise ValueError(f"TestCase not found: {title} (row_num: {row_num})")
+            if len(matches) > 1:
+                raise ValueError(
+                    f"Multiple TestCases found: {title} (row_num: {row_num})"
+                )
+            resolved[key] = matches[0]
+        return resolved
+
+    def _case_exists_at(self, project_name, case, row_num):
+        """テストケースが指定した行の時点で存在していたかを返す。
+        このインポートで新規作成されるケースは、その定義行より後の行からのみ参照できる"""
+        key = (project_name, case.suite.name, case.title)
+        if key not in self.new_cases:
+            return True
+        return self.cases[key]["row_num"] < row_num
+
+    def _import_steps(self, projects):
+        if not self.steps:
+            return
+        resolved = self._resolve_step_cases(projects)
+        steps = [
+            TestStep(test_case=resolved[key], order=key[2], **definition["value"])
+            for key, definition in self.steps.items()
+        ]
+        self.indexed_case_ids.update(step.test_case_id for step in steps)
+        existing = {}
+        if not self.supports_upsert:
+            existing = {
+                (step.test_case_id, step.order): step
+                for step in self._fetch_in(
+                    TestStep.objects.all(),
+                    "test_case_id",
+                    {step.test_case_id for step in steps},
+                )
+            }
+        self._save(
+            TestStep,
+            steps,
+            existing,
+            lambda step: (step.test_case_id, step.order),
+            unique_fields=["test_case", "order"],
+            update_fields=["description", "expected_result"],
+        )
+
+    def _save(self, model, objects, existing, key, unique_fields, update_fields):
+        """未保存のインスタンスを一意キーで既存の行と突き合わせて作成・更新する。
+
+        バックエンドがupdate_conflictsに対応していればbulk_createによるUPSERTで
+        まとめて書き込み、そうでなければexisting(一意キー -> 既存のインスタンス)を元に
+        bulk_createとbulk_updateに振り分ける"""
+        update_fields = update_fields + ["updated_at"]
+        if self.supports_upsert:
+            model.objects.bulk_create(
+                objects,
+                batch_size=self.batch_size,
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=update_fields,
+            )
+            return
+
+        now = timezone.now()
+        to_create, to_update = [], []
+        for obj in objects:
+            current = existing.get(key(obj))
+            if current:
+                obj.pk = current.pk
+                obj.created_at = current.created_at
+                # bulk_updateではauto_nowが適用されないため明示的に設定する
+                obj.updated_at = now
+                to_update.append(obj)
+            else:
+                to_create.append(obj)
+        model.objects.bulk_update(to_update, update_fields, batch_size=self.batch_size)
+        model.objects.bulk_create(to_create, batch_size=self.batch_size)
+
+
+def process_import_job(job, chunk_rows=IMPORT_JOB_CHUNK_ROWS):
+    """ImportJobのCSVをchunk_rows行ずつインポートし、チャンクごとにコミットして進捗を記録する。
+
+    前のチャンクの内容はコミット済みのため、後のチャンクからも既存データとして参照できる。
+    途中のチャンクで失敗した場合はそれまでのチャンクの内容は残り、ジョブは失敗として記録される。
+    インポートは同じ内容で再実行しても結果が変わらないため、CSVを修正して再投入すればよい"""
+    job.total_rows = max(
+        sum(1 for _ in csv.reader(io.StringIO(job.content, newline=""))) - 1, 0
+    )
+    job.processed_rows = 0
+    job.heartbeat_at = timezone.now()
+    job.save(update_fields=["total_rows", "processed_rows", "heartbeat_at"])
+
+    reader = csv.DictReader(io.StringIO(job.content, newline=""))
+    try:
+        while True:
+            chunk = list(islice(reader, chunk_rows))
+            if not chunk:
+                break
+            CSVImporter().run(chunk, start_row=job.processed_rows + 1)
+            job.processed_rows += len(chunk)
+            job.heartbeat_at = timezone.now()
+            job.save(update_fields=["processed_rows", "heartbeat_at"])
+    except Exception as e:
+        _logger.exception(f"ImportJob {job.pk} failed")
+        job.status = "FAILED"
+        job.error = str(e)
+    else:
+        job.status = "SUCCEEDED"
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "error", "finished_at"])
+    return job
@@ -1,5 +1,7 @@
+import datetime
 from logging import getLogger
 from django import forms
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.forms import inlineformset_factory
 from .models import Project, TestSuite, TestCase, TestStep, TestSession
@@ -63,6 +65,161 @@ class TestCaseForm(forms.ModelForm):
         fields = ["title", "description", "prerequisites", "status", "priority"]
 
 
+class SearchForm(forms.Form):
+    q = forms.CharField(label="検索語", max_length=200)
+    project = forms.ModelChoiceField(
+        queryset=Project.objects.order_by("name"),
+        required=False,
+        label="プロジェクト",
+        empty_label="すべてのプロジェクト",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+
+
+class ListFilterForm(forms.Form):
+    """一覧画面の絞り込み条件のフォーム。GETのパラメータを受け取り、空の項目は条件にしない"""
+
+    project = forms.ModelChoiceField(
+        queryset=Project.objects.order_by("name"),
+        required=False,
+        label="プロジェクト",
+        empty_label="すべてのプロジェクト",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+
+    def filter_queryset(self, queryset):
+        raise NotImplementedError
+
+    @staticmethod
+    def _date_range(queryset, field, date_from, date_to):
+        # 日付への変換はインデックスを使えないため、日時の範囲で絞り込む
+        if date_from:
+            start = datetime.datetime.combine(date_from, datetime.time.min)
+            queryset = queryset.filter(**{f"{field}__gte": timezone.make_aware(start)})
+        if date_to:
+            end = datetime.datetime.combine(
+                date_to + datetime.timedelta(days=1), datetime.time.min
+            )
+            queryset = queryset.filter(**{f"{field}__lt": timezone.make_aware(end)})
+        return queryset
+
+
+class TestCaseFilterForm(ListFilterForm):
+    __test__ = False
+
+    suite = forms.ModelChoiceField(
+        queryset=TestSuite.objects.none(),
+        required=False,
+        label="テストスイート",
+        empty_label="すべてのテストスイート",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+
+    status = forms.ChoiceField(
+        choices=[("", "すべてのステータス")] + TestCase.STATUS_CHOICES,
+        required=False,
+        label="ステータス",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    priority = forms.ChoiceField(
+        choices=[("", "すべての優先度")] + TestCase.PRIORITY_CHOICES,
+        required=False,
+        label="優先度",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    updated_from = forms.DateField(
+        required=False,
+        label="更新日(から)",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+    updated_to = forms.DateField(
+        required=False,
+        label="更新日(まで)",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # スイートの選択肢は、選択したプロジェクトのものだけにする
+        project_id = self.data.get("project")
+        if project_id and str(project_id).isdigit():
+            self.fields["suite"].queryset = TestSuite.objects.filter(
+                project_id=project_id
+            ).order_by("name")
+        else:
+            self.fields["suite"].disabled = True
+
+    def filter_queryset(self, queryset):
+        data = self.cleaned_data
+        if data["suite"]:
+            queryset = queryset.filter(suite=data["suite"])
+        elif data["project"]:
+            queryset = queryset.filter(suite__project=data["project"])
+        if data["status"]:
+            queryset = queryset.filter(status=data["status"])
+        if data["priority"]:
+            queryset = queryset.filter(priority=data["priority"])
+        return self._date_range(
+            queryset, "updated_at", data["updated_from"], data["updated_to"]
+        )
+
+
+class TestSuiteFilterForm(ListFilterForm):
+    __test__ = False
+
+    updated_from = forms.DateField(
+        required=False,
+        label="更新日(から)",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+    updated_to = forms.DateField(
+        required=False,
+        label="更新日(まで)",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+
+    def filter_queryset(self, queryset):
+        data = self.cleaned_data
+        if data["project"]:
+            queryset = queryset.filter(project=data["project"])
+        return self._date_range(
+            queryset, "updated_at", data["updated_from"], data["updated_to"]
+        )
+
+
+class TestSessionFilterForm(ListFilterForm):
+    __test__ = False
+
+    state = forms.ChoiceField(
+        choices=[("", "すべての状態"), ("running", "実行中"), ("completed", "完了")],
+        required=False,
+        label="状態",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    started_from = forms.DateField(
+        required=False,
+        label="開始日(から)",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+    started_to = forms.DateField(
+        required=False,
+        label="開始日(まで)",
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+
+    def filter_queryset(self, queryset):
+        data = self.cleaned_data
+        if data["project"]:
+            queryset = queryset.filter(project=data["project"])
+        if data["state"]:
+            queryset = queryset.filter(
+                completed_at__isnull=data["state"] == "running"
+            )
+        return self._date_range(
+            queryset, "started_at", data["started_from"], data["started_to"]
+        )
+
+
 class UserEditForm(forms.ModelForm):
     class Meta:
         model = User
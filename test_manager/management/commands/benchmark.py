@@ -0,0 +1,371 @@
+import itertools
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from test_manager.csv_importer import process_import_job
+from test_manager.middleware import _QueryCounter
+from test_manager.models import ImportJob, Project, TestCase, TestSession
+from test_manager.serializers import (
+    TestCaseSerializer,
+    build_case_data,
+    case_value_fields,
+)
+from test_manager.synthetic_data import generate_synthetic_data
+
+User = get_user_model()
+
+SCENARIOS = [
+    "csv_export",
+    "project_csv_export",
+    "csv_import",
+    "session_create",
+    "execute_loop",
+    "execute_page",
+    "project_list",
+    "case_list",
+    "search",
+    "test_session_list",
+    "test_session_detail",
+    "api_project_list",
+    "api_suite_list",
+    "api_test_case",
+    "api_search",
+    "api_remaining_cases",
+    "serialize_cases",
+    "serialize_cases_fast",
+]
+
+
+def _percentile(sorted_values, percent):
+    """ソート済みのリストからnearest-rank法でパーセンタイルを求める"""
+    index = max(0, -(-len(sorted_values) * percent // 100) - 1)
+    return sorted_values[int(index)]
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "合成データを作成し、主要な画面とAPIをテストクライアントで繰り返し呼び出して"
+        "ops/sec、レイテンシ(p50/p95/p99)、ピークメモリをJSONで出力します。"
+        "作成したデータはロールバックされるためDBには残りません"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            type=float,
+            default=1.0,
+            help="プロジェクト数とスイートあたりのケース数に掛ける倍率",
+        )
+        parser.add_argument("--projects", type=int, default=5)
+        parser.add_argument("--suites-per-project", type=int, default=4)
+        parser.add_argument("--cases-per-suite", type=int, default=50)
+        parser.add_argument("--steps-per-case", type=int, default=3)
+        parser.add_argument("--sessions-per-project", type=int, default=5)
+        parser.add_argument(
+            "--iterations", type=int, default=20, help="シナリオごとの計測回数"
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=2, help="計測前に実行する回数"
+        )
+        parser.add_argument(
+            "--scenarios",
+            default=",".join(SCENARIOS),
+            help=f"実行するシナリオのカンマ区切りリスト ({', '.join(SCENARIOS)})",
+        )
+        parser.add_argument(
+            "--output", help="結果のJSONを書き込むファイル。省略時は標準出力"
+        )
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options["scenarios"].split(",")]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be 1 or greater")
+
+        scale = options["scale"]
+        parameters = {
+            "projects": max(1, round(options["projects"] * scale)),
+            "suites_per_project": options["suites_per_project"],
+            "cases_per_suite": max(1, round(options["cases_per_suite"] * scale)),
+            "steps_per_case": options["steps_per_case"],
+            "sessions_per_project": options["sessions_per_project"],
+        }
+
+        # テストクライアントのホスト名を許可する
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            with transaction.atomic():
+                first_ids = self._next_ids()
+                results = self._run(scenarios, parameters, options)
+                last_ids = self._next_ids()
+                transaction.set_rollback(True)
+        # ロールバックしたデータのIDは再利用されるため、キャッシュされた集計値を破棄する
+        Project.invalidate_summary(*range(first_ids[0], last_ids[0]))
+        TestSession.invalidate_summary(*range(first_ids[1], last_ids[1]))
+
+        report = {
+            "revision": _git_revision(),
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "scale": scale,
+            "parameters": parameters,
+            "iterations": options["iterations"],
+            **results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+            self.stderr.write(f"結果を {options['output']} に書き込みました")
+        else:
+            self.stdout.write(output)
+
+    def _next_ids(self):
+        """ProjectとTestSessionの次に振られるIDの下限を返す"""
+        return tuple(
+            (model.objects.aggregate(max_id=Max("pk"))["max_id"] or 0) + 1
+            for model in (Project, TestSession)
+        )
+
+    def _run(self, scenarios, parameters, options):
+        start = time.perf_counter()
+        data = generate_synthetic_data(
+            prefix=f"benchmark-{uuid.uuid4().hex[:8]}-", **parameters
+        )
+        seed_seconds = time.perf_counter() - start
+
+        user = User.objects.create_superuser(
+            username=f"benchmark-{uuid.uuid4().hex[:8]}", password=None
+        )
+        data["token"] = Token.objects.create(user=user)
+        data["client"] = Client()
+        data["client"].force_login(user)
+
+        results = {}
+        for name in scenarios:
+            self.stderr.write(f"{name} を計測しています")
+            operation = getattr(self, f"_scenario_{name}")(data)
+            results[name] = self._measure(
+                name, operation, options["warmup"], options["iterations"]
+            )
+        return {
+            "seed_seconds": round(seed_seconds, 3),
+            "data": {
+                "projects": len(data["projects"]),
+                "suites": len(data["suites"]),
+                "cases": len(data["cases"]),
+                "sessions": len(data["sessions"]),
+            },
+            "scenarios": results,
+        }
+
+    def _measure(self, name, operation, warmup, iterations):
+        for _ in range(warmup):
+            self._check(name, operation())
+
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = operation()
+            latencies.append(time.perf_counter() - start)
+            self._check(name, response)
+
+        # tracemallocは処理を遅くするため、レイテンシとは別に1回だけ実行して計測する
+        counter = _QueryCounter()
+        tracemalloc.start()
+        try:
+            with connection.execute_wrapper(counter):
+                self._check(name, operation())
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            "ops_per_sec": round(len(latencies) / sum(latencies), 2),
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+            "peak_memory_kb": round(peak / 1024, 1),
+            "queries": counter.count,
+        }
+
+    def _check(self, name, response):
+        # シリアライズのみのシナリオはレスポンスを返さない
+        if response is not None and response.status_code >= 400:
+            raise CommandError(f"{name}: unexpected status {response.status_code}")
+
+    def _get(self, data, url, params=None):
+        response = data["client"].get(url, params)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response
+
+    def _api_headers(self, data):
+        return {"HTTP_AUTHORIZATION": f"Token {data['token'].key}"}
+
+    # 各シナリオは準備を行い、1回分の処理を行う関数を返す
+
+    def _scenario_csv_export(self, data):
+        return lambda: self._get(data, reverse("csv_export"))
+
+    def _scenario_project_csv_export(self, data):
+        url = reverse("project_csv_export", args=[data["projects"][0].pk])
+        return lambda: self._get(data, url)
+
+    def _scenario_csv_import(self, data):
+        # エクスポートしたCSVを取り込み直し、ワーカーの処理までを1回とする
+        project = data["projects"][0]
+        response = data["client"].get(reverse("project_csv_export", args=[project.pk]))
+        content = b"".join(response.streaming_content)
+        url = reverse("csv_import")
+
+        def operation():
+            upload = SimpleUploadedFile("benchmark.csv", content)
+            response = data["client"].post(url, {"file": upload})
+            if response.status_code != 302:
+                return response
+            job_id = parse_qs(urlparse(response.url).query)["job"][0]
+            job = ImportJob.objects.get(pk=job_id)
+            process_import_job(job)
+            if job.status != "SUCCEEDED":
+                raise CommandError(f"csv_import: {job.error}")
+            return response
+
+        return operation
+
+    def _scenario_session_create(self, data):
+        project = data["projects"][0]
+        url = reverse("test_session_create", args=[project.pk])
+        selected_cases = [
+            case.pk for case in data["cases"] if case.suite.project_id == project.pk
+        ]
+        counter = itertools.count()
+        return lambda: data["client"].post(
+            url,
+            {"name": f"benchmark {next(counter)}", "selected_cases": selected_cases},
+        )
+
+    def _scenario_execute_loop(self, data):
+        # 新しいセッションのケースを先頭から順に実行していく
+        project = data["projects"][0]
+        test_session = TestSession.objects.create(project=project, name="benchmark")
+        test_session.initialize_executions(
+            [case for case in data["cases"] if case.suite.project_id == project.pk]
+        )
+        case_ids = itertools.cycle(
+            test_session.executions.values_list("test_case_id", flat=True)
+        )
+        url = reverse("execute-test-case", args=[test_session.pk])
+        return lambda: data["client"].post(
+            url,
+            {"test_case_id": next(case_ids), "status": "PASS"},
+            content_type="application/json",
+            **self._api_headers(data),
+        )
+
+    def _scenario_execute_page(self, data):
+        url = reverse("test_session_execute", args=[data["sessions"][0].pk])
+        return lambda: self._get(data, url)
+
+    def _scenario_project_list(self, data):
+        return lambda: self._get(data, reverse("project_list"))
+
+    def _scenario_case_list(self, data):
+        return lambda: self._get(data, reverse("case_list"))
+
+    def _scenario_search(self, data):
+        # 索引を引ける語(3文字以上)と、LIKEで絞り込む短い語を組み合わせる
+        return lambda: self._get(data, reverse("search"), {"q": "ケース1 手順"})
+
+    def _scenario_test_session_list(self, data):
+        return lambda: self._get(data, reverse("test_session_list"))
+
+    def _scenario_test_session_detail(self, data):
+        url = reverse("test_session_detail", args=[data["sessions"][0].pk])
+        return lambda: self._get(data, url)
+
+    def _scenario_api_project_list(self, data):
+        url = reverse("project-list")
+        return lambda: data["client"].get(url, **self._api_headers(data))
+
+    def _scenario_api_suite_list(self, data):
+        url = reverse("project-test-suite-list", args=[data["projects"][0].pk])
+        return lambda: data["client"].get(
+            url, {"include_cases": "true"}, **self._api_headers(data)
+        )
+
+    def _scenario_api_test_case(self, data):
+        url = reverse("testcase-detail", args=[data["cases"][0].pk])
+        return lambda: data["client"].get(url, **self._api_headers(data))
+
+    def _scenario_api_search(self, data):
+        url = reverse("testcase-search")
+        return lambda: data["client"].get(
+            url, {"q": "ケース1 手順"}, **self._api_headers(data)
+        )
+
+    def _scenario_api_remaining_cases(self, data):
+        # 全てのテストケースを含むセッションの未実行のテストケースを、ステップと共に返す
+        test_session = TestSession.objects.create(
+            project=data["projects"][0], name="benchmark"
+        )
+        test_session.initialize_executions(data["cases"])
+        url = reverse("execute-test-case", args=[test_session.pk])
+        return lambda: data["client"].get(url, **self._api_headers(data))
+
+    # 全てのテストケースをステップと共にシリアライズする。
+    # ModelSerializerと、.values()から組み立てる読み取り専用APIの処理とを比較する
+
+    def _scenario_serialize_cases(self, data):
+        cases = TestCase.objects.filter(suite__project__in=data["projects"])
+
+        def operation():
+            TestCaseSerializer(
+                cases.order_by("pk").prefetch_related("steps"), many=True
+            ).data
+
+        return operation
+
+    def _scenario_serialize_cases_fast(self, data):
+        cases = TestCase.objects.filter(suite__project__in=data["projects"])
+
+        def operation():
+            build_case_data(cases.order_by("pk").values(*case_value_fields()))
+
+        return operation
@@ -0,0 +1,73 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from test_manager.models import Project, TestSuite, TestCase, TestSession, TestExecution
+
+
+class Command(BaseCommand):
+    help = (
+        "TestSession.initialize_executionsの処理時間をテストケース数ごとに計測します。"
+        "計測用のデータはロールバックされるためDBには残りません"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="100,1000,10000,50000",
+            help="計測するテストケース数のカンマ区切りリスト",
+        )
+        parser.add_argument(
+            "--compare-legacy",
+            action="store_true",
+            help="1件ずつget_or_createする従来の方法も計測する",
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        self.stdout.write(f"{'cases':>8} {'bulk (s)':>10} {'legacy (s)':>11}")
+        for size in sizes:
+            bulk_elapsed, legacy_elapsed = self._measure(
+                size, options["compare_legacy"]
+            )
+            legacy = (
+                f"{legacy_elapsed:11.3f}"
+                if legacy_elapsed is not None
+                else "          -"
+            )
+            self.stdout.write(f"{size:>8} {bulk_elapsed:10.3f} {legacy}")
+
+    def _measure(self, size, compare_legacy):
+        legacy_elapsed = None
+        with transaction.atomic():
+            project = Project.objects.create(name=f"benchmark-{uuid.uuid4()}")
+            suite = TestSuite.objects.create(project=project, name="benchmark")
+            TestCase.objects.bulk_create(
+                [
+                    TestCase(suite=suite, title=f"case {i}", description="")
+                    for i in range(size)
+                ],
+                batch_size=1000,
+            )
+            test_cases = TestCase.objects.filter(suite=suite)
+
+            test_session = TestSession.objects.create(project=project, name="bulk")
+            start = time.perf_counter()
+            test_session.initialize_executions(test_cases)
+            bulk_elapsed = time.perf_counter() - start
+
+            if compare_legacy:
+                test_session = TestSession.objects.create(
+                    project=project, name="legacy"
+                )
+                start = time.perf_counter()
+                for test_case in test_cases:
+                    TestExecution.objects.get_or_create(
+                        test_session=test_session, test_case=test_case
+                    )
+                legacy_elapsed = time.perf_counter() - start
+
+            transaction.set_rollback(True)
+        return bulk_elapsed, legacy_elapsed
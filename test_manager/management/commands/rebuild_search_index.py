@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from test_manager import search
+
+
+class Command(BaseCommand):
+    help = "テストケースとテストステップの全文検索インデックスを作り直します"
+
+    def handle(self, *args, **options):
+        if not search.uses_fts():
+            self.stdout.write(
+                "このデータベースでは全文検索のインデックスを使わないため、何もしません"
+            )
+            return
+        with transaction.atomic():
+            count = search.rebuild_index()
+        self.stdout.write(
+            self.style.SUCCESS(f"{count}件のテストケースのインデックスを作り直しました")
+        )
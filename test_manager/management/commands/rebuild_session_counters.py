@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from test_manager.models import TestSession, TestExecution
+
+
+class Command(BaseCommand):
+    help = "TestSessionのステータス別カウンタをTestExecutionから再構築します"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "session_ids",
+            nargs="*",
+            type=int,
+            help="対象のTestSession ID。省略した場合は全てのTestSession",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="一度に更新するTestSessionの件数",
+        )
+
+    def handle(self, *args, **options):
+        sessions = TestSession.objects.order_by("pk")
+        executions = TestExecution.objects.all()
+        if options["session_ids"]:
+            sessions = sessions.filter(pk__in=options["session_ids"])
+            executions = executions.filter(test_session_id__in=options["session_ids"])
+
+        # 全セッション分の件数を1回のGROUP BYで取得する
+        counts = executions.status_stats(group_by="session")
+
+        updated = []
+        with transaction.atomic():
+            for test_session in sessions.only("pk", *TestSession.COUNTER_FIELDS):
+                session_counts = counts.get(test_session.pk, {})
+                for field in TestSession.COUNTER_FIELDS:
+                    setattr(test_session, field, session_counts.get(field, 0))
+                updated.append(test_session)
+            TestSession.objects.bulk_update(
+                updated, TestSession.COUNTER_FIELDS, batch_size=options["batch_size"]
+            )
+            TestSession.invalidate_summary(
+                *(test_session.pk for test_session in updated)
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(updated)}件のテストセッションのカウンタを再構築しました"
+            )
+        )
@@ -0,0 +1,63 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from test_manager.csv_importer import process_import_job
+from test_manager.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = "待機中のCSVインポートジョブ(ImportJob)を順に処理するワーカーを起動します"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="待機中のジョブを全て処理したら終了する",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="待機中のジョブがない場合に次に確認するまでの秒数",
+        )
+        parser.add_argument(
+            "--stale-timeout",
+            type=float,
+            default=ImportJob.STALE_TIMEOUT.total_seconds(),
+            help="進捗の更新がこの秒数より古い実行中のジョブを、停止したワーカーのものとして再実行する",
+        )
+
+    def handle(self, *args, **options):
+        if settings.CACHE_BACKEND == "locmem":
+            # インポート後のキャッシュの削除がWebサーバのプロセスに反映されない
+            self.stderr.write(
+                self.style.WARNING(
+                    "CACHE_BACKEND=locmem ではWebサーバとキャッシュを共有できないため、"
+                    "インポート結果が画面に反映されるまで時間がかかります。"
+                    "file か db を指定してください"
+                )
+            )
+        stale_timeout = datetime.timedelta(seconds=options["stale_timeout"])
+        while True:
+            job = ImportJob.claim_next(stale_timeout)
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["poll_interval"])
+                continue
+
+            self.stdout.write(f"ImportJob {job.pk} ({job.file_name}) を開始します")
+            process_import_job(job)
+            if job.status == "SUCCEEDED":
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"ImportJob {job.pk}: {job.processed_rows}行をインポートしました"
+                    )
+                )
+            else:
+                self.stdout.write(
+                    self.style.ERROR(f"ImportJob {job.pk} が失敗しました: {job.error}")
+                )
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+class RequestMetricsStore:
+    """URL名ごとに直近のリクエストの計測値を保持し、集計する。
+    値はプロセス内にのみ保持されるため、複数プロセスで動かす場合はプロセスごとの集計となる"""
+
+    def __init__(self, max_samples=200):
+        self.max_samples = max_samples
+        self._samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._lock = threading.Lock()
+
+    def add(self, url_name, metrics):
+        with self._lock:
+            self._samples[url_name].append(metrics)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self):
+        """URL名ごとの件数・平均・最大値を、合計時間の大きい順に返す"""
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items()}
+
+        rows = []
+        for url_name, values in samples.items():
+            count = len(values)
+            totals = sorted(v["total_ms"] for v in values)
+            rows.append(
+                {
+                    "url_name": url_name,
+                    "count": count,
+                    "avg_total_ms": sum(totals) / count,
+                    "p95_total_ms": totals[min(count - 1, int(count * 0.95))],
+                    "max_total_ms": totals[-1],
+                    "avg_queries": sum(v["queries"] for v in values) / count,
+                    "max_queries": max(v["queries"] for v in values),
+                    "avg_db_ms": sum(v["db_ms"] for v in values) / count,
+                    "avg_render_ms": sum(v["render_ms"] for v in values) / count,
+                    "avg_size": sum(v["size"] for v in values) / count,
+                }
+            )
+        rows.sort(key=lambda row: row["avg_total_ms"] * row["count"], reverse=True)
+        return rows
+
+
+request_metrics = RequestMetricsStore()
+
+
+class _QueryCounter:
+    """connection.execute_wrapper()に渡して、クエリ数とDBでの処理時間を数える"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class RequestMetricsMiddleware:
+    """リクエストごとのクエリ数、DB時間、テンプレートのレンダリング時間、
+    レスポンスサイズを計測し、Server-Timingヘッダとrequest_metricsに記録する。
+
+    settings.REQUEST_METRICS_ENABLEDがTrueの場合のみ有効となる。
+    レンダリング時間はTemplateResponseを返すビューのみが対象で、
+    render()で描画するビューではビューの処理時間に含まれる"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, "REQUEST_METRICS_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = _QueryCounter()
+        request._metrics_render = [None, None]
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        render_start, render_end = request._metrics_render
+        render = render_end - render_start if render_end is not None else 0.0
+        size = 0 if response.streaming else len(response.content)
+        metrics = {
+            "total_ms": total * 1000,
+            "queries": counter.count,
+            "db_ms": counter.duration * 1000,
+            "render_ms": render * 1000,
+            "size": size,
+        }
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={metrics["db_ms"]:.1f};desc="{counter.count} queries"',
+                f"render;dur={metrics['render_ms']:.1f}",
+                f"total;dur={metrics['total_ms']:.1f}",
+            ]
+        )
+
+        match = request.resolver_match
+        url_name = match.view_name if match else "(unresolved)"
+        request_metrics.add(url_name, metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        request._metrics_render[0] = time.perf_counter()
+
+        def finished(response):
+            request._metrics_render[1] = time.perf_counter()
+
+        response.add_post_render_callback(finished)
+        return response
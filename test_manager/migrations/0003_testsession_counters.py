@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:42
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    TestSession = apps.get_model("test_manager", "TestSession")
+    TestExecution = apps.get_model("test_manager", "TestExecution")
+    counts = {}
+    for row in TestExecution.objects.values("test_session_id", "status").annotate(
+        n=Count("id")
+    ):
+        counts.setdefault(row["test_session_id"], {})[
+            f"{row['status'].lower()}_count"
+        ] = row["n"]
+    for session_id, session_counts in counts.items():
+        TestSession.objects.filter(pk=session_id).update(**session_counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0002_remove_testsession_available_suites"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testsession",
+            name="blocked_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="testsession",
+            name="fail_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="testsession",
+            name="not_tested_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="testsession",
+            name="pass_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="testsession",
+            name="skipped_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
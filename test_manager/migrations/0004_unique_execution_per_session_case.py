@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:45
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_executions(apps, schema_editor):
+    """一意制約を追加する前に、同じセッション・テストケースの重複したTestExecutionを
+    最も古いもの1件だけ残して削除し、影響したセッションのカウンタを数え直す"""
+    TestSession = apps.get_model("test_manager", "TestSession")
+    TestExecution = apps.get_model("test_manager", "TestExecution")
+    duplicates = (
+        TestExecution.objects.values("test_session_id", "test_case_id")
+        .annotate(n=Count("id"), first_id=Min("id"))
+        .filter(n__gt=1)
+    )
+    session_ids = set()
+    for row in duplicates:
+        TestExecution.objects.filter(
+            test_session_id=row["test_session_id"], test_case_id=row["test_case_id"]
+        ).exclude(pk=row["first_id"]).delete()
+        session_ids.add(row["test_session_id"])
+
+    for session_id in session_ids:
+        counts = {
+            "not_tested_count": 0,
+            "pass_count": 0,
+            "fail_count": 0,
+            "blocked_count": 0,
+            "skipped_count": 0,
+        }
+        for row in (
+            TestExecution.objects.filter(test_session_id=session_id)
+            .values("status")
+            .annotate(n=Count("id"))
+        ):
+            counts[f"{row['status'].lower()}_count"] = row["n"]
+        TestSession.objects.filter(pk=session_id).update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0003_testsession_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_executions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="testexecution",
+            constraint=models.UniqueConstraint(
+                fields=("test_session", "test_case"),
+                name="unique_execution_per_session_case",
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0004_unique_execution_per_session_case"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("file_name", models.CharField(max_length=255)),
+                ("content", models.TextField(help_text="デコード済みのCSVの内容")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "待機中"),
+                            ("RUNNING", "実行中"),
+                            ("SUCCEEDED", "完了"),
+                            ("FAILED", "失敗"),
+                        ],
+                        default="PENDING",
+                        max_length=10,
+                    ),
+                ),
+                ("total_rows", models.IntegerField(default=0)),
+                ("processed_rows", models.IntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+                ("created_by", models.CharField(blank=True, max_length=150)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "created_at"],
+                        name="test_manage_status_7a0569_idx",
+                    )
+                ],
+            },
+        ),
+    ]
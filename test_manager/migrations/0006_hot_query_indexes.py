@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0005_importjob"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="testexecution",
+            index=models.Index(
+                fields=["test_session", "status"], name="execution_session_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="testexecution",
+            index=models.Index(
+                fields=["test_case", "-executed_at"], name="execution_case_executed_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="testsession",
+            index=models.Index(fields=["-started_at"], name="session_started_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="testsession",
+            index=models.Index(
+                fields=["project", "-started_at"], name="session_project_started_idx"
+            ),
+        ),
+    ]
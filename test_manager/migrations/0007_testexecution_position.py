@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+def populate_positions(apps, schema_editor):
+    """既存のTestExecutionに、セッションごとに作成順(pk順)でpositionを振る"""
+    TestExecution = apps.get_model("test_manager", "TestExecution")
+    session_ids = (
+        TestExecution.objects.order_by()
+        .values_list("test_session_id", flat=True)
+        .distinct()
+    )
+    for session_id in session_ids:
+        executions = list(
+            TestExecution.objects.filter(test_session_id=session_id)
+            .only("pk")
+            .order_by("pk")
+        )
+        for position, execution in enumerate(executions, start=1):
+            execution.position = position
+        TestExecution.objects.bulk_update(executions, ["position"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0006_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="testexecution",
+            options={"ordering": ["test_session", "position"]},
+        ),
+        migrations.RemoveIndex(
+            model_name="testexecution",
+            name="execution_session_status_idx",
+        ),
+        migrations.AddField(
+            model_name="testexecution",
+            name="position",
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_positions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="testexecution",
+            index=models.Index(
+                fields=["test_session", "status", "position"],
+                name="execution_session_status_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="testexecution",
+            constraint=models.UniqueConstraint(
+                fields=("test_session", "position"),
+                name="unique_execution_position_per_session",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0007_testexecution_position"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testexecution",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="testexecution",
+            index=models.Index(
+                fields=["test_session", "updated_at"],
+                name="execution_session_updated_idx",
+            ),
+        ),
+    ]
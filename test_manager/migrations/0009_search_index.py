@@ -0,0 +1,48 @@
+from django.db import migrations
+
+SEARCH_INDEX_TABLE = "test_manager_search_index"
+
+
+def _uses_fts(schema_editor):
+    # trigramトークナイザはSQLite 3.34以降で使える
+    connection = schema_editor.connection
+    return (
+        connection.vendor == "sqlite"
+        and connection.Database.sqlite_version_info >= (3, 34, 0)
+    )
+
+
+def create_search_index(apps, schema_editor):
+    """テストケースごとに1行の全文検索インデックスを作成し、既存のデータを登録する"""
+    if not _uses_fts(schema_editor):
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {SEARCH_INDEX_TABLE} USING fts5("
+        "title, description, prerequisites, steps, tokenize = 'trigram')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {SEARCH_INDEX_TABLE} "
+        "(rowid, title, description, prerequisites, steps) "
+        "SELECT c.id, c.title, c.description, c.prerequisites, "
+        "COALESCE((SELECT group_concat(text, char(10)) FROM ("
+        "SELECT s.description || char(10) || s.expected_result AS text "
+        'FROM test_manager_teststep s WHERE s.test_case_id = c.id ORDER BY s."order"'
+        ")), '') FROM test_manager_testcase c"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if not _uses_fts(schema_editor):
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_INDEX_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0008_testexecution_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0009_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="testcase",
+            index=models.Index(fields=["updated_at", "id"], name="case_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="testcase",
+            index=models.Index(fields=["created_at", "id"], name="case_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="testcase",
+            index=models.Index(fields=["title", "id"], name="case_title_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="testsuite",
+            index=models.Index(fields=["name", "id"], name="suite_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="testsuite",
+            index=models.Index(fields=["updated_at", "id"], name="suite_updated_idx"),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:26
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_heartbeat(apps, schema_editor):
+    # 実行中のジョブは開始日時から停止したかを判定できるようにする
+    ImportJob = apps.get_model("test_manager", "ImportJob")
+    ImportJob.objects.filter(status="RUNNING").update(
+        heartbeat_at=F("started_at"), attempts=1
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0010_list_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="attempts",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="heartbeat_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_heartbeat, migrations.RunPython.noop),
+    ]
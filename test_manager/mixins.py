@@ -1,7 +1,206 @@
+import base64
+import binascii
+import json
+
 from django.contrib.auth.mixins import UserPassesTestMixin
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import (
+    ImproperlyConfigured,
+    PermissionDenied,
+    ValidationError,
+)
+from django.db.models import Q
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from .models import Project
+from .models import Project, FRAGMENT_CACHE_TIMEOUT
+
+
+def permission_key(user):
+    """表示を左右するユーザーの権限の組み合わせを表す文字列。
+    同じ権限を持つユーザー間でフラグメントキャッシュを共有するために使う"""
+    if user.is_superuser:
+        return "superuser"
+    perms = sorted(
+        perm for perm in user.get_all_permissions() if perm.startswith("test_manager.")
+    )
+    return ",".join(perms) or "none"
+
+
+class FragmentCacheMixin:
+    """詳細画面のフラグメントキャッシュのキーに使う値をコンテキストに追加する。
+
+    テンプレートでは {% cache fragment_cache_timeout <名前> <オブジェクトのpk> fragment_cache_key %}
+    のように使い、プロジェクト配下の内容のバージョンとユーザーの権限ごとにキャッシュする。
+    サブクラスでは表示するオブジェクトのプロジェクトのpkを返す
+    get_fragment_cache_project_id()を必ず定義する"""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not callable(getattr(cls, "get_fragment_cache_project_id", None)):
+            raise ImproperlyConfigured(
+                f"{cls.__name__} must define get_fragment_cache_project_id()"
+            )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        version = Project.content_version(self.get_fragment_cache_project_id())
+        context["fragment_cache_timeout"] = FRAGMENT_CACHE_TIMEOUT
+        context["fragment_cache_key"] = f"{version}:{permission_key(self.request.user)}"
+        return context
+
+
+class ListFilterMixin:
+    """一覧画面の絞り込み。filter_form_classのフォームにGETのパラメータを渡し、
+    入力が正しければフォームのfilter_queryset()で絞り込む。正しくなければ何も表示しない"""
+
+    filter_form_class = None
+
+    def get_filter_form(self):
+        if not hasattr(self, "filter_form"):
+            self.filter_form = self.filter_form_class(self.request.GET)
+        return self.filter_form
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        form = self.get_filter_form()
+        if not form.is_valid():
+            return queryset.none()
+        return form.filter_queryset(queryset)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["filter_form"] = self.get_filter_form()
+        return context
+
+
+def _encode_cursor(values):
+    data = json.dumps(values, default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def _model_field(model, name):
+    return model._meta.pk if name == "pk" else model._meta.get_field(name)
+
+
+def _decode_cursor(cursor, model, fields):
+    """カーソルを並び順のフィールドの値のリストに戻す。不正な場合は404とする"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [
+            _model_field(model, field.lstrip("-")).to_python(value)
+            for field, value in zip(fields, values)
+        ]
+    except (binascii.Error, UnicodeDecodeError, ValueError, ValidationError):
+        raise Http404("Invalid cursor")
+
+
+def keyset_after(fields, values):
+    """fieldsの並び順でvaluesの行より後にある行を表すQ"""
+    condition = Q()
+    equal = {}
+    for field, value in zip(fields, values):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        condition |= Q(**equal, **{f"{name}__{lookup}": value})
+        equal[name] = value
+    # 先頭のフィールドの範囲も条件に加え、インデックスの範囲検索で読み始められるようにする
+    first = fields[0].lstrip("-")
+    lookup = "lte" if fields[0].startswith("-") else "gte"
+    return Q(**{f"{first}__{lookup}": values[0]}) & condition
+
+
+def _reverse(fields):
+    return [field[1:] if field.startswith("-") else f"-{field}" for field in fields]
+
+
+class KeysetPage:
+    """キーセットページネーションの1ページ分。
+    前後のページへのリンクはnext_query・previous_queryのクエリ文字列で指定する"""
+
+    def __init__(self, object_list, has_next, has_previous, next_query, previous_query):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_query = next_query
+        self.previous_query = previous_query
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginationMixin:
+    """ListViewで、直前のページの最後の行の並び順の値(カーソル)より後の行を取得して
+    ページ送りする。OFFSETを使わないため、後ろのページでも先頭と同じ時間で表示できる。
+
+    sort_ordersには{名前: (表示名, 並び順のフィールド)}を指定し、並び順の最後は
+    一意なフィールド(pk)にする。並び順はインデックスのある列にすること。
+    ?sort=で並び順を、?after=・?before=でカーソルを指定する"""
+
+    paginate_by = 50
+    sort_orders = {}
+
+    def get_sort(self):
+        sort = self.request.GET.get("sort")
+        return sort if sort in self.sort_orders else next(iter(self.sort_orders))
+
+    def get_ordering(self):
+        return list(self.sort_orders[self.get_sort()][1])
+
+    def paginate_queryset(self, queryset, page_size):
+        fields = self.get_ordering()
+        after = self.request.GET.get("after")
+        before = self.request.GET.get("before")
+        if before:
+            # 逆順に取得してから並べ直す
+            values = _decode_cursor(before, queryset.model, fields)
+            rows = list(
+                queryset.filter(keyset_after(_reverse(fields), values)).order_by(
+                    *_reverse(fields)
+                )[: page_size + 1]
+            )
+            has_previous, has_next = len(rows) > page_size, True
+            rows = rows[:page_size][::-1]
+        else:
+            if after:
+                values = _decode_cursor(after, queryset.model, fields)
+                queryset = queryset.filter(keyset_after(fields, values))
+            rows = list(queryset.order_by(*fields)[: page_size + 1])
+            has_next, has_previous = len(rows) > page_size, bool(after)
+            rows = rows[:page_size]
+
+        page = KeysetPage(
+            rows,
+            has_next,
+            has_previous,
+            self._cursor_query("after", rows[-1], fields) if rows else "",
+            self._cursor_query("before", rows[0], fields) if rows else "",
+        )
+        return None, page, rows, page.has_other_pages()
+
+    def _cursor_query(self, name, row, fields):
+        params = self.request.GET.copy()
+        params.pop("after", None)
+        params.pop("before", None)
+        params[name] = _encode_cursor(
+            [getattr(row, field.lstrip("-")) for field in fields]
+        )
+        return params.urlencode()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["sort"] = self.get_sort()
+        context["sort_orders"] = [
+            (name, label) for name, (label, _) in self.sort_orders.items()
+        ]
+        return context
 
 
 class ProjectPermissionMixin(UserPassesTestMixin):
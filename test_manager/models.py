@@ -1,6 +1,25 @@
-from django.db import models
+import datetime
+import uuid
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
 from django.utils import timezone
 
+# プロジェクト一覧に表示する集計値をキャッシュする秒数。
+# 変更時にはシグナル等で無効化するが、一括更新で漏れた場合もこの時間で更新される
+SUMMARY_CACHE_TIMEOUT = 300
+
+# 詳細画面のフラグメントキャッシュの秒数
+FRAGMENT_CACHE_TIMEOUT = 600
+
+
+def _invalidate_cache(keys):
+    """キャッシュを破棄する。コミット前に別のリクエストが古い値を
+    キャッシュし直す場合があるため、コミット後にも再度破棄する"""
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
 
 class Project(models.Model):
     name = models.CharField(max_length=200, unique=True)
@@ -22,6 +41,65 @@ class Project(models.Model):
         """プロジェクト内の全テストケース数を返す"""
         return TestCase.objects.filter(suite__project=self).count()
 
+    @staticmethod
+    def _summary_key(pk):
+        return f"project_summary:{pk}"
+
+    @classmethod
+    def summaries(cls, pks):
+        """プロジェクトごとのスイート数、ケース数、最新のTestSessionのIDを返す。
+
+        キャッシュにないプロジェクトの分は1回の集計クエリでまとめて取得してキャッシュする"""
+        keys = {cls._summary_key(pk): pk for pk in pks}
+        cached = cache.get_many(keys)
+        summaries = {keys[key]: summary for key, summary in cached.items()}
+
+        missing = [pk for pk in pks if pk not in summaries]
+        if missing:
+            latest_session = (
+                TestSession.objects.filter(project=OuterRef("pk"))
+                .order_by("-started_at", "-pk")
+                .values("pk")[:1]
+            )
+            rows = (
+                cls.objects.filter(pk__in=missing)
+                .values("pk")
+                .annotate(
+                    suite_count=Count("test_suites", distinct=True),
+                    case_count=Count("test_suites__test_cases"),
+                    latest_session_id=Subquery(latest_session),
+                )
+            )
+            fetched = {row.pop("pk"): row for row in rows}
+            cache.set_many(
+                {cls._summary_key(pk): summary for pk, summary in fetched.items()},
+                SUMMARY_CACHE_TIMEOUT,
+            )
+            summaries.update(fetched)
+        return summaries
+
+    @classmethod
+    def invalidate_summary(cls, *pks):
+        """スイート・ケース・セッションの増減時に集計値のキャッシュを破棄する"""
+        _invalidate_cache([cls._summary_key(pk) for pk in pks])
+
+    @staticmethod
+    def _content_version_key(pk):
+        return f"project_content_version:{pk}"
+
+    @classmethod
+    def content_version(cls, pk):
+        """プロジェクト配下のスイート・ケース・ステップの内容のバージョン。
+        フラグメントキャッシュのキーに含め、内容が変わったら別のキーとなるようにする"""
+        return cache.get_or_set(
+            cls._content_version_key(pk), lambda: uuid.uuid4().hex, FRAGMENT_CACHE_TIMEOUT
+        )
+
+    @classmethod
+    def invalidate_content(cls, *pks):
+        """スイート・ケース・ステップの変更時にバージョンを破棄し、フラグメントキャッシュを無効にする"""
+        _invalidate_cache([cls._content_version_key(pk) for pk in pks])
+
 
 class TestSuite(models.Model):
     project = models.ForeignKey(
@@ -34,6 +112,11 @@ class TestSuite(models.Model):
 
     class Meta:
         unique_together = ["project", "name"]
+        indexes = [
+            # スイート一覧の並び順
+            models.Index(fields=["name", "id"], name="suite_name_idx"),
+            models.Index(fields=["updated_at", "id"], name="suite_updated_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -69,6 +152,12 @@ class TestCase(models.Model):
 
     class Meta:
         unique_together = ["suite", "title"]
+        indexes = [
+            # テストケース一覧の並び順
+            models.Index(fields=["updated_at", "id"], name="case_updated_idx"),
+            models.Index(fields=["created_at", "id"], name="case_created_idx"),
+            models.Index(fields=["title", "id"], name="case_title_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -110,40 +199,199 @@ class TestSession(models.Model):
     started_at = models.DateTimeField(default=timezone.now)
     # 完了した時刻。完了フラグの意味も兼ねる
     completed_at = models.DateTimeField(null=True, blank=True)
+    # TestExecution.statusごとの件数。
+    # 一覧・詳細画面で都度COUNTしないよう、TestExecutionの更新と同じトランザクション内で更新する
+    not_tested_count = models.IntegerField(default=0, editable=False)
+    pass_count = models.IntegerField(default=0, editable=False)
+    fail_count = models.IntegerField(default=0, editable=False)
+    blocked_count = models.IntegerField(default=0, editable=False)
+    skipped_count = models.IntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # 全体・プロジェクトごとのセッション一覧（新しい順）
+            models.Index(fields=["-started_at"], name="session_started_idx"),
+            models.Index(
+                fields=["project", "-started_at"], name="session_project_started_idx"
+            ),
+        ]
+
+    COUNTER_FIELDS = [
+        "not_tested_count",
+        "pass_count",
+        "fail_count",
+        "blocked_count",
+        "skipped_count",
+    ]
 
     def __str__(self):
         return f"{self.project.name} - {self.name} (started_at: {self.started_at.strftime('%Y-%m-%d %H:%M')})"
 
+    @staticmethod
+    def counter_field(status):
+        """TestExecution.statusに対応するカウンタのフィールド名を返す"""
+        return f"{status.lower()}_count"
+
+    @classmethod
+    def shift_counters(cls, pk, from_status, to_status, count=1):
+        """TestExecutionのstatus変更をカウンタに反映する。
+        作成時はfrom_statusを、削除時はto_statusをNoneとする"""
+        if not count or from_status == to_status:
+            return
+        deltas = {}
+        if from_status:
+            deltas[from_status] = -count
+        if to_status:
+            deltas[to_status] = count
+        cls.add_to_counters(pk, deltas)
+
+    @classmethod
+    def add_to_counters(cls, pk, deltas):
+        """statusごとの増減をまとめて1回のUPDATEでカウンタに反映する"""
+        changes = {
+            cls.counter_field(status): F(cls.counter_field(status)) + delta
+            for status, delta in deltas.items()
+            if delta
+        }
+        if changes:
+            cls.objects.filter(pk=pk).update(**changes)
+            cls.invalidate_summary(pk)
+
+    def refresh_counters(self):
+        """TestExecutionを数え直してカウンタを再構築する"""
+        stats = self.executions.status_stats()
+        counts = {field: stats[field] for field in self.COUNTER_FIELDS}
+        TestSession.objects.filter(pk=self.pk).update(**counts)
+        TestSession.invalidate_summary(self.pk)
+        for field, value in counts.items():
+            setattr(self, field, value)
+
+    @staticmethod
+    def _summary_key(pk):
+        return f"test_session_summary:{pk}"
+
+    @classmethod
+    def summaries(cls, pks):
+        """TestSessionごとの名前、開始・完了日時、進捗をキャッシュを使って返す"""
+        keys = {cls._summary_key(pk): pk for pk in pks}
+        cached = cache.get_many(keys)
+        summaries = {keys[key]: summary for key, summary in cached.items()}
+
+        missing = [pk for pk in pks if pk not in summaries]
+        if missing:
+            fetched = {}
+            for test_session in cls.objects.filter(pk__in=missing).only(
+                "name", "started_at", "completed_at", *cls.COUNTER_FIELDS
+            ):
+                fetched[test_session.pk] = {
+                    "id": test_session.pk,
+                    "name": test_session.name,
+                    "started_at": test_session.started_at,
+                    "completed_at": test_session.completed_at,
+                    "completed_count": test_session.completed_count,
+                    "total_count": test_session.total_count,
+                    "pass_percentage": test_session.pass_percentage,
+                }
+            cache.set_many(
+                {cls._summary_key(pk): summary for pk, summary in fetched.items()},
+                SUMMARY_CACHE_TIMEOUT,
+            )
+            summaries.update(fetched)
+        return summaries
+
+    @classmethod
+    def invalidate_summary(cls, *pks):
+        """カウンタや完了日時の変更時に集計値のキャッシュを破棄する"""
+        _invalidate_cache([cls._summary_key(pk) for pk in pks])
+
+    @property
+    def total_count(self):
+        return sum(getattr(self, field) for field in self.COUNTER_FIELDS)
+
+    @property
+    def completed_count(self):
+        return self.total_count - self.not_tested_count
+
+    @property
+    def progress(self):
+        total_count = self.total_count
+        return (self.completed_count / total_count) * 100 if total_count > 0 else 0
+
+    @property
+    def pass_percentage(self):
+        total_count = self.total_count
+        return (self.pass_count * 100) // total_count if total_count > 0 else 0
+
+    def record_remainings(self, status, notes=""):
+        """未実行のテストケースをまとめてstatusで記録し、記録した件数を返す"""
+        with transaction.atomic():
+            now = timezone.now()
+            count = self.executions.filter(status="NOT_TESTED").update(
+                status=status,
+                executed_by=self.executed_by,
+                executed_at=now,
+                environment=self.environment,
+                updated_at=now,
+                notes=notes,
+            )
+            TestSession.shift_counters(self.pk, "NOT_TESTED", status, count)
+            self.refresh_from_db(fields=self.COUNTER_FIELDS)
+        return count
+
     def skip_remainings(self):
         """未実行のテストケースをスキップに変更し、同時にこのTestSessionを完了状態にする"""
-        self.executions.filter(status="NOT_TESTED").update(
-            status="SKIPPED",
-            executed_at=timezone.now(),
-            notes="一括スキップ",
-        )
-        self.complete()
+        with transaction.atomic():
+            self.record_remainings("SKIPPED", notes="一括スキップ")
+            self.complete()
 
     def complete(self):
         """テストセッションを完了状態にする"""
         self.completed_at = timezone.now()
-        self.save()
-
-    def initialize_executions(self, selected_test_cases):
-        """選択されたテストケースに対するTestExecutionを作成する"""
-        for test_case in selected_test_cases:
-            TestExecution.objects.get_or_create(
-                test_session=self,
-                test_case=test_case,
-                defaults={
-                    "environment": self.environment,
-                    "executed_by": self.executed_by,
-                },
+        # カウンタはTestExecution側で更新されるため、古い値で上書きしないようにする
+        self.save(update_fields=["completed_at"])
+
+    def initialize_executions(self, selected_test_cases, batch_size=1000):
+        """選択されたテストケースに対するTestExecutionを作成する。
+
+        INSERTはbatch_size件ずつまとめて1トランザクション内で行い、
+        既にこのセッションに含まれているテストケースは(test_session, test_case)の
+        一意制約により無視される"""
+        if isinstance(selected_test_cases, models.QuerySet):
+            case_ids = selected_test_cases.values_list("pk", flat=True)
+        else:
+            case_ids = [test_case.pk for test_case in selected_test_cases]
+
+        with transaction.atomic():
+            # 渡された順に、既存のTestExecutionの後ろへpositionを振る
+            start = self.last_position() + 1
+            executions = [
+                TestExecution(
+                    test_session=self,
+                    test_case_id=case_id,
+                    position=position,
+                    environment=self.environment,
+                    executed_by=self.executed_by,
+                )
+                for position, case_id in enumerate(case_ids, start=start)
+            ]
+            TestExecution.objects.bulk_create(
+                executions, batch_size=batch_size, ignore_conflicts=True
             )
+            # bulk_createではsave()を経由しないため、カウンタはまとめて数え直す
+            self.refresh_counters()
+
+    def last_position(self):
+        """このセッション内のTestExecutionのpositionの最大値を返す。空の場合は0"""
+        return self.executions.aggregate(last=Max("position"))["last"] or 0
 
     def get_next_execution(self):
         """次に実行すべきTestExecutionを返す"""
         return self.executions.filter(status="NOT_TESTED").first()
 
+    def get_execution_number(self, execution):
+        """TestExecutionがこのセッション内で何番目(1始まり)かを返す"""
+        return self.executions.filter(position__lte=execution.position).count()
+
     def get_available_cases_and_executions(self):
         ret = []
         for execution in self.executions.all().select_related('test_case').order_by('test_case__title'):
@@ -157,6 +405,44 @@ class TestSession(models.Model):
     __test__ = False
 
 
+def _with_rates(stats):
+    """ステータス別の件数に完了数と合格率を加える"""
+    total_count = stats["total_count"]
+    stats["completed_count"] = total_count - stats["not_tested_count"]
+    stats["pass_percentage"] = (
+        (stats["pass_count"] * 100) // total_count if total_count > 0 else 0
+    )
+    return stats
+
+
+class TestExecutionQuerySet(models.QuerySet):
+    # status_stats()のgroup_byに指定できる値と、グループ化に使うフィールド
+    STATS_GROUPS = {
+        "session": "test_session_id",
+        "case": "test_case_id",
+        "suite": "test_case__suite_id",
+        "project": "test_case__suite__project_id",
+    }
+
+    def status_stats(self, group_by=None):
+        """ステータス別の件数、合計、完了数、合格率を1回のクエリで集計する。
+
+        group_byを省略した場合は全体の集計結果を1つの辞書で返す。
+        group_byに"session", "case", "suite", "project"のいずれかを指定した場合は
+        そのIDをキーとした辞書を返す"""
+        aggregates = {
+            TestSession.counter_field(status): Count("id", filter=Q(status=status))
+            for status, _ in TestExecution.STATUS_CHOICES
+        }
+        aggregates["total_count"] = Count("id")
+        if group_by is None:
+            return _with_rates(self.aggregate(**aggregates))
+
+        field = self.STATS_GROUPS[group_by]
+        rows = self.order_by().values(field).annotate(**aggregates)
+        return {row.pop(field): _with_rates(row) for row in rows}
+
+
 class TestExecution(models.Model):
     STATUS_CHOICES = [
         ("NOT_TESTED", "未テスト"),
@@ -180,6 +466,73 @@ class TestExecution(models.Model):
     notes = models.TextField(blank=True)
     result_detail = models.TextField("詳細", blank=True)
     environment = models.CharField(max_length=200, blank=True)
+    # セッション内での実行順（1始まり）。作成時に割り当て、以後は変更しない
+    position = models.PositiveIntegerField(editable=False)
+    # 実行画面のテストケース一覧で、前回以降に変更された行だけを取得するために使う。
+    # QuerySet.update()で変更する場合は明示的に更新すること
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TestExecutionQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["test_session", "position"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["test_session", "test_case"],
+                name="unique_execution_per_session_case",
+            ),
+            models.UniqueConstraint(
+                fields=["test_session", "position"],
+                name="unique_execution_position_per_session",
+            ),
+        ]
+        indexes = [
+            # セッション内のステータスでの絞り込み・集計。
+            # 未実行のTestExecutionの取得（次に実行するもの・一括スキップ）にも使われる
+            models.Index(
+                fields=["test_session", "status", "position"],
+                name="execution_session_status_idx",
+            ),
+            # テストケースごとの実行履歴（新しい順）
+            models.Index(
+                fields=["test_case", "-executed_at"], name="execution_case_executed_idx"
+            ),
+            # セッション内で変更されたTestExecutionの取得
+            models.Index(
+                fields=["test_session", "updated_at"],
+                name="execution_session_updated_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # カウンタ更新のため、DBから読み込んだ時点のstatusを覚えておく
+        instance._loaded_status = dict(zip(field_names, values)).get("status")
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "status" not in update_fields:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            if self._state.adding and self.position is None:
+                self.position = self.test_session.last_position() + 1
+            previous_status = None
+            if not self._state.adding:
+                previous_status = getattr(self, "_loaded_status", None)
+                if previous_status is None:
+                    previous_status = (
+                        TestExecution.objects.filter(pk=self.pk)
+                        .values_list("status", flat=True)
+                        .first()
+                    )
+            super().save(*args, **kwargs)
+            TestSession.shift_counters(
+                self.test_session_id, previous_status, self.status
+            )
+        self._loaded_status = self.status
 
     def __str__(self):
         if self.status == "NOT_TESTED":
@@ -188,3 +541,110 @@ class TestExecution(models.Model):
             return f"{self.id} {self.test_case.title} - {self.status} (executed_at: {self.executed_at.strftime('%Y-%m-%d %H:%M')})"
 
     __test__ = False
+
+
+class ImportJob(models.Model):
+    """バックグラウンドで実行するCSVインポートのジョブ。
+    DBをキューとして使い、run_import_workerコマンドのワーカーが順に処理する"""
+
+    STATUS_CHOICES = [
+        ("PENDING", "待機中"),
+        ("RUNNING", "実行中"),
+        ("SUCCEEDED", "完了"),
+        ("FAILED", "失敗"),
+    ]
+
+    file_name = models.CharField(max_length=255)
+    content = models.TextField(help_text="デコード済みのCSVの内容")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDING")
+    total_rows = models.IntegerField(default=0)
+    processed_rows = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.CharField(max_length=150, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # 実行中のワーカーがチャンクごとに更新する。古いままのジョブはワーカーが停止したとみなす
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    # ワーカーが取得した回数
+    attempts = models.IntegerField(default=0)
+
+    # heartbeat_atがこれより古い実行中のジョブは、ワーカーが停止したものとして待機中に戻す
+    STALE_TIMEOUT = datetime.timedelta(minutes=10)
+    # この回数取得しても終わらないジョブは、ワーカーを停止させる原因とみなして失敗にする
+    MAX_ATTEMPTS = 3
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
+
+    @property
+    def progress(self):
+        if self.status == "SUCCEEDED":
+            return 100
+        return (
+            (self.processed_rows * 100) // self.total_rows if self.total_rows > 0 else 0
+        )
+
+    @property
+    def finished(self):
+        return self.status in ("SUCCEEDED", "FAILED")
+
+    @classmethod
+    def recover_stale(cls, timeout=None):
+        """heartbeat_atがtimeoutより古い実行中のジョブを、ワーカーが停止したものとして待機中に戻す。
+        MAX_ATTEMPTS回取得されたジョブは失敗にする。(待機中に戻した件数, 失敗にした件数)を返す"""
+        now = timezone.now()
+        stale = cls.objects.filter(
+            status="RUNNING",
+            heartbeat_at__lt=now - (timeout or cls.STALE_TIMEOUT),
+        )
+        failed = stale.filter(attempts__gte=cls.MAX_ATTEMPTS).update(
+            status="FAILED",
+            error="インポート中にワーカーが停止しました",
+            finished_at=now,
+        )
+        requeued = stale.filter(attempts__lt=cls.MAX_ATTEMPTS).update(
+            status="PENDING", started_at=None, heartbeat_at=None
+        )
+        return requeued, failed
+
+    @classmethod
+    def claim_next(cls, stale_timeout=None):
+        """待機中のジョブのうち最も古いものを実行中にして返す。なければNoneを返す。
+        複数のワーカーが同時に動いていても同じジョブを二重に取得しない。
+        先に停止したワーカーのジョブを待機中に戻す(recover_stale)"""
+        cls.recover_stale(stale_timeout)
+        while True:
+            job = cls.objects.filter(status="PENDING").order_by("created_at", "pk").first()
+            if job is None:
+                return None
+            now = timezone.now()
+            claimed = cls.objects.filter(pk=job.pk, status="PENDING").update(
+                status="RUNNING",
+                started_at=now,
+                heartbeat_at=now,
+                attempts=F("attempts") + 1,
+            )
+            if claimed:
+                job.refresh_from_db(
+                    fields=["status", "started_at", "heartbeat_at", "attempts"]
+                )
+                return job
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "file_name": self.file_name,
+            "status": self.status,
+            "status_display": self.get_status_display(),
+            "total_rows": self.total_rows,
+            "processed_rows": self.processed_rows,
+            "progress": self.progress,
+            "finished": self.finished,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
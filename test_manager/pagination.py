@@ -0,0 +1,21 @@
+"""REST APIの一覧のページング"""
+
+from rest_framework.pagination import CursorPagination
+
+
+class ListCursorPagination(CursorPagination):
+    """REST APIの一覧で既定とするカーソル方式のページング。
+
+    前のページの最後の行の値を基準に続きを取得するため、途中で行が追加されても
+    重複や欠落がなく、後ろのページでもOFFSETのように遅くならない。
+    並び順はビューのordering属性で指定し、先頭のフィールドはインデックスのある
+    変更されない値とする。page_sizeはmax_page_sizeを上限とする"""
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = "id"
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, "ordering", None) or self.ordering
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
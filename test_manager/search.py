@@ -0,0 +1,337 @@
+"""テストケースとテストステップの全文検索
+
+SQLite(3.34以降)では、テストケースごとに1行のFTS5インデックス(trigramトークナイザ)を
+シグナルで更新し、bm25で関連度の高い順に並べる。trigramは3文字単位で索引するため、
+分かち書きのない日本語も検索できる。それ以外のバックエンドではicontainsで検索する"""
+
+import re
+
+from django.db import connection
+from django.db.models import Case, Exists, IntegerField, OuterRef, Q, Value, When
+
+from .models import TestCase, TestStep, TestSuite
+
+SEARCH_INDEX_TABLE = "test_manager_search_index"
+
+# インデックスの列と、bm25で使う列ごとの重み
+INDEX_COLUMNS = ["title", "description", "prerequisites", "steps"]
+COLUMN_WEIGHTS = [10.0, 2.0, 2.0, 1.0]
+
+# trigramで索引を引ける語の最小文字数。これより短い語はLIKEで絞り込む
+MIN_MATCH_LENGTH = 3
+
+# 1回の検索で使う語の上限
+MAX_TERMS = 10
+
+# bm25で並べ替える件数の上限。bm25は該当する全件で計算するため、
+# これを超える場合は並べ替えずに新しい順とする
+RANK_LIMIT = 10000
+
+# 検索結果に表示する抜粋の文字数
+SNIPPET_LENGTH = 80
+
+# インデックスの更新で一度に扱うテストケースの件数
+INDEX_BATCH_SIZE = 500
+
+
+def uses_fts():
+    """FTS5のインデックスを使って検索するかを返す。trigramトークナイザはSQLite 3.34以降で使える"""
+    return (
+        connection.vendor == "sqlite"
+        and connection.Database.sqlite_version_info >= (3, 34, 0)
+    )
+
+
+def _chunks(values, size):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def _index_sql(where=""):
+    """テストケースとそのステップの内容をインデックスに登録するSQL"""
+    return (
+        f"INSERT INTO {SEARCH_INDEX_TABLE} (rowid, {', '.join(INDEX_COLUMNS)}) "
+        "SELECT c.id, c.title, c.description, c.prerequisites, "
+        "COALESCE((SELECT group_concat(text, char(10)) FROM ("
+        "SELECT s.description || char(10) || s.expected_result AS text "
+        f'FROM {TestStep._meta.db_table} s WHERE s.test_case_id = c.id ORDER BY s."order"'
+        f")), '') FROM {TestCase._meta.db_table} c {where}"
+    )
+
+
+def index_cases(case_ids):
+    """指定したテストケースのインデックスを作り直す。存在しないテストケースはインデックスから除く"""
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(set(case_ids), INDEX_BATCH_SIZE):
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE rowid IN ({placeholders})",
+                chunk,
+            )
+            cursor.execute(_index_sql(f"WHERE c.id IN ({placeholders})"), chunk)
+
+
+def remove_cases(case_ids):
+    """指定したテストケースをインデックスから除く"""
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(set(case_ids), INDEX_BATCH_SIZE):
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE rowid IN ({placeholders})",
+                chunk,
+            )
+
+
+def remove_deleted_cases():
+    """削除済みのテストケースをまとめてインデックスから除く。
+    スイートやプロジェクトの削除で多数のテストケースが削除された場合に使う"""
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_INDEX_TABLE} "
+            f"WHERE rowid NOT IN (SELECT id FROM {TestCase._meta.db_table})"
+        )
+
+
+def rebuild_index():
+    """全てのテストケースのインデックスを作り直し、登録した件数を返す"""
+    if not uses_fts():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_INDEX_TABLE}")
+        cursor.execute(_index_sql())
+        count = cursor.rowcount
+        # 削除と登録で断片化したインデックスを1つにまとめる
+        cursor.execute(
+            f"INSERT INTO {SEARCH_INDEX_TABLE} ({SEARCH_INDEX_TABLE}) VALUES ('optimize')"
+        )
+    return count
+
+
+def parse_terms(query):
+    """検索文字列を空白で区切った語のリストにする。全ての語を含むテストケースを検索する"""
+    terms = []
+    for term in query.split():
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def build_snippet(texts, terms, length=SNIPPET_LENGTH):
+    """textsのうち最初に検索語を含むものから語の前後を切り出し、
+    [(文字列, 検索語かどうか), ...] の形で返す。どれも含まない場合は最初のテキストの先頭を返す"""
+    texts = [" ".join(text.split()) for text in texts if text]
+    if not texts:
+        return []
+    pattern = re.compile(
+        "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)),
+        re.IGNORECASE,
+    )
+    text, match = texts[0], None
+    for candidate in texts:
+        match = pattern.search(candidate)
+        if match:
+            text = candidate
+            break
+
+    start = max(0, match.start() - length // 4) if match else 0
+    end = min(len(text), start + length)
+    fragment = text[start:end]
+    segments = []
+    if start > 0:
+        segments.append(("…", False))
+    position = 0
+    for found in pattern.finditer(fragment):
+        if found.start() > position:
+            segments.append((fragment[position : found.start()], False))
+        segments.append((found.group(), True))
+        position = found.end()
+    if position < len(fragment):
+        segments.append((fragment[position:], False))
+    if end < len(text):
+        segments.append(("…", False))
+    return segments
+
+
+def search_test_cases(query, project=None):
+    """テストケースを検索し、Paginatorに渡せる検索結果を返す。projectを指定するとそのプロジェクトに絞り込む"""
+    terms = parse_terms(query)
+    project_id = project.pk if project is not None else None
+    if uses_fts():
+        return FTSSearchResults(terms, project_id)
+    return QuerySetSearchResults(terms, project_id)
+
+
+class SearchResults:
+    """検索結果。件数とスライスした範囲の結果を、必要になった時点でそれぞれ取得する。
+
+    各要素はTestCaseで、関連度(search_rank、大きいほど関連が高い)と
+    抜粋(search_snippet、build_snippetの形式)を属性に持つ"""
+
+    def __init__(self, terms, project_id=None):
+        self.terms = terms
+        self.project_id = project_id
+        self._count = None
+
+    def count(self):
+        if not self.terms:
+            return 0
+        if self._count is None:
+            self._count = self._fetch_count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = index.start or 0
+            stop = index.stop if index.stop is not None else self.count()
+            if not self.terms or stop <= start:
+                return []
+            return self._fetch(start, stop - start)
+        results = self[index : index + 1]
+        if not results:
+            raise IndexError("search result index out of range")
+        return results[0]
+
+    def _fetch_count(self):
+        raise NotImplementedError
+
+    def _fetch(self, offset, limit):
+        raise NotImplementedError
+
+
+class FTSSearchResults(SearchResults):
+    """FTS5のインデックスを使った検索結果"""
+
+    def _from_where(self):
+        match_terms = [term for term in self.terms if len(term) >= MIN_MATCH_LENGTH]
+        short_terms = [term for term in self.terms if len(term) < MIN_MATCH_LENGTH]
+        sql = f"FROM {SEARCH_INDEX_TABLE} "
+        where, params = [], []
+        if match_terms:
+            # 各語を語句として扱い、全てを含むものを検索する
+            where.append(f"{SEARCH_INDEX_TABLE} MATCH %s")
+            params.append(
+                " ".join('"' + term.replace('"', '""') + '"' for term in match_terms)
+            )
+        for term in short_terms:
+            pattern = "%" + re.sub(r"([\\%_])", r"\\\1", term) + "%"
+            where.append(
+                "("
+                + " OR ".join(
+                    f"{SEARCH_INDEX_TABLE}.{column} LIKE %s ESCAPE '\\'"
+                    for column in INDEX_COLUMNS
+                )
+                + ")"
+            )
+            params += [pattern] * len(INDEX_COLUMNS)
+        if self.project_id is not None:
+            sql += (
+                f"JOIN {TestCase._meta.db_table} c ON c.id = {SEARCH_INDEX_TABLE}.rowid "
+                f"JOIN {TestSuite._meta.db_table} s ON s.id = c.suite_id "
+            )
+            where.append("s.project_id = %s")
+            params.append(self.project_id)
+        return sql + "WHERE " + " AND ".join(where), params, bool(match_terms)
+
+    def _fetch_count(self):
+        sql, params, _ = self._from_where()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) {sql}", params)
+            return cursor.fetchone()[0]
+
+    def _fetch(self, offset, limit):
+        sql, params, has_match = self._from_where()
+        # bm25は関連が高いほど小さい値を返す。MATCHを使わない場合と
+        # 該当件数が多すぎる場合は新しい順とする
+        if has_match and self.count() <= RANK_LIMIT:
+            weights = ", ".join(str(weight) for weight in COLUMN_WEIGHTS)
+            score = f"bm25({SEARCH_INDEX_TABLE}, {weights})"
+        else:
+            score = "0.0"
+        columns = ", ".join(
+            f"{SEARCH_INDEX_TABLE}.{column}" for column in INDEX_COLUMNS
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {SEARCH_INDEX_TABLE}.rowid, {score} AS score, {columns} {sql} "
+                f"ORDER BY score, {SEARCH_INDEX_TABLE}.rowid DESC LIMIT %s OFFSET %s",
+                params + [limit, offset],
+            )
+            rows = cursor.fetchall()
+
+        cases = TestCase.objects.select_related("suite__project").in_bulk(
+            [row[0] for row in rows]
+        )
+        results = []
+        for case_id, score, _title, *texts in rows:
+            case = cases.get(case_id)
+            if case is None:
+                continue
+            case.search_rank = -score
+            case.search_snippet = build_snippet(texts, self.terms)
+            results.append(case)
+        return results
+
+
+class QuerySetSearchResults(SearchResults):
+    """FTS5を使えないバックエンド向けに、icontainsで検索した結果。
+    タイトルに含まれる語の数を関連度とする"""
+
+    def _queryset(self):
+        queryset = TestCase.objects.all()
+        if self.project_id is not None:
+            queryset = queryset.filter(suite__project_id=self.project_id)
+        for term in self.terms:
+            steps = TestStep.objects.filter(
+                Q(description__icontains=term) | Q(expected_result__icontains=term),
+                test_case=OuterRef("pk"),
+            )
+            queryset = queryset.filter(
+                Q(title__icontains=term)
+                | Q(description__icontains=term)
+                | Q(prerequisites__icontains=term)
+                | Exists(steps)
+            )
+        return queryset
+
+    def _fetch_count(self):
+        return self._queryset().count()
+
+    def _fetch(self, offset, limit):
+        score = sum(
+            (
+                Case(
+                    When(title__icontains=term, then=Value(1)),
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+                for term in self.terms
+            ),
+            Value(0),
+        )
+        cases = list(
+            self._queryset()
+            .annotate(search_score=score)
+            .select_related("suite__project")
+            .prefetch_related("steps")
+            .order_by("-search_score", "-pk")[offset : offset + limit]
+        )
+        for case in cases:
+            steps = "\n".join(
+                f"{step.description}\n{step.expected_result}"
+                for step in case.steps.all()
+            )
+            case.search_rank = float(case.search_score)
+            case.search_snippet = build_snippet(
+                [case.description, case.prerequisites, steps], self.terms
+            )
+        return cases
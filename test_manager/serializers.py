@@ -1,3 +1,5 @@
+from django.db import transaction
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 from .models import Project, TestSuite, TestCase, TestStep, TestSession
 from django.shortcuts import get_object_or_404
@@ -25,20 +27,65 @@ class TestCaseSerializer(serializers.ModelSerializer):
         model = TestCase
         fields = ["id", "title", "description", "status", "priority", "steps"]
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # fieldsが指定された場合は、そのフィールドだけを返す
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    __test__ = False
+
+
+class NamedReferenceSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+
+
+class TestCaseSearchResultSerializer(serializers.ModelSerializer):
+    suite = NamedReferenceSerializer(read_only=True)
+    project = NamedReferenceSerializer(source="suite.project", read_only=True)
+    rank = serializers.FloatField(source="search_rank")
+    snippet = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TestCase
+        fields = [
+            "id",
+            "title",
+            "status",
+            "priority",
+            "suite",
+            "project",
+            "rank",
+            "snippet",
+        ]
+
+    def get_snippet(self, obj) -> str:
+        # 検索語の位置はHTML画面でのみ強調し、APIでは連結した文字列を返す
+        return "".join(text for text, _ in obj.search_snippet)
+
     __test__ = False
 
 
 class TestSuiteSerializer(serializers.ModelSerializer):
+    # api.ProjectTestSuiteListは同じ形のレスポンスをbuild_suite_dataで組み立てる
     test_cases = serializers.SerializerMethodField()
 
     class Meta:
         model = TestSuite
         fields = ["id", "name", "description", "test_cases"]
 
+    @extend_schema_field(TestCaseSerializer(many=True, allow_null=True))
     def get_test_cases(self, obj):
-        request = self.context.get("request")
-        if request and request.query_params.get("include_cases") == "true":
-            return TestCaseSerializer(obj.test_cases.all(), many=True).data
+        # 含める階層はcontextのinclude_cases, include_stepsで指定する
+        if self.context.get("include_cases"):
+            fields = TestCaseSerializer.Meta.fields
+            if not self.context.get("include_steps"):
+                fields = [name for name in fields if name != "steps"]
+            return TestCaseSerializer(
+                obj.test_cases.all(), many=True, fields=fields
+            ).data
         # テストケースが「一つもない」ことと、テストケースを返却していないことを区別するため
         # テストケースを返却していない場合として空のリストではなくNoneを返す
         return None
@@ -69,43 +116,154 @@ class TestSessionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ('project', 'executed_by', 'completed') # 'id' is also read-only by default
 
-    def get_completed(self, obj):
-        executions = obj.executions.all()
-        if not executions.exists():
-            # If no executions, it means no cases were selected, or they were all removed.
-            # Consider if this means "completed" or not.
-            # If a session can be created with no cases, it's arguably complete.
-            # If cases are mandatory, then this state (no executions) shouldn't happen post-initialization.
-            return True # Or False, depending on desired logic for empty sessions
-        return all(execution.status != "NOT_TESTED" for execution in executions)
+    def get_completed(self, obj) -> bool:
+        # 一覧で実行結果をセッションごとに問い合わせないよう、カウンタから判定する。
+        # テストケースを含まないセッションは完了とみなす
+        return obj.not_tested_count == 0
 
     def create(self, validated_data):
-        test_session = TestSession.objects.create(**validated_data)
-        project = test_session.project
-
-        if "selected_case_ids" in validated_data:
-            selected_case_ids = validated_data.pop("selected_case_ids")
-            # Validate that all selected_case_ids belong to the project
-            selected_test_cases = TestCase.objects.filter(
-                id__in=selected_case_ids,
-                suite__project=project
-            )
+        # selected_case_idsはTestSessionのフィールドではないため先に取り除く
+        selected_case_ids = validated_data.pop("selected_case_ids", None)
+        with transaction.atomic():
+            test_session = TestSession.objects.create(**validated_data)
+            project = test_session.project
 
-            if len(selected_test_cases) != len(selected_case_ids):
-                # Find missing/invalid IDs for a more informative error
-                valid_ids_found = {tc.id for tc in selected_test_cases}
-                invalid_ids = [id for id in selected_case_ids if id not in valid_ids_found]
-                raise serializers.ValidationError(
-                    f"Invalid or non-project TestCase IDs: {invalid_ids}. "
-                    f"Ensure all selected cases belong to project '{project.name}'."
+            if selected_case_ids is not None:
+                # Validate that all selected_case_ids belong to the project
+                selected_test_cases = TestCase.objects.filter(
+                    id__in=selected_case_ids,
+                    suite__project=project
                 )
-        else:
-            # 指定がなければ全てのTestCaseを選んだことにする
-            selected_test_cases = TestCase.objects.filter(suite__project=project)
 
-        if not selected_test_cases.exists() and self.fields['selected_case_ids'].required:
-             raise serializers.ValidationError("At least one valid test case must be selected.")
+                valid_ids_found = set(selected_test_cases.values_list("id", flat=True))
+                if len(valid_ids_found) != len(set(selected_case_ids)):
+                    # Find missing/invalid IDs for a more informative error
+                    invalid_ids = [id for id in selected_case_ids if id not in valid_ids_found]
+                    raise serializers.ValidationError(
+                        f"Invalid or non-project TestCase IDs: {invalid_ids}. "
+                        f"Ensure all selected cases belong to project '{project.name}'."
+                    )
+            else:
+                # 指定がなければ全てのTestCaseを選んだことにする
+                selected_test_cases = TestCase.objects.filter(suite__project=project)
+
+            if not selected_test_cases.exists() and self.fields['selected_case_ids'].required:
+                 raise serializers.ValidationError("At least one valid test case must be selected.")
+
+            test_session.initialize_executions(selected_test_cases)
 
-        test_session.initialize_executions(selected_test_cases)
-        
         return test_session
+
+
+# 読み取り専用のAPIでは、ModelSerializerのフィールドごとの処理が大きな一覧のCPU時間の大半を占めるため、
+# .values()の行から上のシリアライザと同じ形のdictを直接組み立てる。
+# フィールドとその並びは各シリアライザのMeta.fieldsに従う
+
+PROJECT_VALUE_FIELDS = ProjectSerializer.Meta.fields
+SUITE_VALUE_FIELDS = [
+    name for name in TestSuiteSerializer.Meta.fields if name != "test_cases"
+]
+
+
+def _case_fields(fields=None):
+    # TestCaseSerializer(fields=...)と同じく、指定されたフィールドをMeta.fieldsの順に並べる
+    return [
+        name
+        for name in TestCaseSerializer.Meta.fields
+        if fields is None or name in fields
+    ]
+
+
+def case_value_fields(fields=None, prefix=""):
+    """build_case_dataに渡す行を取得するため、.values()に指定するフィールド名を返す。
+    prefixはクエリセットのモデルからTestCaseへのパス（例: "test_case__"）"""
+    names = ["id"] + [
+        name for name in _case_fields(fields) if name not in ("id", "steps")
+    ]
+    return [prefix + name for name in names]
+
+
+def _step_data(case_ids):
+    """テストケースごとのステップをTestStepSerializerと同じ形で返す"""
+    steps = {}
+    rows = (
+        TestStep.objects.filter(test_case_id__in=case_ids)
+        .order_by("order", "pk")
+        .values("test_case_id", *TestStepSerializer.Meta.fields)
+    )
+    for row in rows:
+        steps.setdefault(row.pop("test_case_id"), []).append(row)
+    return steps
+
+
+def build_case_data(rows, fields=None, prefix=""):
+    """case_value_fieldsで取得した行から、TestCaseSerializer(fields=fields)と同じ形のdictのリストを返す。
+    stepsを含む場合は、全ての行のステップを1回のクエリで取得する"""
+    rows = list(rows)
+    names = _case_fields(fields)
+    steps = _step_data([row[prefix + "id"] for row in rows]) if "steps" in names else {}
+    return [
+        {
+            name: (
+                steps.get(row[prefix + "id"], [])
+                if name == "steps"
+                else row[prefix + name]
+            )
+            for name in names
+        }
+        for row in rows
+    ]
+
+
+def build_project_data(rows):
+    """PROJECT_VALUE_FIELDSで取得した行から、ProjectSerializerと同じ形のdictのリストを返す"""
+    return [
+        {name: row[name] for name in ProjectSerializer.Meta.fields} for row in rows
+    ]
+
+
+# completedはカウンタから求め、started_atはカーソル方式のページングで使う
+SESSION_FIELDS = [
+    name for name in TestSessionSerializer.Meta.fields if name != "selected_case_ids"
+]
+SESSION_VALUE_FIELDS = [
+    name for name in SESSION_FIELDS if name != "completed"
+] + ["not_tested_count", "started_at"]
+
+
+def build_session_data(rows):
+    """SESSION_VALUE_FIELDSで取得した行から、TestSessionSerializerと同じ形のdictのリストを返す"""
+    return [
+        {
+            name: (
+                row["not_tested_count"] == 0 if name == "completed" else row[name]
+            )
+            for name in SESSION_FIELDS
+        }
+        for row in rows
+    ]
+
+
+def build_suite_data(rows, include_cases=False, include_steps=False):
+    """SUITE_VALUE_FIELDSで取得した行から、TestSuiteSerializerと同じ形のdictのリストを返す。
+    テストケースを含む場合は、全ての行のテストケースを1回のクエリで取得する"""
+    rows = list(rows)
+    cases = {}
+    if include_cases:
+        fields = None
+        if not include_steps:
+            fields = [name for name in _case_fields() if name != "steps"]
+        case_rows = list(
+            TestCase.objects.filter(suite_id__in=[row["id"] for row in rows])
+            .order_by("pk")
+            .values("suite_id", *case_value_fields(fields))
+        )
+        for row, data in zip(case_rows, build_case_data(case_rows, fields)):
+            cases.setdefault(row["suite_id"], []).append(data)
+    return [
+        {
+            **{name: row[name] for name in SUITE_VALUE_FIELDS},
+            "test_cases": cases.get(row["id"], []) if include_cases else None,
+        }
+        for row in rows
+    ]
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # REQUEST_METRICS_ENABLEDがTrueの場合のみ有効。全体を計測するため先頭に置く
+    "test_manager.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -82,7 +87,41 @@ WSGI_APPLICATION = "test_manager.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        # Dockerではwebとworkerのコンテナで共有するボリューム上のパスを指定する
+        "NAME": os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# CACHE_BACKENDで選択する。複数のワーカープロセスで動かす場合は
+# プロセス間で共有されるfileかdbを使う（locmemはプロセスごとに別々のキャッシュとなる）
+#   locmem: プロセス内のメモリ（デフォルト）
+#   file:   CACHE_LOCATIONのディレクトリ（デフォルトは .cache/）にファイルとして保存する
+#   db:     DBのCACHE_LOCATIONのテーブル（デフォルトは cache_table）に保存する。
+#           事前に `manage.py createcachetable` でテーブルを作成すること
+#   dummy:  キャッシュしない
+_CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "test-manager"),
+    "file": (
+        "django.core.cache.backends.filebased.FileBasedCache",
+        str(BASE_DIR / ".cache"),
+    ),
+    "db": ("django.core.cache.backends.db.DatabaseCache", "cache_table"),
+    "dummy": ("django.core.cache.backends.dummy.DummyCache", ""),
+}
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+if CACHE_BACKEND not in _CACHE_BACKENDS:
+    raise ImproperlyConfigured(
+        f"CACHE_BACKEND must be one of {', '.join(_CACHE_BACKENDS)}: {CACHE_BACKEND}"
+    )
+CACHES = {
+    "default": {
+        "BACKEND": _CACHE_BACKENDS[CACHE_BACKEND][0],
+        "LOCATION": os.getenv("CACHE_LOCATION", _CACHE_BACKENDS[CACHE_BACKEND][1]),
+        "TIMEOUT": int(os.getenv("CACHE_TIMEOUT", "300")),
+        "KEY_PREFIX": "test_manager",
     }
 }
 
@@ -194,7 +233,11 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticated",
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_PAGINATION_CLASS": "test_manager.pagination.ListCursorPagination",
 }
 
+# リクエストごとのクエリ数・処理時間の計測。結果はServer-Timingヘッダと管理者ダッシュボードで確認できる
+REQUEST_METRICS_ENABLED = os.getenv("REQUEST_METRICS_ENABLED", "") == "1"
+
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
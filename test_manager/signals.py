@@ -0,0 +1,109 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import search
+from .models import (
+    Project,
+    TestSuite,
+    TestCase,
+    TestStep,
+    TestSession,
+    TestExecution,
+)
+
+
+@receiver(post_delete, sender=TestExecution)
+def decrement_session_counter(sender, instance, **kwargs):
+    """TestExecutionが削除された際にTestSessionのカウンタを減らす"""
+    TestSession.shift_counters(instance.test_session_id, instance.status, None)
+
+
+def _is_cascaded(sender, kwargs):
+    """親の削除に伴って削除された場合はTrueを返す。親のシグナルでキャッシュが破棄される"""
+    origin = kwargs.get("origin")
+    if origin is None:
+        return False
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model is not sender
+
+
+@receiver(post_save, sender=TestSuite)
+@receiver(post_delete, sender=TestSuite)
+def invalidate_project_caches_by_suite(sender, instance, **kwargs):
+    """スイートの変更でプロジェクトの集計値と内容のキャッシュを破棄する"""
+    Project.invalidate_summary(instance.project_id)
+    Project.invalidate_content(instance.project_id)
+
+
+@receiver(post_save, sender=TestCase)
+@receiver(post_delete, sender=TestCase)
+def invalidate_project_caches_by_case(sender, instance, **kwargs):
+    """ケースの変更でプロジェクトの集計値と内容のキャッシュを破棄する"""
+    if _is_cascaded(sender, kwargs):
+        return
+    project_id = (
+        TestSuite.objects.filter(pk=instance.suite_id)
+        .values_list("project_id", flat=True)
+        .first()
+    )
+    if project_id is not None:
+        Project.invalidate_summary(project_id)
+        Project.invalidate_content(project_id)
+
+
+@receiver(post_save, sender=TestStep)
+@receiver(post_delete, sender=TestStep)
+def invalidate_project_content_by_step(sender, instance, **kwargs):
+    """ステップの変更でプロジェクトの内容のキャッシュを破棄する"""
+    if _is_cascaded(sender, kwargs):
+        return
+    project_id = (
+        TestCase.objects.filter(pk=instance.test_case_id)
+        .values_list("suite__project_id", flat=True)
+        .first()
+    )
+    if project_id is not None:
+        Project.invalidate_content(project_id)
+
+
+@receiver(post_save, sender=TestSession)
+@receiver(post_delete, sender=TestSession)
+def invalidate_session_summary(sender, instance, **kwargs):
+    """セッションの増減で最新のセッションが変わるため、プロジェクトの集計値も破棄する"""
+    TestSession.invalidate_summary(instance.pk)
+    if kwargs.get("created", True):
+        Project.invalidate_summary(instance.project_id)
+
+
+@receiver(post_save, sender=TestCase)
+def update_search_index_by_case(sender, instance, **kwargs):
+    """ケースの変更を全文検索のインデックスに反映する"""
+    search.index_cases([instance.pk])
+
+
+@receiver(post_delete, sender=TestCase)
+def remove_search_index_by_case(sender, instance, **kwargs):
+    """ケースの削除を全文検索のインデックスに反映する。
+    親の削除に伴って削除された場合は、親のシグナルでまとめて反映する"""
+    if _is_cascaded(sender, kwargs):
+        return
+    search.remove_cases([instance.pk])
+
+
+@receiver(post_delete, sender=TestSuite)
+@receiver(post_delete, sender=Project)
+def remove_search_index_by_parent(sender, instance, **kwargs):
+    """スイート・プロジェクトの削除に伴って削除されたケースを、インデックスからまとめて除く"""
+    if _is_cascaded(sender, kwargs):
+        return
+    search.remove_deleted_cases()
+
+
+@receiver(post_save, sender=TestStep)
+@receiver(post_delete, sender=TestStep)
+def update_search_index_by_step(sender, instance, **kwargs):
+    """ステップの変更を、ステップを含むケースのインデックスに反映する"""
+    if _is_cascaded(sender, kwargs):
+        return
+    search.index_cases([instance.test_case_id])
@@ -0,0 +1,104 @@
+"""性能テストとベンチマーク用の合成データを作成する"""
+
+from . import search
+from .models import Project, TestSuite, TestCase, TestStep, TestSession, TestExecution
+
+# 作成するテスト実行のステータス。実行途中のセッションを模して一部を未実行とする
+EXECUTION_STATUSES = [
+    "PASS",
+    "PASS",
+    "PASS",
+    "FAIL",
+    "BLOCKED",
+    "SKIPPED",
+    "NOT_TESTED",
+]
+
+
+def generate_synthetic_data(
+    projects=5,
+    suites_per_project=4,
+    cases_per_suite=50,
+    steps_per_case=3,
+    sessions_per_project=5,
+    prefix="",
+):
+    """プロジェクト・スイート・ケース・ステップ・セッション・実行結果をまとめて作成する。
+
+    各セッションはプロジェクト内の1スイート分のケースを実行した状態とし、カウンタも更新する。
+    プロジェクト名は一意である必要があるため、既存のデータがある場合はprefixで区別する"""
+    project_list = Project.objects.bulk_create(
+        Project(name=f"{prefix}プロジェクト{i}", description="説明")
+        for i in range(projects)
+    )
+    suites = TestSuite.objects.bulk_create(
+        TestSuite(project=project, name=f"スイート{j}", description="説明")
+        for project in project_list
+        for j in range(suites_per_project)
+    )
+    cases = TestCase.objects.bulk_create(
+        (
+            TestCase(
+                suite=suite,
+                title=f"{suite.name}-ケース{k}",
+                description="説明",
+                prerequisites="前提条件",
+                status="ACTIVE",
+            )
+            for suite in suites
+            for k in range(cases_per_suite)
+        ),
+        batch_size=1000,
+    )
+    TestStep.objects.bulk_create(
+        (
+            TestStep(
+                test_case=case,
+                order=order,
+                description=f"手順{order}",
+                expected_result="期待結果",
+            )
+            for case in cases
+            for order in range(1, steps_per_case + 1)
+        ),
+        batch_size=5000,
+    )
+    # bulk_createではシグナルが送られないため、全文検索のインデックスを明示的に更新する
+    search.index_cases(case.pk for case in cases)
+
+    sessions = TestSession.objects.bulk_create(
+        TestSession(project=project, name=f"セッション{j}", executed_by="tester")
+        for project in project_list
+        for j in range(sessions_per_project)
+    )
+    cases_by_suite = {}
+    for case in cases:
+        cases_by_suite.setdefault(case.suite_id, []).append(case)
+    suites_by_project = {}
+    for suite in suites:
+        suites_by_project.setdefault(suite.project_id, []).append(suite)
+    executions = []
+    for n, test_session in enumerate(sessions):
+        project_suites = suites_by_project.get(test_session.project_id)
+        if not project_suites:
+            continue
+        suite = project_suites[n % len(project_suites)]
+        for position, case in enumerate(cases_by_suite.get(suite.pk, []), start=1):
+            executions.append(
+                TestExecution(
+                    test_session=test_session,
+                    test_case=case,
+                    position=position,
+                    status=EXECUTION_STATUSES[(n + position) % len(EXECUTION_STATUSES)],
+                )
+            )
+    TestExecution.objects.bulk_create(executions, batch_size=5000)
+    for test_session in sessions:
+        test_session.refresh_counters()
+
+    return {
+        "projects": project_list,
+        "suites": suites,
+        "cases": cases,
+        "sessions": sessions,
+    }
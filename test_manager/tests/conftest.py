@@ -0,0 +1,10 @@
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # テストごとにロールバックされたIDが再利用されるため、キャッシュを持ち越さない
+    cache.clear()
+    yield
+    cache.clear()
@@ -119,3 +119,29 @@ def test_get_test_case_detail_steps_ordered(api_client, test_case, user):
     # Verify steps are ordered by 'order' field
     assert response.data["steps"][0]["description"] == "Step 1"
     assert response.data["steps"][1]["description"] == "Step 2"
+
+
+@pytest.mark.django_db
+def test_get_test_case_detail_conditional(
+    api_client, test_case, test_steps, user, django_assert_num_queries
+):
+    api_client.force_authenticate(user=user)
+    url = reverse("testcase-detail", kwargs={"pk": test_case.pk})
+    response = api_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response["ETag"]
+    assert response["Last-Modified"]
+    assert "no-cache" in response["Cache-Control"]
+
+    # 変更がなければ集計のクエリだけで304を返す
+    with django_assert_num_queries(1):
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response["ETag"] == etag
+
+    # ステップの削除で最終更新日時が変わらなくてもETagは変わる
+    test_steps[1].delete()
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data["steps"]) == 1
+    assert response["ETag"] != etag
@@ -1,9 +1,17 @@
 import pytest
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
-from test_manager.models import Project, TestSuite, TestCase, TestSession, TestExecution
+from test_manager.models import (
+    Project,
+    TestSuite,
+    TestCase,
+    TestStep,
+    TestSession,
+    TestExecution,
+)
 
 User = get_user_model()
 
@@ -76,6 +84,102 @@ class TestCaseViews:
         assert response.status_code == 200
         assert "Test Session" in str(response.content)
         assert "PASS" in str(response.content)
+        assert response.context["execution_stats"]["pass_count"] == 1
+        assert response.context["execution_stats"]["total_count"] == 1
+
+    def test_case_detail_steps_cache(self, client, user, case):
+        client.login(username="testuser", password="testpass")
+        step = TestStep.objects.create(
+            test_case=case, order=1, description="手順1", expected_result="結果1"
+        )
+        url = reverse("case_detail", kwargs={"pk": case.pk})
+        assert "手順1" in client.get(url).content.decode()
+
+        # ステップの変更・削除でキャッシュが無効になる
+        step.description = "変更した手順"
+        step.save()
+        assert "変更した手順" in client.get(url).content.decode()
+        step.delete()
+        assert "変更した手順" not in client.get(url).content.decode()
+
+    def _walk(self, client, url, query=""):
+        """次へのリンクをたどって全ページのケースを集める"""
+        pages = []
+        while True:
+            response = client.get(f"{url}?{query}")
+            assert response.status_code == 200
+            pages.append([case.pk for case in response.context["cases"]])
+            page = response.context["page_obj"]
+            if not page.has_next:
+                return pages, response
+            query = page.next_query
+
+    def test_case_list_keyset_pagination(self, client, user, suite):
+        cases = [
+            TestCase.objects.create(suite=suite, title=f"Case {i:03}")
+            for i in range(120)
+        ]
+        # 並び順の列の値が同じ行があってもpkで一意に並ぶ
+        TestCase.objects.update(updated_at=timezone.now())
+        client.force_login(user)
+        url = reverse("case_list")
+
+        pages, response = self._walk(client, url)
+        assert [len(page) for page in pages] == [50, 50, 20]
+        assert [pk for page in pages for pk in page] == sorted(
+            (case.pk for case in cases), reverse=True
+        )
+
+        # 前へのリンクで戻る
+        page = response.context["page_obj"]
+        assert page.has_previous
+        response = client.get(f"{url}?{page.previous_query}")
+        assert [case.pk for case in response.context["cases"]] == pages[1]
+        response = client.get(f"{url}?{response.context['page_obj'].previous_query}")
+        assert [case.pk for case in response.context["cases"]] == pages[0]
+        assert not response.context["page_obj"].has_previous
+
+        pages, _ = self._walk(client, url, "sort=title")
+        assert [pk for page in pages for pk in page] == [case.pk for case in cases]
+
+    def test_case_list_filters(self, client, user, project, suite, case):
+        other_suite = TestSuite.objects.create(project=project, name="Other Suite")
+        other_project = Project.objects.create(name="Other Project")
+        other_project_suite = TestSuite.objects.create(
+            project=other_project, name="Suite"
+        )
+        high = TestCase.objects.create(
+            suite=other_suite, title="High", status="ACTIVE", priority="HIGH"
+        )
+        old = TestCase.objects.create(suite=other_project_suite, title="Old")
+        TestCase.objects.filter(pk=old.pk).update(
+            updated_at=timezone.now() - timezone.timedelta(days=30)
+        )
+        client.force_login(user)
+        url = reverse("case_list")
+
+        def titles(**params):
+            response = client.get(url, params)
+            assert response.status_code == 200
+            return {case.title for case in response.context["cases"]}
+
+        assert titles() == {"Test Case", "High", "Old"}
+        assert titles(project=project.pk) == {"Test Case", "High"}
+        assert titles(project=project.pk, suite=other_suite.pk) == {"High"}
+        assert titles(status="ACTIVE") == {"High"}
+        assert titles(priority="MEDIUM") == {"Test Case", "Old"}
+        today = timezone.localdate()
+        assert titles(updated_from=today.isoformat()) == {"Test Case", "High"}
+        assert titles(updated_to=(today - timezone.timedelta(days=1)).isoformat()) == {
+            "Old"
+        }
+        # 他のプロジェクトのスイートは選べない
+        assert titles(project=project.pk, suite=other_project_suite.pk) == set()
+
+    def test_case_list_invalid_cursor(self, client, user, case):
+        client.force_login(user)
+        response = client.get(reverse("case_list"), {"after": "invalid"})
+        assert response.status_code == 404
 
 
 @pytest.mark.django_db
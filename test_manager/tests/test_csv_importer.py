@@ -0,0 +1,290 @@
+import csv
+import datetime
+import io
+from pathlib import Path
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from test_manager.csv_importer import CSVImporter, process_import_job
+from test_manager.models import Project, TestSuite, TestCase, TestStep, ImportJob
+
+SAMPLE_CSV = Path(__file__).resolve().parents[2] / "misc" / "sample_data.csv"
+
+HEADERS = [
+    "project_name",
+    "type",
+    "parent",
+    "name",
+    "description",
+    "order",
+    "status",
+    "priority",
+    "prerequisites",
+    "expected_result",
+]
+
+
+def _rows(*rows):
+    return [dict(zip(HEADERS, row)) for row in rows]
+
+
+def _project(name, description=""):
+    return [name, "project", "", name, description, "", "", "", "", ""]
+
+
+def _suite(project, name, description=""):
+    return [project, "suite", project, name, description, "", "", "", "", ""]
+
+
+def _case(project, suite, title, description="", status="", priority=""):
+    return [project, "case", suite, title, description, "", status, priority, "", ""]
+
+
+def _step(project, case, order, description="", expected_result=""):
+    return [
+        project,
+        "step",
+        case,
+        "",
+        description,
+        str(order),
+        "",
+        "",
+        "",
+        expected_result,
+    ]
+
+
+@pytest.mark.django_db
+class TestCSVImporter:
+    def test_import_sample_data(self):
+        with open(SAMPLE_CSV, encoding="utf-8", newline="") as f:
+            CSVImporter().run(csv.DictReader(f))
+        assert Project.objects.count() == 3
+        assert TestSuite.objects.count() > 0
+        assert TestCase.objects.count() > 0
+        assert TestStep.objects.count() > 0
+
+        # 同じファイルを再度インポートしても重複して作成されない
+        counts = (
+            TestSuite.objects.count(),
+            TestCase.objects.count(),
+            TestStep.objects.count(),
+        )
+        with open(SAMPLE_CSV, encoding="utf-8", newline="") as f:
+            CSVImporter().run(csv.DictReader(f))
+        assert (
+            TestSuite.objects.count(),
+            TestCase.objects.count(),
+            TestStep.objects.count(),
+        ) == counts
+
+    @pytest.mark.parametrize("supports_upsert", [True, False])
+    def test_import_updates_existing(self, supports_upsert):
+        project = Project.objects.create(name="P", description="old")
+        suite = TestSuite.objects.create(project=project, name="S", description="old")
+        case = TestCase.objects.create(suite=suite, title="C", description="old")
+        TestStep.objects.create(test_case=case, order=1, description="old")
+
+        CSVImporter(supports_upsert=supports_upsert).run(
+            _rows(
+                _project("P", "new"),
+                _suite("P", "S", "new"),
+                _case("P", "S", "C", "new", "ACTIVE", "HIGH"),
+                _step("P", "C", 1, "new", "result"),
+                _step("P", "C", 2, "added"),
+            )
+        )
+
+        project.refresh_from_db()
+        suite.refresh_from_db()
+        case.refresh_from_db()
+        assert project.description == "new"
+        assert suite.description == "new"
+        assert case.description == "new"
+        assert case.status == "ACTIVE"
+        assert case.priority == "HIGH"
+        assert list(
+            case.steps.values_list("order", "description", "expected_result")
+        ) == [
+            (1, "new", "result"),
+            (2, "added", ""),
+        ]
+
+    def test_import_defaults(self):
+        CSVImporter().run(_rows(_project("P"), _suite("P", "S"), _case("P", "S", "C")))
+        case = TestCase.objects.get()
+        assert case.status == "DRAFT"
+        assert case.priority == "MEDIUM"
+
+    def test_query_count_does_not_depend_on_rows(self, django_assert_max_num_queries):
+        rows = [_project("P"), _suite("P", "S")]
+        for i in range(200):
+            rows.append(_case("P", "S", f"C{i}"))
+            for order in range(1, 4):
+                rows.append(_step("P", f"C{i}", order, f"step {order}"))
+
+        with django_assert_max_num_queries(20):
+            CSVImporter().run(_rows(*rows))
+        assert TestCase.objects.count() == 200
+        assert TestStep.objects.count() == 600
+
+    def test_reference_must_be_defined_before(self):
+        # スイートの定義より前にそのスイートのケースがある場合は従来通りエラーとする
+        with pytest.raises(ValueError, match="Suite not found"):
+            CSVImporter().run(
+                _rows(_project("P"), _case("P", "S", "C"), _suite("P", "S"))
+            )
+        # 1トランザクションで処理されるため何も作成されない
+        assert Project.objects.count() == 0
+
+    def test_unknown_project(self):
+        with pytest.raises(ValueError, match="Project not found"):
+            CSVImporter().run(_rows(_suite("P", "S")))
+
+    def test_step_without_case(self):
+        with pytest.raises(ValueError, match="TestCase not found"):
+            CSVImporter().run(
+                _rows(_project("P"), _suite("P", "S"), _step("P", "C", 1))
+            )
+
+    def test_step_with_ambiguous_case(self):
+        project = Project.objects.create(name="P")
+        for name in ("S1", "S2"):
+            suite = TestSuite.objects.create(project=project, name=name)
+            TestCase.objects.create(suite=suite, title="C")
+        with pytest.raises(ValueError, match="Multiple TestCases found"):
+            CSVImporter().run(_rows(_step("P", "C", 1)))
+
+    def test_invalid_rows(self):
+        with pytest.raises(ValueError, match="Invalid data format"):
+            CSVImporter().run(_rows(["P", "invalid", "", "", "", "", "", "", "", ""]))
+        with pytest.raises(ValueError, match="Step order is required"):
+            CSVImporter().run(
+                _rows(_project("P"), ["P", "step", "C", "", "", "", "", "", "", ""])
+            )
+
+
+def _csv(*rows):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(HEADERS)
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+@pytest.mark.django_db
+class TestImportJob:
+    def test_claim_next(self):
+        first = ImportJob.objects.create(file_name="1.csv", content="")
+        second = ImportJob.objects.create(file_name="2.csv", content="")
+        assert ImportJob.claim_next() == first
+        assert ImportJob.claim_next() == second
+        assert ImportJob.claim_next() is None
+        first.refresh_from_db()
+        assert first.status == "RUNNING"
+        assert first.started_at is not None
+        assert first.heartbeat_at is not None
+        assert first.attempts == 1
+
+    def test_claim_next_recovers_stale_jobs(self):
+        # 停止したワーカーのジョブは、進捗の更新が途絶えてからSTALE_TIMEOUT後に再実行される
+        old = timezone.now() - ImportJob.STALE_TIMEOUT - datetime.timedelta(minutes=1)
+        stale = ImportJob.objects.create(
+            file_name="stale.csv",
+            content="",
+            status="RUNNING",
+            started_at=old,
+            heartbeat_at=old,
+            attempts=1,
+        )
+        running = ImportJob.objects.create(
+            file_name="running.csv",
+            content="",
+            status="RUNNING",
+            started_at=old,
+            heartbeat_at=timezone.now(),
+            attempts=1,
+        )
+        crashing = ImportJob.objects.create(
+            file_name="crashing.csv",
+            content="",
+            status="RUNNING",
+            started_at=old,
+            heartbeat_at=old,
+            attempts=ImportJob.MAX_ATTEMPTS,
+        )
+        job = ImportJob.claim_next()
+        assert job == stale
+        assert job.status == "RUNNING"
+        assert job.attempts == 2
+        assert job.heartbeat_at > old
+        running.refresh_from_db()
+        assert running.status == "RUNNING"
+        # 何度もワーカーを停止させるジョブは失敗にする
+        crashing.refresh_from_db()
+        assert crashing.status == "FAILED"
+        assert crashing.error
+        assert crashing.finished_at is not None
+        assert ImportJob.claim_next() is None
+
+    def test_worker_requeues_stale_jobs(self):
+        old = timezone.now() - datetime.timedelta(seconds=30)
+        job = ImportJob.objects.create(
+            file_name="a.csv",
+            content=_csv(_project("P")),
+            status="RUNNING",
+            started_at=old,
+            heartbeat_at=old,
+            attempts=1,
+        )
+        call_command(
+            "run_import_worker", "--once", "--stale-timeout", "10", stdout=io.StringIO()
+        )
+        job.refresh_from_db()
+        assert job.status == "SUCCEEDED"
+        assert job.attempts == 2
+        assert Project.objects.filter(name="P").exists()
+
+    @pytest.mark.parametrize("backend, warns", [("locmem", True), ("file", False)])
+    def test_worker_warns_about_unshared_cache(self, settings, backend, warns):
+        settings.CACHE_BACKEND = backend
+        stderr = io.StringIO()
+        call_command("run_import_worker", "--once", stdout=io.StringIO(), stderr=stderr)
+        assert ("CACHE_BACKEND=locmem" in stderr.getvalue()) is warns
+
+    def test_process_in_chunks(self):
+        rows = [_project("P"), _suite("P", "S")]
+        for i in range(5):
+            rows.append(_case("P", "S", f"C{i}"))
+            rows.append(_step("P", f"C{i}", 1))
+        job = ImportJob.objects.create(file_name="a.csv", content=_csv(*rows))
+
+        # ケースとステップがチャンクをまたいでも、前のチャンクの内容を参照できる
+        process_import_job(job, chunk_rows=3)
+        job.refresh_from_db()
+        assert job.status == "SUCCEEDED"
+        assert job.total_rows == job.processed_rows == 12
+        assert job.progress == 100
+        assert job.finished_at is not None
+        assert TestCase.objects.count() == 5
+        assert TestStep.objects.count() == 5
+
+    def test_process_failure(self):
+        content = _csv(
+            _project("P"),
+            _suite("P", "S"),
+            _case("P", "S", "C"),
+            _step("P", "Unknown", 1),
+        )
+        job = ImportJob.objects.create(file_name="a.csv", content=content)
+        process_import_job(job, chunk_rows=2)
+        job.refresh_from_db()
+        assert job.status == "FAILED"
+        assert "TestCase not found" in job.error
+        assert "row_num: 4" in job.error
+        # 失敗したチャンクより前のチャンクはコミットされている
+        assert job.processed_rows == 2
+        assert TestSuite.objects.count() == 1
+        assert TestCase.objects.count() == 0
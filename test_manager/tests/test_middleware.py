@@ -0,0 +1,58 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from test_manager.middleware import request_metrics
+from test_manager.models import Project
+
+User = get_user_model()
+
+
+@pytest.fixture
+def metrics_enabled(settings):
+    settings.REQUEST_METRICS_ENABLED = True
+    request_metrics.clear()
+    yield
+    request_metrics.clear()
+
+
+@pytest.fixture
+def superuser(db):
+    return User.objects.create_superuser(
+        username="admin", email="admin@example.com", password="adminpass"
+    )
+
+
+@pytest.mark.django_db
+class TestRequestMetricsMiddleware:
+    def test_disabled_by_default(self, client, settings):
+        settings.REQUEST_METRICS_ENABLED = False
+        response = client.get(reverse("project_list"))
+        assert "Server-Timing" not in response
+
+    def test_server_timing(self, client, superuser, metrics_enabled):
+        client.login(username="admin", password="adminpass")
+        Project.objects.create(name="テストプロジェクト")
+        response = client.get(reverse("project_list"))
+        assert response.status_code == 200
+        server_timing = response["Server-Timing"]
+        assert "db;dur=" in server_timing
+        assert "render;dur=" in server_timing
+        assert "total;dur=" in server_timing
+
+        rows = {row["url_name"]: row for row in request_metrics.summary()}
+        row = rows["project_list"]
+        assert row["count"] == 1
+        assert row["max_queries"] > 0
+        assert row["avg_size"] == len(response.content)
+        # ListViewはTemplateResponseを返すため、レンダリング時間が計測される
+        assert row["avg_render_ms"] > 0
+
+    def test_admin_dashboard_summary(self, client, superuser, metrics_enabled):
+        client.login(username="admin", password="adminpass")
+        client.get(reverse("project_list"))
+        client.get(reverse("project_list"))
+        response = client.get(reverse("admin_dashboard"))
+        assert response.status_code == 200
+        rows = {row["url_name"]: row for row in response.context["request_metrics"]}
+        assert rows["project_list"]["count"] == 2
+        assert "project_list" in response.content.decode()
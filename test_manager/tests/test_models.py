@@ -1,6 +1,17 @@
+import io
+import json
+
 import pytest
+from django.core.management import call_command
 from django.utils import timezone
-from test_manager.models import Project, TestSuite, TestCase, TestStep
+from test_manager.models import (
+    Project,
+    TestSuite,
+    TestCase,
+    TestStep,
+    TestSession,
+    TestExecution,
+)
 
 
 @pytest.mark.django_db
@@ -99,3 +110,203 @@ class TestTestStep:
             test_case=case, order=1, description="ログインボタンをクリック"
         )
         assert str(step) == "ステップ 1: ログインボタンをクリック"
+
+
+@pytest.mark.django_db
+class TestTestSessionCounters:
+    @pytest.fixture
+    def test_session(self):
+        project = Project.objects.create(name="テストプロジェクト")
+        suite = TestSuite.objects.create(project=project, name="テストスイート1")
+        test_session = TestSession.objects.create(project=project, name="セッション")
+        for i in range(3):
+            case = TestCase.objects.create(suite=suite, title=f"ケース{i}")
+            TestExecution.objects.create(test_session=test_session, test_case=case)
+        test_session.refresh_from_db()
+        return test_session
+
+    def test_counters_on_create(self, test_session):
+        assert test_session.not_tested_count == 3
+        assert test_session.total_count == 3
+        assert test_session.completed_count == 0
+
+    def test_counters_on_status_change(self, test_session):
+        execution = test_session.executions.first()
+        execution.status = "PASS"
+        execution.save()
+        # 同じstatusでの再保存ではカウンタは変わらない
+        execution.save()
+        test_session.refresh_from_db()
+        assert test_session.not_tested_count == 2
+        assert test_session.pass_count == 1
+        assert test_session.pass_percentage == 33
+        assert test_session.completed_count == 1
+
+    def test_counters_on_delete(self, test_session):
+        test_session.executions.first().delete()
+        test_session.refresh_from_db()
+        assert test_session.not_tested_count == 2
+        assert test_session.total_count == 2
+
+    def test_counters_on_skip_remainings(self, test_session):
+        execution = test_session.executions.first()
+        execution.status = "FAIL"
+        execution.save()
+        test_session.skip_remainings()
+        assert test_session.skipped_count == 2
+        test_session.refresh_from_db()
+        assert test_session.not_tested_count == 0
+        assert test_session.fail_count == 1
+        assert test_session.skipped_count == 2
+        assert test_session.completed_at is not None
+
+    def test_rebuild_session_counters(self, test_session):
+        TestSession.objects.filter(pk=test_session.pk).update(
+            not_tested_count=0, pass_count=10
+        )
+        call_command("rebuild_session_counters")
+        test_session.refresh_from_db()
+        assert test_session.not_tested_count == 3
+        assert test_session.pass_count == 0
+
+
+@pytest.mark.django_db
+class TestTestExecutionStats:
+    @pytest.fixture
+    def sessions(self):
+        project = Project.objects.create(name="テストプロジェクト")
+        suite1 = TestSuite.objects.create(project=project, name="スイート1")
+        suite2 = TestSuite.objects.create(project=project, name="スイート2")
+        case1 = TestCase.objects.create(suite=suite1, title="ケース1")
+        case2 = TestCase.objects.create(suite=suite2, title="ケース2")
+        session1 = TestSession.objects.create(project=project, name="セッション1")
+        session2 = TestSession.objects.create(project=project, name="セッション2")
+        TestExecution.objects.create(
+            test_session=session1, test_case=case1, status="PASS"
+        )
+        TestExecution.objects.create(
+            test_session=session1, test_case=case2, status="FAIL"
+        )
+        TestExecution.objects.create(test_session=session2, test_case=case1)
+        return session1, session2, suite1, suite2
+
+    def test_status_stats(self, sessions, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            stats = TestExecution.objects.status_stats()
+        assert stats["pass_count"] == 1
+        assert stats["fail_count"] == 1
+        assert stats["not_tested_count"] == 1
+        assert stats["total_count"] == 3
+        assert stats["completed_count"] == 2
+        assert stats["pass_percentage"] == 33
+
+    def test_status_stats_group_by(self, sessions, django_assert_num_queries):
+        session1, session2, suite1, suite2 = sessions
+        with django_assert_num_queries(1):
+            by_session = TestExecution.objects.status_stats(group_by="session")
+        assert by_session[session1.pk]["total_count"] == 2
+        assert by_session[session1.pk]["pass_percentage"] == 50
+        assert by_session[session2.pk]["not_tested_count"] == 1
+
+        by_suite = TestExecution.objects.status_stats(group_by="suite")
+        assert by_suite[suite1.pk]["pass_count"] == 1
+        assert by_suite[suite1.pk]["total_count"] == 2
+        assert by_suite[suite2.pk]["fail_count"] == 1
+
+    def test_status_stats_empty(self):
+        stats = TestExecution.objects.status_stats()
+        assert stats["total_count"] == 0
+        assert stats["pass_percentage"] == 0
+
+
+@pytest.mark.django_db
+class TestInitializeExecutions:
+    @pytest.fixture
+    def suite(self):
+        project = Project.objects.create(name="テストプロジェクト")
+        suite = TestSuite.objects.create(project=project, name="テストスイート1")
+        for i in range(5):
+            TestCase.objects.create(suite=suite, title=f"ケース{i}")
+        return suite
+
+    def test_initialize_executions(self, suite, django_assert_max_num_queries):
+        test_session = TestSession.objects.create(
+            project=suite.project, name="セッション", environment="Chrome"
+        )
+        with django_assert_max_num_queries(7):
+            test_session.initialize_executions(TestCase.objects.filter(suite=suite))
+        assert test_session.executions.count() == 5
+        assert test_session.executions.filter(environment="Chrome").count() == 5
+        assert test_session.not_tested_count == 5
+
+    def test_initialize_executions_positions(self, suite):
+        test_session = TestSession.objects.create(
+            project=suite.project, name="セッション"
+        )
+        cases = list(TestCase.objects.filter(suite=suite).order_by("-pk"))
+        test_session.initialize_executions(cases[:3])
+        # save()で作成した場合も末尾に追加される
+        TestExecution.objects.create(test_session=test_session, test_case=cases[3])
+        test_session.initialize_executions(cases[4:])
+
+        executions = list(test_session.executions.all())
+        assert [e.test_case_id for e in executions] == [c.pk for c in cases]
+        assert [e.position for e in executions] == [1, 2, 3, 4, 5]
+        assert test_session.get_next_execution() == executions[0]
+        assert test_session.get_execution_number(executions[3]) == 4
+
+    def test_initialize_executions_ignores_existing(self, suite):
+        test_session = TestSession.objects.create(
+            project=suite.project, name="セッション"
+        )
+        cases = list(TestCase.objects.filter(suite=suite))
+        test_session.initialize_executions(cases[:2])
+        test_session.initialize_executions(cases)
+        assert test_session.executions.count() == 5
+        test_session.refresh_from_db()
+        assert test_session.not_tested_count == 5
+
+    def test_benchmark_initialize_executions(self, suite):
+        out = io.StringIO()
+        call_command(
+            "benchmark_initialize_executions",
+            "--sizes",
+            "10",
+            "--compare-legacy",
+            stdout=out,
+        )
+        assert "10" in out.getvalue()
+        # 計測用のデータはロールバックされる
+        assert Project.objects.count() == 1
+
+    def test_benchmark(self, suite, tmp_path):
+        output = tmp_path / "result.json"
+        call_command(
+            "benchmark",
+            "--scale",
+            "0.2",
+            "--iterations",
+            "2",
+            "--warmup",
+            "0",
+            "--scenarios",
+            "csv_import,session_create,execute_loop,api_suite_list",
+            "--output",
+            str(output),
+            stderr=io.StringIO(),
+        )
+        result = json.loads(output.read_text(encoding="utf-8"))
+        assert result["data"]["projects"] == 1
+        assert set(result["scenarios"]) == {
+            "csv_import",
+            "session_create",
+            "execute_loop",
+            "api_suite_list",
+        }
+        for metrics in result["scenarios"].values():
+            assert metrics["ops_per_sec"] > 0
+            assert metrics["p50_ms"] <= metrics["p95_ms"] <= metrics["p99_ms"]
+            assert metrics["peak_memory_kb"] > 0
+        # 合成データはロールバックされる
+        assert Project.objects.count() == 1
+        assert TestSession.objects.count() == 0
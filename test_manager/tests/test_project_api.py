@@ -1,7 +1,19 @@
+import datetime
+
 import pytest
+from django.core.exceptions import ImproperlyConfigured
 from django.urls import reverse
-from rest_framework import status
-from test_manager.models import Project, TestSuite, TestCase, TestSession, TestExecution
+from django.utils import timezone
+from rest_framework import generics, status
+from test_manager.api import ValuesListMixin
+from test_manager.models import (
+    Project,
+    TestSuite,
+    TestCase,
+    TestStep,
+    TestSession,
+    TestExecution,
+)
 
 
 @pytest.fixture
@@ -38,14 +50,14 @@ def test_get_project_list(api_client, project):
     url = reverse("project-list")
     response = api_client.get(url)
     assert response.status_code == status.HTTP_200_OK
-    assert response.data[0]["name"] == "Test Project"
+    assert response.data["results"][0]["name"] == "Test Project"
 
 
 def test_get_project_test_suite_list(api_client, project, test_suite):
     url = reverse("project-test-suite-list", kwargs={"project_id": project.id})
     response = api_client.get(url)
     assert response.status_code == status.HTTP_200_OK
-    assert response.data[0]["name"] == "Test Suite"
+    assert response.data["results"][0]["name"] == "Test Suite"
 
 
 def test_get_project_test_suite_list_with_test_cases(
@@ -57,6 +69,122 @@ def test_get_project_test_suite_list_with_test_cases(
     )
     response = api_client.get(url)
     assert response.status_code == status.HTTP_200_OK
-    assert response.data[0]["name"] == "Test Suite"
-    assert len(response.data[0]["test_cases"]) == 1
-    assert response.data[0]["test_cases"][0]["title"] == "Test Case"
+    assert response.data["results"][0]["name"] == "Test Suite"
+    assert len(response.data["results"][0]["test_cases"]) == 1
+    assert response.data["results"][0]["test_cases"][0]["title"] == "Test Case"
+
+
+def test_get_project_list_conditional(api_client, project):
+    url = reverse("project-list")
+    response = api_client.get(url)
+    etag = response["ETag"]
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+
+    Project.objects.create(name="Another Project")
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data["results"]) == 2
+
+
+def test_get_project_test_suite_list_conditional(
+    api_client, project, test_suite, test_case
+):
+    url = reverse("project-test-suite-list", kwargs={"project_id": project.id})
+    etag = api_client.get(url)["ETag"]
+    etag_with_cases = api_client.get(url, {"include_cases": "true"})["ETag"]
+    # クエリパラメータが異なれば内容も異なるため、別のETagとなる
+    assert etag != etag_with_cases
+
+    test_case.title = "Updated Test Case"
+    test_case.save()
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    response = api_client.get(
+        url, {"include_cases": "true"}, HTTP_IF_NONE_MATCH=etag_with_cases
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["results"][0]["test_cases"][0]["title"] == "Updated Test Case"
+
+
+def test_get_project_list_pagination(api_client):
+    Project.objects.bulk_create(Project(name=f"Project {i:02}") for i in range(60))
+    response = api_client.get(reverse("project-list"))
+    assert len(response.data["results"]) == 50
+    response = api_client.get(response.data["next"])
+    assert [p["name"] for p in response.data["results"]] == [
+        f"Project {i}" for i in range(50, 60)
+    ]
+    assert response.data["next"] is None
+
+
+def test_get_project_test_suite_list_filters(api_client, project, test_suite):
+    old_suite = TestSuite.objects.create(project=project, name="Old Suite")
+    TestSuite.objects.filter(pk=old_suite.pk).update(
+        updated_at=timezone.now() - datetime.timedelta(days=10)
+    )
+    url = reverse("project-test-suite-list", kwargs={"project_id": project.id})
+    response = api_client.get(url, {"updated_from": timezone.localdate().isoformat()})
+    assert [s["name"] for s in response.data["results"]] == ["Test Suite"]
+    response = api_client.get(url, {"updated_to": "2000-01-01"})
+    assert response.data["results"] == []
+    response = api_client.get(url, {"updated_to": "invalid"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "updated_to" in response.data
+
+
+@pytest.fixture
+def suite_tree(project):
+    for i in range(3):
+        suite = TestSuite.objects.create(project=project, name=f"Suite {i}")
+        for j in range(3):
+            case = TestCase.objects.create(suite=suite, title=f"Case {j}")
+            for order in (2, 1):
+                TestStep.objects.create(
+                    test_case=case, order=order, description=f"Step {order}"
+                )
+
+
+def test_get_project_test_suite_list_prefetches_tree(
+    api_client, project, suite_tree, django_assert_num_queries
+):
+    url = reverse("project-test-suite-list", kwargs={"project_id": project.id})
+    # 認証、ETagの状態、スイート、テストケース、ステップの5回で、スイートやケースの数によらない
+    with django_assert_num_queries(5):
+        response = api_client.get(url, {"include_cases": "true"})
+    suites = response.data["results"]
+    assert [len(suite["test_cases"]) for suite in suites] == [3, 3, 3]
+    steps = suites[0]["test_cases"][0]["steps"]
+    assert [step["description"] for step in steps] == ["Step 1", "Step 2"]
+
+
+def test_get_project_test_suite_list_without_steps(api_client, project, suite_tree):
+    url = reverse("project-test-suite-list", kwargs={"project_id": project.id})
+    for params in [
+        {"include_cases": "true", "include_steps": "false"},
+        {"include_cases": "true", "depth": "1"},
+    ]:
+        response = api_client.get(url, params)
+        case = response.data["results"][0]["test_cases"][0]
+        assert case["title"] == "Case 0"
+        assert "steps" not in case
+
+    response = api_client.get(url, {"include_cases": "true", "depth": "0"})
+    assert response.data["results"][0]["test_cases"] is None
+
+
+def test_get_project_test_suite_list_invalid_depth(api_client, project):
+    url = reverse("project-test-suite-list", kwargs={"project_id": project.id})
+    for depth in ["-1", "all"]:
+        response = api_client.get(url, {"include_cases": "true", "depth": depth})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_values_list_mixin_requires_build_data():
+    # 指定漏れはリクエスト時ではなくクラスの定義時に検出する
+    with pytest.raises(ImproperlyConfigured):
+
+        class ProjectNames(ValuesListMixin, generics.ListAPIView):
+            queryset = Project.objects.all()
+            value_fields = ["id", "name"]
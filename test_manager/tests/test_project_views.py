@@ -3,7 +3,12 @@ from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
-from test_manager.models import Project
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.views.generic import DetailView
+from test_manager.mixins import FragmentCacheMixin
+from test_manager.models import Project, TestSuite, TestCase, TestSession
 
 User = get_user_model()
 
@@ -33,6 +38,83 @@ class TestProjectViews:
         # 「テストラン」という文字列が含まれていないことを確認
         assert "テストラン" not in str(response.content)
 
+    def test_project_list_pagination(self, client, user):
+        for i in range(25):
+            Project.objects.create(name=f"プロジェクト{i:02}")
+        client.login(username="testuser", password="testpass")
+        response = client.get(reverse("project_list"))
+        page = response.context["page_obj"]
+        assert len(response.context["projects"]) == 20
+        assert page.has_next
+        response = client.get(f"{reverse('project_list')}?{page.next_query}")
+        assert [p.name for p in response.context["projects"]] == [
+            f"プロジェクト{i}" for i in range(20, 25)
+        ]
+        assert not response.context["page_obj"].has_next
+
+    def _create_project(self, name, cases=2):
+        project = Project.objects.create(name=name)
+        suite = TestSuite.objects.create(project=project, name="スイート")
+        for i in range(cases):
+            TestCase.objects.create(suite=suite, title=f"ケース{i}")
+        test_session = TestSession.objects.create(project=project, name="セッション")
+        test_session.initialize_executions(TestCase.objects.filter(suite=suite))
+        return project, suite, test_session
+
+    def _count_list_queries(self, client):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse("project_list"))
+        assert response.status_code == 200
+        return len(queries)
+
+    def test_project_list_queries_do_not_grow(self, client, user):
+        client.login(username="testuser", password="testpass")
+        self._create_project("プロジェクト0")
+        cold = self._count_list_queries(client)
+        warm = self._count_list_queries(client)
+        # 2回目は集計値がキャッシュされている
+        assert warm == cold - 2
+
+        for i in range(1, 6):
+            self._create_project(f"プロジェクト{i}")
+        assert self._count_list_queries(client) == cold
+        assert self._count_list_queries(client) == warm
+
+    def test_project_list_summary(self, client, user):
+        client.login(username="testuser", password="testpass")
+        project, suite, test_session = self._create_project("プロジェクト", cases=3)
+        response = client.get(reverse("project_list"))
+        listed = response.context["projects"][0]
+        assert listed.suite_count == 1
+        assert listed.case_count == 3
+        assert listed.latest_session["id"] == test_session.pk
+        assert listed.latest_session["completed_count"] == 0
+        assert listed.latest_session["total_count"] == 3
+
+        # ケースの追加と実行結果の記録でキャッシュが破棄される
+        TestCase.objects.create(suite=suite, title="追加したケース")
+        execution = test_session.executions.first()
+        execution.status = "PASS"
+        execution.save()
+        response = client.get(reverse("project_list"))
+        listed = response.context["projects"][0]
+        assert listed.case_count == 4
+        assert listed.latest_session["completed_count"] == 1
+
+        # 新しいセッションが最新のセッションになる
+        new_session = TestSession.objects.create(
+            project=project, name="新しいセッション"
+        )
+        response = client.get(reverse("project_list"))
+        assert response.context["projects"][0].latest_session["id"] == new_session.pk
+
+        # スイートの削除でスイート数とケース数が更新される
+        suite.delete()
+        response = client.get(reverse("project_list"))
+        listed = response.context["projects"][0]
+        assert listed.suite_count == 0
+        assert listed.case_count == 0
+
     def test_project_create_view(self, client, user):
         client.login(username="testuser", password="testpass")
         url = reverse("project_create")
@@ -62,3 +144,97 @@ class TestProjectViews:
         assert response.status_code == 302
         project.refresh_from_db()
         assert project.name == "Updated Project"
+
+    def test_project_detail_fragment_cache(self, client, user):
+        client.login(username="testuser", password="testpass")
+        project, suite, _ = self._create_project("プロジェクト")
+        url = reverse("project_detail", kwargs={"pk": project.pk})
+        with CaptureQueriesContext(connection) as cold:
+            client.get(url)
+        with CaptureQueriesContext(connection) as warm:
+            response = client.get(url)
+        # スイートとケースの一覧はキャッシュされる
+        assert len(warm) == len(cold) - 2
+        assert "ケース0" in response.content.decode()
+
+        # ケースの追加でキャッシュが無効になる
+        TestCase.objects.create(suite=suite, title="追加したケース")
+        assert "追加したケース" in client.get(url).content.decode()
+
+        # 権限が異なるユーザーには別のキャッシュが使われる
+        assert reverse("case_create", args=[suite.pk]) not in response.content.decode()
+        user.user_permissions.add(
+            Permission.objects.get(codename="edit_tests"),
+        )
+        response = client.get(url)
+        assert reverse("case_create", args=[suite.pk]) in response.content.decode()
+
+    def test_fragment_cache_with_file_backend(self, client, user, settings, tmp_path):
+        settings.CACHES = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": str(tmp_path),
+            }
+        }
+        client.login(username="testuser", password="testpass")
+        project, suite, _ = self._create_project("プロジェクト")
+        for url in [
+            reverse("project_detail", kwargs={"pk": project.pk}),
+            reverse("suite_detail", kwargs={"pk": suite.pk}),
+        ]:
+            assert "ケース1" in client.get(url).content.decode()
+        assert any(tmp_path.iterdir())
+
+        case = TestCase.objects.get(suite=suite, title="ケース1")
+        case.title = "変更したケース"
+        case.save()
+        for url in [
+            reverse("project_detail", kwargs={"pk": project.pk}),
+            reverse("suite_detail", kwargs={"pk": suite.pk}),
+        ]:
+            assert "変更したケース" in client.get(url).content.decode()
+
+    def test_fragment_cache_mixin_requires_project_id(self):
+        # 指定漏れはリクエスト時ではなくクラスの定義時に検出する
+        with pytest.raises(ImproperlyConfigured):
+
+            class ProjectView(FragmentCacheMixin, DetailView):
+                model = Project
+
+    def test_detail_views_conditional_get(self, client, user):
+        client.login(username="testuser", password="testpass")
+        project, suite, test_session = self._create_project("プロジェクト")
+        case = TestCase.objects.get(suite=suite, title="ケース0")
+        urls = [
+            reverse("project_detail", kwargs={"pk": project.pk}),
+            reverse("suite_detail", kwargs={"pk": suite.pk}),
+            reverse("case_detail", kwargs={"pk": case.pk}),
+        ]
+        # 初回のアクセスでCSRFトークンのCookieが発行され、ETagに含まれる
+        client.get(urls[0])
+        etags = [client.get(url)["ETag"] for url in urls]
+        for url, etag in zip(urls, etags):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == 304
+
+        # 実行結果の記録で、いずれの画面の内容も変わる
+        execution = test_session.executions.get(test_case=case)
+        execution.status = "PASS"
+        execution.save()
+        for url, etag in zip(urls, etags):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == 200
+
+    def test_detail_views_etag_per_user(self, client, user):
+        project, _, _ = self._create_project("プロジェクト")
+        url = reverse("project_detail", kwargs={"pk": project.pk})
+        client.login(username="testuser", password="testpass")
+        etag = client.get(url)["ETag"]
+
+        # 権限が変わると表示されるボタンが変わるため、304を返さない
+        user.user_permissions.add(Permission.objects.get(codename="edit_tests"))
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+        User.objects.create_user(username="other", password="otherpass")
+        client.login(username="other", password="otherpass")
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
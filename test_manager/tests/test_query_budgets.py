@@ -0,0 +1,359 @@
+"""URLごとのSQLクエリ数と処理時間の上限（バジェット）を検証する性能テスト。
+
+実運用に近い件数のデータを一度だけ作成し、各URLへのリクエストが
+バジェットを超えた場合は、実行されたクエリを表示して失敗する。
+データの作成に時間がかかるため、`perf` マーカーを付けて通常のテストとは分けて実行する
+
+    uv run pytest -m perf
+"""
+
+import io
+import os
+import time
+from collections import Counter
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from test_manager.models import ImportJob
+from test_manager.synthetic_data import generate_synthetic_data
+from test_manager.views_csv import EXPORT_CHUNK_SIZE
+
+pytestmark = [pytest.mark.perf, pytest.mark.django_db]
+
+User = get_user_model()
+
+PROJECTS = 50
+SUITES_PER_PROJECT = 4
+CASES_PER_SUITE = 100
+STEPS_PER_CASE = 5
+SESSIONS_PER_PROJECT = 10
+
+
+def _chunks(rows):
+    """CSVエクスポートでrows件をEXPORT_CHUNK_SIZE件ずつ読み込む際のクエリ数"""
+    return rows // EXPORT_CHUNK_SIZE + 1
+
+
+# 処理時間の上限に掛ける係数。遅い環境ではPERF_LATENCY_FACTORで緩める
+LATENCY_FACTOR = float(os.getenv("PERF_LATENCY_FACTOR", "1"))
+
+
+def _seed():
+    """50プロジェクト、200スイート、2万ケース、10万ステップ、500セッションを作成する"""
+    created = generate_synthetic_data(
+        projects=PROJECTS,
+        suites_per_project=SUITES_PER_PROJECT,
+        cases_per_suite=CASES_PER_SUITE,
+        steps_per_case=STEPS_PER_CASE,
+        sessions_per_project=SESSIONS_PER_PROJECT,
+    )
+    projects = created["projects"]
+    suites = created["suites"]
+    cases = created["cases"]
+    sessions = created["sessions"]
+
+    user = User.objects.create_superuser(
+        username="admin", email="admin@example.com", password="adminpass"
+    )
+    session = sessions[0]
+    return {
+        "user": user,
+        "token": Token.objects.create(user=user),
+        "project": projects[0],
+        "suite": suites[0],
+        "case": cases[0],
+        "session": session,
+        "next_case": session.get_next_execution().test_case,
+        "import_job": ImportJob.objects.create(file_name="a.csv", content=""),
+    }
+
+
+@pytest.fixture(scope="module")
+def data(django_db_setup, django_db_blocker):
+    # setUpTestDataと同様に、モジュール全体を1つのトランザクションで囲み、最後にロールバックする
+    with django_db_blocker.unblock():
+        atomic = transaction.atomic()
+        atomic.__enter__()
+        try:
+            yield _seed()
+        finally:
+            transaction.set_rollback(True)
+            atomic.__exit__(None, None, None)
+
+
+def _endpoint(
+    url_name,
+    max_queries,
+    max_ms,
+    method="GET",
+    kwargs=None,
+    params=None,
+    body=None,
+):
+    return pytest.param(
+        url_name,
+        method,
+        kwargs or {},
+        params,
+        body,
+        max_queries,
+        max_ms,
+        id=f"{method} {url_name}",
+    )
+
+
+# URL名ごとのクエリ数と処理時間(ms)の上限。
+# kwargsの値はdataのキーで、そのオブジェクトのpkをURLの引数とする。
+# paramsとbodyが関数の場合はdataを渡して作成する。
+ENDPOINTS = [
+    _endpoint("admin_dashboard", 2, 200),
+    _endpoint("csv_management", 3, 300),
+    # 全体を通して行をEXPORT_CHUNK_SIZE件ずつ読み込み、ケースのチャンクごとにステップを読み込む
+    _endpoint(
+        "csv_export",
+        2
+        + _chunks(PROJECTS)
+        + _chunks(PROJECTS * SUITES_PER_PROJECT)
+        + 2 * _chunks(PROJECTS * SUITES_PER_PROJECT * CASES_PER_SUITE),
+        2000,
+    ),
+    _endpoint("project_csv_export", 7, 300, kwargs={"project_id": "project"}),
+    _endpoint("import_job_status", 3, 300, kwargs={"pk": "import_job"}),
+    _endpoint(
+        "csv_import",
+        3,
+        300,
+        method="POST",
+        body=lambda data: {"file": _csv_file()},
+    ),
+    _endpoint("user_list", 3, 300),
+    _endpoint("user_update", 3, 300, kwargs={"pk": "user"}),
+    _endpoint("user_token_manage", 4, 300, kwargs={"pk": "user"}),
+    _endpoint("user_token_manage", 5, 300, method="POST", kwargs={"pk": "user"}),
+    _endpoint("project_list", 6, 300),
+    _endpoint("project_create", 2, 300),
+    _endpoint("project_detail", 18, 300, kwargs={"pk": "project"}),
+    _endpoint("project_update", 6, 300, kwargs={"pk": "project"}),
+    _endpoint(
+        "project_members",
+        6,
+        300,
+        method="POST",
+        kwargs={"pk": "project"},
+        body=lambda data: {"user": data["user"].pk, "permissions": ["edit_tests"]},
+    ),
+    _endpoint(
+        "project_members_remove",
+        6,
+        300,
+        method="POST",
+        kwargs={"pk": "project"},
+        body=lambda data: {"user": data["user"].pk},
+    ),
+    _endpoint("suite_create", 2, 300, kwargs={"pk": "project"}),
+    _endpoint("suite_detail", 7, 200, kwargs={"pk": "suite"}),
+    _endpoint("suite_update", 3, 300, kwargs={"pk": "suite"}),
+    _endpoint("suite_delete", 4, 300, kwargs={"pk": "suite"}),
+    _endpoint("case_create", 2, 300, kwargs={"suite_pk": "suite"}),
+    _endpoint("case_detail", 9, 300, kwargs={"pk": "case"}),
+    _endpoint("step_list", 4, 300, kwargs={"case_pk": "case"}),
+    _endpoint("case_update", 4, 300, kwargs={"pk": "case"}),
+    _endpoint("case_delete", 5, 300, kwargs={"pk": "case"}),
+    # キーセットページネーションで1ページ分だけ読み込むため、件数によらない
+    _endpoint("case_list", 4, 100),
+    _endpoint(
+        "case_list",
+        4,
+        100,
+        params={"status": "ACTIVE", "priority": "MEDIUM", "sort": "title"},
+    ),
+    _endpoint(
+        "case_list",
+        7,
+        100,
+        params=lambda data: {
+            "project": data["project"].pk,
+            "suite": data["suite"].pk,
+            "updated_from": "2000-01-01",
+        },
+    ),
+    _endpoint("suite_list", 4, 100),
+    _endpoint("search", 6, 100, params={"q": "ケース1 手順3"}),
+    _endpoint(
+        "search",
+        7,
+        100,
+        params=lambda data: {"q": "手順", "project": data["project"].pk},
+    ),
+    _endpoint("execution_create", 7, 300, kwargs={"case_pk": "case"}),
+    _endpoint("test_session_create", 14, 300, kwargs={"pk": "project"}),
+    _endpoint(
+        "test_session_create",
+        17,
+        300,
+        method="POST",
+        kwargs={"pk": "project"},
+        body=lambda data: {
+            "name": "新しいセッション",
+            "selected_cases": list(
+                data["suite"].test_cases.values_list("pk", flat=True)
+            ),
+        },
+    ),
+    _endpoint("test_session_execute", 9, 300, kwargs={"pk": "session"}),
+    _endpoint(
+        "test_session_execute",
+        9,
+        300,
+        method="POST",
+        kwargs={"pk": "session"},
+        body=lambda data: {"test_case_id": data["next_case"].pk, "status": "PASS"},
+    ),
+    _endpoint("test_session_executions", 4, 300, kwargs={"pk": "session"}),
+    _endpoint(
+        "test_session_skip_all", 11, 300, method="POST", kwargs={"pk": "session"}
+    ),
+    _endpoint("test_session_detail", 4, 300, kwargs={"pk": "session"}),
+    _endpoint("test_session_list", 4, 300),
+    _endpoint(
+        "test_session_list",
+        5,
+        300,
+        params=lambda data: {"project": data["project"].pk, "state": "running"},
+    ),
+    _endpoint("schema", 4, 500),
+    _endpoint("swagger-ui", 1, 300),
+    _endpoint("redoc", 0, 300),
+    _endpoint(
+        "api_token_auth",
+        3,
+        1500,
+        method="POST",
+        body=lambda data: {"username": "admin", "password": "adminpass"},
+    ),
+    _endpoint("project-list", 3, 300),
+    _endpoint("project-test-suite-list", 3, 300, kwargs={"project_id": "project"}),
+    _endpoint(
+        "project-test-suite-list",
+        5,
+        300,
+        kwargs={"project_id": "project"},
+        params={"include_cases": "true"},
+    ),
+    _endpoint(
+        "project-test-suite-list",
+        4,
+        300,
+        kwargs={"project_id": "project"},
+        params={"include_cases": "true", "include_steps": "false"},
+    ),
+    _endpoint("testcase-detail", 4, 300, kwargs={"pk": "case"}),
+    _endpoint("testcase-search", 4, 100, params={"q": "ケース1 手順3"}),
+    _endpoint("test-session-create", 3, 200, kwargs={"project_id": "project"}),
+    _endpoint(
+        "test-session-create",
+        3,
+        200,
+        kwargs={"project_id": "project"},
+        params={"state": "running", "started_from": "2000-01-01"},
+    ),
+    _endpoint("execute-test-case", 4, 300, kwargs={"test_session_id": "session"}),
+    _endpoint(
+        "execute-test-case",
+        11,
+        300,
+        method="POST",
+        kwargs={"test_session_id": "session"},
+        body=lambda data: {"test_case_id": data["next_case"].pk, "status": "PASS"},
+    ),
+    _endpoint(
+        "execute-test-cases-bulk",
+        9,
+        1500,
+        method="POST",
+        kwargs={"test_session_id": "session"},
+        body=lambda data: {
+            "results": [
+                {"test_case_id": case_id, "status": "PASS"}
+                for case_id in data["session"].executions.values_list(
+                    "test_case_id", flat=True
+                )
+            ]
+        },
+    ),
+]
+
+
+def _csv_file():
+    content = (
+        "project_name,type,parent,name,description,order,status,priority,"
+        "prerequisites,expected_result\n"
+        "プロジェクト0,suite,プロジェクト0,スイート0,更新,,,,,\n"
+    )
+    f = io.BytesIO(content.encode("utf-8"))
+    f.name = "test_data.csv"
+    return f
+
+
+@pytest.mark.parametrize(
+    "url_name, method, kwargs, params, body, max_queries, max_ms", ENDPOINTS
+)
+def test_query_budget(
+    client, data, url_name, method, kwargs, params, body, max_queries, max_ms
+):
+    client.force_login(data["user"])
+    url = reverse(url_name, kwargs={k: data[v].pk for k, v in kwargs.items()})
+    headers = {}
+    if url_name.startswith("api_") or "-" in url_name:
+        headers["HTTP_AUTHORIZATION"] = f"Token {data['token'].key}"
+    if callable(params):
+        params = params(data)
+    if callable(body):
+        body = body(data)
+
+    queries = []
+    with connection.execute_wrapper(_recorder(queries)):
+        start = time.perf_counter()
+        if method == "GET":
+            response = client.get(url, params, **headers)
+        elif url_name.startswith("api_") or "-" in url_name:
+            response = client.post(
+                url, body, content_type="application/json", **headers
+            )
+        else:
+            response = client.post(url, body or {}, **headers)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+    assert response.status_code < 400, response
+    max_ms *= LATENCY_FACTOR
+    if len(queries) > max_queries or elapsed_ms > max_ms:
+        pytest.fail(
+            f"{method} {url_name}: {len(queries)} queries (budget {max_queries}), "
+            f"{elapsed_ms:.0f}ms (budget {max_ms:.0f}ms)\n" + _format_queries(queries),
+            pytrace=False,
+        )
+
+
+def _recorder(queries):
+    """実行されたSQLをqueriesに追加する。
+    CaptureQueriesContextは9000件までしか記録しないため、execute_wrapperで数える"""
+
+    def wrapper(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    return wrapper
+
+
+def _format_queries(queries, limit=50):
+    """実行されたクエリを、N+1を見つけやすいように同じSQLの回数とともに一覧にする"""
+    counts = Counter(queries)
+    lines = [f"{count:>5} x {sql}" for sql, count in counts.most_common(limit)]
+    if len(counts) > limit:
+        lines.append(f"... 他 {len(counts) - limit} 種類のクエリ")
+    return "\n".join(lines)
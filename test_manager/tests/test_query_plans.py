@@ -0,0 +1,76 @@
+import re
+
+import pytest
+from django.db import connection
+from test_manager.models import Project, TestSuite, TestCase, TestSession, TestExecution
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(
+        connection.vendor != "sqlite", reason="EXPLAIN QUERY PLANの形式はSQLite固有"
+    ),
+]
+
+# インデックスを使わないテーブルの全件走査（"SCAN table USING INDEX ..." は除く）
+FULL_SCAN = re.compile(r"\bSCAN (test_manager_testexecution|test_manager_testsession)$")
+
+
+@pytest.fixture
+def data():
+    project = Project.objects.create(name="テストプロジェクト")
+    suite = TestSuite.objects.create(project=project, name="テストスイート1")
+    test_session = TestSession.objects.create(project=project, name="セッション")
+    cases = [TestCase.objects.create(suite=suite, title=f"ケース{i}") for i in range(3)]
+    test_session.initialize_executions(cases)
+    return project, test_session, cases[0]
+
+
+def _plan(queryset):
+    plan = queryset.explain()
+    for line in plan.splitlines():
+        assert not FULL_SCAN.search(line.strip()), plan
+    return plan
+
+
+def test_next_execution(data):
+    _, test_session, _ = data
+    plan = _plan(test_session.executions.filter(status="NOT_TESTED"))
+    assert "execution_session_status_idx" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_execution_status_stats(data):
+    _, test_session, _ = data
+    plan = _plan(
+        TestExecution.objects.filter(test_session=test_session)
+        .values("test_session_id", "status")
+        .order_by()
+    )
+    assert "execution_session_status_idx" in plan
+
+
+def test_case_execution_history(data):
+    _, _, case = data
+    plan = _plan(case.executions.order_by("-executed_at"))
+    assert "execution_case_executed_idx" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_project_recent_executions(data):
+    project, _, _ = data
+    _plan(
+        TestExecution.objects.filter(test_session__project=project)
+        .select_related("test_case", "test_session")
+        .order_by("-executed_at")[:10]
+    )
+
+
+def test_recent_sessions(data):
+    project, _, _ = data
+    plan = _plan(TestSession.objects.order_by("-started_at")[:10])
+    assert "session_started_idx" in plan
+    assert "TEMP B-TREE" not in plan
+
+    plan = _plan(TestSession.objects.filter(project=project).order_by("-started_at"))
+    assert "session_project_started_idx" in plan
+    assert "TEMP B-TREE" not in plan
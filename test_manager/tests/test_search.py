@@ -0,0 +1,268 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from test_manager import search
+from test_manager.csv_importer import CSVImporter
+from test_manager.models import Project, TestSuite, TestCase, TestStep
+from test_manager.tests.test_csv_importer import _case, _project, _rows, _step, _suite
+
+User = get_user_model()
+
+
+def _titles(query, project=None):
+    results = search.search_test_cases(query, project)
+    return [case.title for case in results[: results.count()]]
+
+
+@pytest.fixture(params=["fts", "queryset"])
+def backend(request, monkeypatch):
+    """FTS5のインデックスとicontainsの両方で同じ結果になることを確認する"""
+    if request.param == "queryset":
+        monkeypatch.setattr(search, "uses_fts", lambda: False)
+    return request.param
+
+
+@pytest.fixture
+def project(db):
+    return Project.objects.create(name="ECサイト")
+
+
+@pytest.fixture
+def suite(project):
+    return TestSuite.objects.create(project=project, name="ログイン")
+
+
+@pytest.fixture
+def cases(suite):
+    login = TestCase.objects.create(
+        suite=suite,
+        title="パスワード認証でログインする",
+        description="登録済みのユーザーでログインする",
+    )
+    TestStep.objects.create(
+        test_case=login,
+        order=1,
+        description="ログイン画面でメールアドレスとパスワードを入力する",
+        expected_result="マイページが表示される",
+    )
+    reset = TestCase.objects.create(
+        suite=suite,
+        title="パスワードを再設定する",
+        description="再設定メールのリンクから変更する",
+        prerequisites="メールを受信できること",
+    )
+    TestStep.objects.create(
+        test_case=reset,
+        order=1,
+        description="再設定画面で新しいパスワードを入力する",
+        expected_result="ログイン画面に戻る",
+    )
+    logout = TestCase.objects.create(
+        suite=suite, title="ログアウトする", description="ヘッダーのボタンから"
+    )
+    return login, reset, logout
+
+
+@pytest.mark.django_db
+class TestSearch:
+    def test_search_japanese_text_in_steps(self, backend, cases):
+        assert _titles("マイページ") == ["パスワード認証でログインする"]
+        assert _titles("メールアドレス") == ["パスワード認証でログインする"]
+
+    def test_search_all_terms(self, backend, cases):
+        assert set(_titles("パスワード")) == {
+            "パスワード認証でログインする",
+            "パスワードを再設定する",
+        }
+        assert _titles("パスワード 再設定メール") == ["パスワードを再設定する"]
+        assert _titles("パスワード 存在しない語") == []
+
+    def test_search_short_terms(self, backend, cases):
+        # trigramで索引を引けない2文字以下の語も検索できる
+        assert set(_titles("画面")) == {
+            "パスワード認証でログインする",
+            "パスワードを再設定する",
+        }
+        assert _titles("画面 戻る") == ["パスワードを再設定する"]
+        assert _titles("%") == []
+
+    def test_title_match_ranked_first(self, backend, cases):
+        # タイトルに含むケースを、ステップにのみ含むケースより先に返す
+        assert _titles("ログイン") == [
+            "パスワード認証でログインする",
+            "パスワードを再設定する",
+        ]
+        results = search.search_test_cases("ログアウト")
+        assert results[0].title == "ログアウトする"
+        assert results[0].search_rank > 0
+
+    def test_too_many_results_not_ranked(self, cases, monkeypatch):
+        # 該当件数がRANK_LIMITを超える場合は関連度で並べ替えず新しい順とする
+        monkeypatch.setattr(search, "RANK_LIMIT", 1)
+        results = search.search_test_cases("ログイン")
+        assert [case.title for case in results[0:2]] == [
+            "パスワードを再設定する",
+            "パスワード認証でログインする",
+        ]
+
+    def test_filter_by_project(self, backend, cases, project):
+        other = Project.objects.create(name="別のプロジェクト")
+        other_suite = TestSuite.objects.create(project=other, name="ログイン")
+        TestCase.objects.create(suite=other_suite, title="ログアウトする")
+        assert len(_titles("ログアウト")) == 2
+        assert _titles("ログアウト", project) == ["ログアウトする"]
+        assert _titles("ログアウト", other) == ["ログアウトする"]
+
+    def test_empty_query(self, backend, cases):
+        results = search.search_test_cases("   ")
+        assert results.count() == 0
+        assert results[0:20] == []
+
+    def test_snippet(self, backend, cases):
+        results = search.search_test_cases("マイページ")
+        assert ("マイページ", True) in results[0].search_snippet
+
+    def test_index_follows_changes(self, cases, suite):
+        login, reset, logout = cases
+        login.title = "SSOでサインインする"
+        login.save()
+        assert _titles("サインイン") == ["SSOでサインインする"]
+
+        step = reset.steps.get()
+        step.expected_result = "完了メッセージが表示される"
+        step.save()
+        assert _titles("完了メッセージ") == ["パスワードを再設定する"]
+        TestStep.objects.create(test_case=logout, order=1, description="確認ダイアログ")
+        assert _titles("確認ダイアログ") == ["ログアウトする"]
+
+        step.delete()
+        assert _titles("完了メッセージ") == []
+        login.delete()
+        assert _titles("サインイン") == []
+
+        suite.delete()
+        assert _titles("ログアウト") == []
+        if search.uses_fts():
+            with search.connection.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*) FROM {search.SEARCH_INDEX_TABLE}")
+                assert cursor.fetchone()[0] == 0
+
+    def test_parent_delete_updates_index_at_once(self, project, cases):
+        other = TestSuite.objects.create(project=project, name="その他")
+        TestCase.objects.create(suite=other, title="ログアウトしない")
+        with CaptureQueriesContext(search.connection) as context:
+            project.delete()
+        assert _titles("ログ") == []
+        # 親の削除に伴って削除されたケースは、ケースごとではなくまとめてインデックスから除く
+        index_deletes = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith(f"DELETE FROM {search.SEARCH_INDEX_TABLE}")
+        ]
+        assert len(index_deletes) == (1 if search.uses_fts() else 0)
+
+    def test_csv_import_updates_index(self):
+        CSVImporter().run(
+            _rows(
+                _project("P"),
+                _suite("P", "S"),
+                _case("P", "S", "決済する", "クレジットカードで支払う"),
+                _step("P", "決済する", 1, "カード番号を入力する", "注文が確定する"),
+            )
+        )
+        assert _titles("クレジットカード") == ["決済する"]
+        assert _titles("注文が確定") == ["決済する"]
+
+        CSVImporter().run(
+            _rows(_step("P", "決済する", 1, "カード番号を入力する", "受付メールが届く"))
+        )
+        assert _titles("注文が確定") == []
+        assert _titles("受付メール") == ["決済する"]
+
+    def test_rebuild_search_index(self, cases):
+        with search.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.SEARCH_INDEX_TABLE}")
+        assert _titles("マイページ") == []
+        call_command("rebuild_search_index")
+        assert _titles("マイページ") == ["パスワード認証でログインする"]
+
+
+@pytest.mark.django_db
+class TestSearchViews:
+    @pytest.fixture
+    def user(self, db):
+        return User.objects.create_user(username="testuser", password="testpass")
+
+    def test_search_page(self, client, user, cases):
+        client.force_login(user)
+        response = client.get(reverse("search"), {"q": "マイページ"})
+        assert response.status_code == 200
+        content = response.content.decode()
+        assert "1件のテストケースが見つかりました" in content
+        assert "<mark>マイページ</mark>" in content
+        assert reverse("case_detail", args=[cases[0].pk]) in content
+
+    def test_search_page_without_query(self, client, user, cases):
+        client.force_login(user)
+        response = client.get(reverse("search"))
+        assert response.status_code == 200
+        assert "見つかりました" not in response.content.decode()
+
+    def test_search_page_pagination(self, client, user, suite):
+        for i in range(25):
+            TestCase.objects.create(suite=suite, title=f"一覧表示{i}")
+        client.force_login(user)
+        response = client.get(reverse("search"), {"q": "一覧表示", "page": 2})
+        assert response.status_code == 200
+        assert len(response.context["results"]) == 5
+        assert "q=%E4%B8%80%E8%A6%A7%E8%A1%A8%E7%A4%BA&amp;page=1" in (
+            response.content.decode()
+        )
+
+    def test_search_page_requires_login(self, client):
+        response = client.get(reverse("search"), {"q": "test"})
+        assert response.status_code == 302
+
+    def test_search_api(self, user, cases, project):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user)}"
+        )
+        response = client.get(reverse("testcase-search"), {"q": "画面"})
+        assert response.status_code == 200
+        assert response.data["count"] == 2
+        result = response.data["results"][0]
+        assert set(result) == {
+            "id",
+            "title",
+            "status",
+            "priority",
+            "suite",
+            "project",
+            "rank",
+            "snippet",
+        }
+        assert result["project"] == {"id": project.pk, "name": "ECサイト"}
+        assert "画面" in result["snippet"]
+
+        response = client.get(
+            reverse("testcase-search"), {"q": "画面", "page_size": 1, "page": 2}
+        )
+        assert response.data["count"] == 2
+        assert len(response.data["results"]) == 1
+        assert response.data["next"] is None
+
+    def test_search_api_invalid(self, user):
+        client = APIClient()
+        assert client.get(reverse("testcase-search"), {"q": "画面"}).status_code == 401
+        client.force_authenticate(user)
+        response = client.get(reverse("testcase-search"))
+        assert response.status_code == 400
+        assert "q" in response.data
+        response = client.get(reverse("testcase-search"), {"q": "画面", "project": 999})
+        assert response.status_code == 400
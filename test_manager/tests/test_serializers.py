@@ -0,0 +1,130 @@
+import pytest
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from test_manager.models import (
+    Project,
+    TestSuite,
+    TestCase,
+    TestStep,
+    TestSession,
+    TestExecution,
+)
+from test_manager.serializers import (
+    PROJECT_VALUE_FIELDS,
+    SESSION_VALUE_FIELDS,
+    SUITE_VALUE_FIELDS,
+    ProjectSerializer,
+    TestCaseSerializer,
+    TestSessionSerializer,
+    TestSuiteSerializer,
+    build_case_data,
+    build_project_data,
+    build_session_data,
+    build_suite_data,
+    case_value_fields,
+)
+
+
+def _json(data):
+    # キーの並びも含めて比較するため、レスポンスと同じくJSONにする
+    return JSONRenderer().render(data)
+
+
+@pytest.fixture
+def project(db):
+    project = Project.objects.create(name="Project")
+    for i in range(2):
+        suite = TestSuite.objects.create(
+            project=project, name=f"Suite {i}", description="説明"
+        )
+        for j in range(3):
+            case = TestCase.objects.create(
+                suite=suite,
+                title=f"Case {i}-{j}",
+                description=f"Description {j}",
+                status="ACTIVE",
+                priority="HIGH",
+            )
+            for order in (2, 1, 3):
+                TestStep.objects.create(
+                    test_case=case,
+                    order=order,
+                    description=f"手順 {order}",
+                    expected_result=f"結果 {order}",
+                )
+    # テストケースを含まないスイート
+    TestSuite.objects.create(project=project, name="Empty Suite")
+    return project
+
+
+@pytest.mark.parametrize(
+    "fields", [None, ["id", "title"], ["steps", "status"], ["title", "steps"]]
+)
+def test_build_case_data_matches_serializer(project, fields):
+    cases = TestCase.objects.order_by("pk")
+    expected = TestCaseSerializer(cases, many=True, fields=fields).data
+    rows = cases.values(*case_value_fields(fields))
+    assert _json(build_case_data(rows, fields)) == _json(expected)
+
+
+def test_build_case_data_with_prefix(project):
+    test_session = TestSession.objects.create(project=project, name="Session")
+    test_session.initialize_executions(TestCase.objects.order_by("-pk"))
+    executions = TestExecution.objects.filter(test_session=test_session)
+    expected = TestCaseSerializer(
+        [execution.test_case for execution in executions], many=True
+    ).data
+    rows = executions.values(*case_value_fields(prefix="test_case__"))
+    assert _json(build_case_data(rows, prefix="test_case__")) == _json(expected)
+
+
+def _suite_serializer_data(suites, include_cases=False, include_steps=False):
+    suites = suites.prefetch_related(
+        Prefetch("test_cases", queryset=TestCase.objects.order_by("pk"))
+    )
+    context = {"include_cases": include_cases, "include_steps": include_steps}
+    return TestSuiteSerializer(suites, many=True, context=context).data
+
+
+@pytest.mark.parametrize(
+    "include_cases, include_steps", [(True, True), (True, False), (False, False)]
+)
+def test_build_suite_data_matches_serializer(project, include_cases, include_steps):
+    suites = TestSuite.objects.filter(project=project).order_by("pk")
+    expected = _suite_serializer_data(suites, include_cases, include_steps)
+    data = build_suite_data(
+        suites.values(*SUITE_VALUE_FIELDS), include_cases, include_steps
+    )
+    assert _json(data) == _json(expected)
+    if include_cases:
+        assert data[-1]["test_cases"] == []
+    else:
+        # テストケースを含めない場合は、空のリストと区別するためnullとする
+        assert [suite["test_cases"] for suite in data] == [None] * len(data)
+
+
+def test_build_suite_data_queries(project, django_assert_num_queries):
+    suites = TestSuite.objects.filter(project=project).order_by("pk")
+    # スイート、テストケース、ステップの3回で、件数によらない
+    with django_assert_num_queries(3):
+        build_suite_data(suites.values(*SUITE_VALUE_FIELDS), True, True)
+
+
+def test_build_project_data_matches_serializer(project):
+    projects = Project.objects.order_by("pk")
+    expected = ProjectSerializer(projects, many=True).data
+    data = build_project_data(projects.values(*PROJECT_VALUE_FIELDS))
+    assert _json(data) == _json(expected)
+
+
+def test_build_session_data_matches_serializer(project):
+    completed = TestSession.objects.create(project=project, name="Completed")
+    TestSession.objects.create(project=project, name="Session", environment="Linux")
+    TestSession.objects.filter(pk=completed.pk).update(not_tested_count=0)
+    TestSession.objects.exclude(pk=completed.pk).update(not_tested_count=1)
+    sessions = TestSession.objects.order_by("pk")
+    expected = TestSessionSerializer(sessions, many=True).data
+    data = build_session_data(sessions.values(*SESSION_VALUE_FIELDS))
+    assert _json(data) == _json(expected)
+    assert [session["completed"] for session in data] == [True, False]
@@ -4,9 +4,19 @@ from rest_framework import status
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
-from test_manager.models import Project, TestSuite, TestCase, TestSession, TestExecution
+from test_manager.models import (
+    Project,
+    TestSuite,
+    TestCase,
+    TestStep,
+    TestSession,
+    TestExecution,
+)
+import datetime
 import json
 
+from django.utils import timezone
+
 
 @pytest.fixture
 def project(db):
@@ -170,6 +180,208 @@ def test_execute_test_case_completion(api_client, project, test_suite, test_case
     assert len(response_data["remaining_test_cases"]) == 0
 
 
+def test_execute_test_case_invalid_status(api_client, project, test_case):
+    """不正なstatusは記録せずに400を返す"""
+    test_session = TestSession.objects.create(project=project, name="Test Session")
+    test_session.initialize_executions([test_case])
+    execution_url = reverse(
+        "execute-test-case", kwargs={"test_session_id": test_session.id}
+    )
+    for data in (
+        {"test_case_id": test_case.id, "status": "UNKNOWN"},
+        {"test_case_id": test_case.id},
+    ):
+        response = api_client.post(
+            execution_url, data=json.dumps(data), content_type="application/json"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json() == {"error": "Invalid status"}
+    execution = TestExecution.objects.get(test_session=test_session)
+    assert execution.status == "NOT_TESTED"
+    test_session.refresh_from_db()
+    assert test_session.not_tested_count == 1
+
+
+@pytest.fixture
+def test_session_with_steps(db, project, test_suite):
+    test_session = TestSession.objects.create(project=project, name="Test Session")
+    cases = []
+    for i in range(5):
+        case = TestCase.objects.create(suite=test_suite, title=f"Case {i}")
+        for order in range(1, 4):
+            TestStep.objects.create(test_case=case, order=order, description="step")
+        cases.append(case)
+    test_session.initialize_executions(cases)
+    return test_session
+
+
+def test_get_execute_test_case_paginated(
+    api_client, test_session_with_steps, django_assert_max_num_queries
+):
+    """remaining_test_casesをlimit, cursorでページングし、fieldsで絞り込めることをテストする"""
+    url = reverse(
+        "execute-test-case", kwargs={"test_session_id": test_session_with_steps.id}
+    )
+    # ステップは件数によらず1回のクエリでまとめて取得する
+    with django_assert_max_num_queries(6):
+        response = api_client.get(url, {"limit": 3})
+    assert response.status_code == status.HTTP_200_OK
+    response_data = response.json()
+    assert response_data["remaining_count"] == 5
+    assert [c["title"] for c in response_data["remaining_test_cases"]] == [
+        "Case 0",
+        "Case 1",
+        "Case 2",
+    ]
+    assert len(response_data["remaining_test_cases"][0]["steps"]) == 3
+
+    response = api_client.get(
+        url, {"limit": 3, "cursor": response_data["next_cursor"], "fields": "id,title"}
+    )
+    response_data = response.json()
+    assert response_data["next_cursor"] is None
+    assert [set(c) for c in response_data["remaining_test_cases"]] == [
+        {"id", "title"},
+        {"id", "title"},
+    ]
+
+    assert api_client.get(url, {"fields": "id,unknown"}).status_code == 400
+    assert api_client.get(url, {"limit": "0"}).status_code == 400
+
+
+def test_post_execute_test_case_counters_only(
+    api_client, test_session_with_steps, django_assert_max_num_queries
+):
+    """counters_onlyを指定した場合は件数のみを返すことをテストする"""
+    url = reverse(
+        "execute-test-case", kwargs={"test_session_id": test_session_with_steps.id}
+    )
+    test_case = test_session_with_steps.executions.first().test_case
+    data = {"test_case_id": test_case.id, "status": "PASS", "counters_only": True}
+    with django_assert_max_num_queries(12):
+        response = api_client.post(
+            url, data=json.dumps(data), content_type="application/json"
+        )
+    assert response.status_code == status.HTTP_200_OK
+    response_data = response.json()
+    assert "remaining_test_cases" not in response_data
+    assert response_data["completed_count"] == 1
+    assert response_data["remaining_count"] == 4
+    assert response_data["completed"] is False
+
+
+def test_execute_test_cases_bulk(
+    api_client, test_session_with_steps, django_assert_max_num_queries
+):
+    """複数の結果をまとめて記録し、項目ごとのエラーと進捗を返すことをテストする"""
+    url = reverse(
+        "execute-test-cases-bulk",
+        kwargs={"test_session_id": test_session_with_steps.id},
+    )
+    case_ids = list(
+        test_session_with_steps.executions.values_list("test_case_id", flat=True)
+    )
+    data = {
+        "results": [
+            {"test_case_id": case_ids[0], "status": "PASS", "notes": "ok"},
+            {"test_case_id": case_ids[1], "status": "FAIL", "result_detail": "NG"},
+            {"test_case_id": case_ids[2], "status": "UNKNOWN"},
+            {"test_case_id": case_ids[0], "status": "FAIL"},
+            {"test_case_id": 999999, "status": "PASS"},
+            {"status": "PASS"},
+        ]
+    }
+    # 件数によらずクエリ数は一定
+    with django_assert_max_num_queries(10):
+        response = api_client.post(
+            url, data=json.dumps(data), content_type="application/json"
+        )
+    assert response.status_code == status.HTTP_200_OK
+    response_data = response.json()
+    assert response_data["results"] == [
+        {"test_case_id": case_ids[0], "status": "PASS"},
+        {"test_case_id": case_ids[1], "status": "FAIL"},
+        {"test_case_id": case_ids[2], "error": "Invalid status"},
+        {"test_case_id": case_ids[0], "error": "Duplicated test_case_id"},
+        {"test_case_id": 999999, "error": "TestExecution not found"},
+        {"test_case_id": None, "error": "test_case_id is required"},
+    ]
+    assert response_data["completed_count"] == 2
+    assert response_data["remaining_count"] == 3
+
+    execution = TestExecution.objects.get(
+        test_session=test_session_with_steps, test_case_id=case_ids[1]
+    )
+    assert execution.status == "FAIL"
+    assert execution.result_detail == "NG"
+    assert execution.executed_at is not None
+    test_session_with_steps.refresh_from_db()
+    assert test_session_with_steps.pass_count == 1
+    assert test_session_with_steps.fail_count == 1
+    assert test_session_with_steps.not_tested_count == 3
+
+    # 残りをすべて記録するとセッションが完了する
+    data = {
+        "results": [
+            {"test_case_id": case_id, "status": "SKIPPED"} for case_id in case_ids
+        ]
+    }
+    response = api_client.post(
+        url, data=json.dumps(data), content_type="application/json"
+    )
+    assert response.json()["completed"] is True
+    test_session_with_steps.refresh_from_db()
+    assert test_session_with_steps.skipped_count == 5
+    assert test_session_with_steps.completed_at is not None
+
+
+def test_execute_test_cases_bulk_remaining_status(api_client, test_session_with_steps):
+    """resultsの記録後、残りをremaining_statusでまとめて記録することをテストする"""
+    url = reverse(
+        "execute-test-cases-bulk",
+        kwargs={"test_session_id": test_session_with_steps.id},
+    )
+    case_id = test_session_with_steps.executions.first().test_case_id
+    data = {
+        "results": [{"test_case_id": case_id, "status": "FAIL"}],
+        "remaining_status": "PASS",
+    }
+    response = api_client.post(
+        url, data=json.dumps(data), content_type="application/json"
+    )
+    assert response.status_code == status.HTTP_200_OK
+    response_data = response.json()
+    assert response_data["remaining_recorded"] == 4
+    assert response_data["completed"] is True
+    test_session_with_steps.refresh_from_db()
+    assert test_session_with_steps.fail_count == 1
+    assert test_session_with_steps.pass_count == 4
+    assert test_session_with_steps.completed_at is not None
+
+    response = api_client.post(
+        url,
+        data=json.dumps({"remaining_status": "NOT_TESTED"}),
+        content_type="application/json",
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_execute_test_cases_bulk_invalid(api_client, test_session_with_steps):
+    url = reverse(
+        "execute-test-cases-bulk",
+        kwargs={"test_session_id": test_session_with_steps.id},
+    )
+    response = api_client.post(
+        url, data=json.dumps({"results": {}}), content_type="application/json"
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    data = {"results": [{"test_case_id": 1, "status": "PASS"}] * 501}
+    response = api_client.post(
+        url, data=json.dumps(data), content_type="application/json"
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
 def test_get_execute_test_case_not_found(api_client, project, test_suite, test_case):
     url = reverse("execute-test-case", kwargs={"test_session_id": 999})
     response = api_client.get(url)
@@ -203,14 +415,16 @@ def test_list_project_test_sessions(
     response = api_client.get(url)
 
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.data) == 2
-    response_session_names = sorted([session["name"] for session in response.data])
+    assert len(response.data["results"]) == 2
+    response_session_names = sorted(
+        [session["name"] for session in response.data["results"]]
+    )
     expected_session_names = sorted(
         [test_session1_project1.name, test_session2_project1.name]
     )
     assert response_session_names == expected_session_names
     # Check if 'project' field in response matches project.id
-    for session_data in response.data:
+    for session_data in response.data["results"]:
         assert session_data["project"] == project.id
 
 
@@ -234,8 +448,8 @@ def test_list_project_test_sessions_with_completion_status(
     # Initially, the test session should not be completed
     response = api_client.get(url)
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.data) == 1
-    assert response.data[0]["completed"] is False
+    assert len(response.data["results"]) == 1
+    assert response.data["results"][0]["completed"] is False
 
     # Mark the execution as PASS
     execution.status = "PASS"
@@ -244,8 +458,8 @@ def test_list_project_test_sessions_with_completion_status(
     # Now, the test session should be completed
     response = api_client.get(url)
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.data) == 1
-    assert response.data[0]["completed"] is True
+    assert len(response.data["results"]) == 1
+    assert response.data["results"][0]["completed"] is True
 
 
 def test_list_project_test_sessions_empty(api_client, project):
@@ -253,7 +467,7 @@ def test_list_project_test_sessions_empty(api_client, project):
     response = api_client.get(url)
 
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.data) == 0
+    assert len(response.data["results"]) == 0
 
 
 def test_list_project_test_sessions_non_existent_project(api_client):
@@ -262,3 +476,69 @@ def test_list_project_test_sessions_non_existent_project(api_client):
     response = api_client.get(url)
 
     assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_list_project_test_sessions_cursor_pagination(api_client, project):
+    base = timezone.now()
+    for i in range(5):
+        TestSession.objects.create(
+            project=project,
+            name=f"Session {i}",
+            started_at=base - datetime.timedelta(hours=i),
+        )
+    url = reverse("test-session-create", kwargs={"project_id": project.id})
+    response = api_client.get(url, {"page_size": 2})
+    assert [s["name"] for s in response.data["results"]] == ["Session 0", "Session 1"]
+    assert response.data["previous"] is None
+
+    # 途中で追加されたセッションは、続きのページに重複や欠落を生じさせない
+    TestSession.objects.create(project=project, name="New Session", started_at=base)
+    names = []
+    next_url = response.data["next"]
+    while next_url:
+        response = api_client.get(next_url)
+        names += [s["name"] for s in response.data["results"]]
+        next_url = response.data["next"]
+    assert names == ["Session 2", "Session 3", "Session 4"]
+
+
+def test_list_project_test_sessions_max_page_size(api_client, project):
+    TestSession.objects.bulk_create(
+        TestSession(project=project, name=f"Session {i}") for i in range(205)
+    )
+    url = reverse("test-session-create", kwargs={"project_id": project.id})
+    response = api_client.get(url, {"page_size": 1000})
+    assert len(response.data["results"]) == 200
+    assert response.data["next"] is not None
+
+
+def test_list_project_test_sessions_filters(api_client, project):
+    now = timezone.now()
+    old = TestSession.objects.create(
+        project=project,
+        name="Old",
+        started_at=now - datetime.timedelta(days=10),
+        completed_at=now,
+    )
+    TestSession.objects.create(project=project, name="Running", started_at=now)
+    url = reverse("test-session-create", kwargs={"project_id": project.id})
+
+    response = api_client.get(url, {"state": "completed"})
+    assert [s["name"] for s in response.data["results"]] == ["Old"]
+    response = api_client.get(url, {"state": "running"})
+    assert [s["name"] for s in response.data["results"]] == ["Running"]
+    response = api_client.get(
+        url, {"started_to": timezone.localdate(old.started_at).isoformat()}
+    )
+    assert [s["name"] for s in response.data["results"]] == ["Old"]
+    response = api_client.get(url, {"started_from": timezone.localdate().isoformat()})
+    assert [s["name"] for s in response.data["results"]] == ["Running"]
+
+
+def test_list_project_test_sessions_invalid_params(api_client, project):
+    url = reverse("test-session-create", kwargs={"project_id": project.id})
+    response = api_client.get(url, {"state": "unknown", "started_from": "yesterday"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert set(response.data) == {"state", "started_from"}
+    response = api_client.get(url, {"cursor": "invalid"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
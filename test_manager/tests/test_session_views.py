@@ -1,6 +1,7 @@
 from datetime import date
 from logging import getLogger
 import pytest
+from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
@@ -71,8 +72,10 @@ class TestSessionViews:
         assert "0/1" in str(response.content)
 
         # もう一件作成して変化があることを確認する
+        # 同じテストケースは1つのセッションに1件しか含められないため、別のケースを使う
+        another_case = TestCase.objects.create(suite=case.suite, title="Another Case")
         TestExecution.objects.create(
-            test_session=test_session, test_case=case, status="NOT_TESTED"
+            test_session=test_session, test_case=another_case, status="NOT_TESTED"
         )
         response = client.get(url)
         assert response.status_code == 200
@@ -91,6 +94,76 @@ class TestSessionViews:
         assert response.status_code == 200
         assert "Test Case" in str(response.content)
 
+    def test_test_session_execute_view_current_execution_number(
+        self, client, user, test_session, suite, django_assert_max_num_queries
+    ):
+        client.login(username="testuser", password="testpass")
+        cases = [
+            TestCase.objects.create(suite=suite, title=f"Case {i}") for i in range(30)
+        ]
+        test_session.initialize_executions(cases)
+        url = reverse("test_session_execute", kwargs={"pk": test_session.id})
+
+        # セッションの件数によらずクエリ数は一定
+        with django_assert_max_num_queries(15):
+            response = client.get(url + f"?test_case_id={cases[19].id}")
+        assert response.context["current_case"] == cases[19]
+        assert response.context["current_execution_number"] == 20
+
+        for execution in test_session.executions.all()[:3]:
+            execution.status = "PASS"
+            execution.save()
+        response = client.get(url)
+        assert response.context["current_case"] == cases[3]
+        assert response.context["current_execution_number"] == 4
+
+    def test_test_session_executions_json(
+        self, client, user, test_session, suite, django_assert_max_num_queries
+    ):
+        client.login(username="testuser", password="testpass")
+        cases = [
+            TestCase.objects.create(suite=suite, title=f"Case {i}") for i in range(5)
+        ]
+        test_session.initialize_executions(cases)
+        url = reverse("test_session_executions", kwargs={"pk": test_session.pk})
+
+        # position順のページ単位で取得できる
+        with django_assert_max_num_queries(4):
+            response = client.get(url, {"limit": 3})
+        data = response.json()
+        assert [e["title"] for e in data["executions"]] == [
+            "Case 0",
+            "Case 1",
+            "Case 2",
+        ]
+        assert data["executions"][0]["status_display"] == "未テスト"
+        assert data["next"] == 3
+        data = client.get(url, {"limit": 3, "after": data["next"]}).json()
+        assert [e["title"] for e in data["executions"]] == ["Case 3", "Case 4"]
+        assert data["next"] is None
+
+        # synced_at以降に変更された行だけを取得できる
+        execution = test_session.executions.get(test_case=cases[1])
+        execution.status = "PASS"
+        execution.notes = "ok"
+        execution.save()
+        delta = client.get(url, {"since": data["synced_at"]}).json()
+        assert [(e["title"], e["status"], e["notes"]) for e in delta["executions"]] == [
+            ("Case 1", "PASS", "ok")
+        ]
+
+        test_session.skip_remainings()
+        delta = client.get(url, {"since": delta["synced_at"]}).json()
+        assert len(delta["executions"]) == 4
+        assert {e["status"] for e in delta["executions"]} == {"SKIPPED"}
+
+    def test_test_session_executions_json_invalid(self, client, user, test_session):
+        client.login(username="testuser", password="testpass")
+        url = reverse("test_session_executions", kwargs={"pk": test_session.pk})
+        assert client.get(url, {"since": "yesterday"}).status_code == 400
+        assert client.get(url, {"limit": "0"}).status_code == 400
+        assert client.get(url, {"after": "x"}).status_code == 400
+
     def test_test_session_execute_view_get_completed(
         self, client, user, test_session, case, execution
     ):
@@ -124,6 +197,21 @@ class TestSessionViews:
         assert execution.result_detail == "Test Result"
         assert execution.notes == "Test Notes"
 
+    def test_test_session_execute_view_post_invalid_status(
+        self, client, user, test_session, case, execution
+    ):
+        client.login(username="testuser", password="testpass")
+
+        url = reverse("test_session_execute", kwargs={"pk": test_session.pk})
+        response = client.post(
+            url, {"test_case_id": case.pk, "status": "UNKNOWN"}, follow=True
+        )
+        assert response.status_code == 200
+        assert response.context["current_case"] == case
+        assert "実行結果の状態が不正です" in response.content.decode()
+        execution.refresh_from_db()
+        assert execution.status == "NOT_TESTED"
+
     def test_test_session_execute_view_post_without_status(
         self, client, user, test_session, case
     ):
@@ -239,6 +327,30 @@ class TestSessionListView:
         content = response.content.decode("utf-8")
         assert test_session.name in content
 
+    def test_session_list_view_filters(self, client, user, project, test_session):
+        other = Project.objects.create(name="Other Project")
+        completed = TestSession.objects.create(
+            project=other, name="Completed Session", completed_at=timezone.now()
+        )
+        TestSession.objects.filter(pk=completed.pk).update(
+            started_at=timezone.now() - timezone.timedelta(days=10)
+        )
+        client.login(username="admin", password="adminpass")
+        url = reverse("test_session_list")
+
+        def names(**params):
+            response = client.get(url, params)
+            assert response.status_code == 200
+            return [s.name for s in response.context["test_sessions"]]
+
+        assert names() == ["Test Session", "Completed Session"]
+        assert names(sort="started_asc") == ["Completed Session", "Test Session"]
+        assert names(project=project.pk) == ["Test Session"]
+        assert names(state="completed") == ["Completed Session"]
+        assert names(state="running") == ["Test Session"]
+        today = timezone.localdate()
+        assert names(started_from=today.isoformat()) == ["Test Session"]
+
     def test_session_detail_view(self, client, user, test_session):
         client.login(username="admin", password="adminpass")
         url = reverse("test_session_detail", kwargs={"pk": test_session.id})
@@ -61,3 +61,22 @@ class TestSuiteViews:
         assert response.status_code == 302
         suite.refresh_from_db()
         assert suite.name == "Updated Suite"
+
+    def test_suite_list_view(self, client, user, project, suite):
+        other = Project.objects.create(name="Other Project")
+        TestSuite.objects.create(project=other, name="Other Suite")
+        client.login(username="testuser", password="testpass")
+        url = reverse("suite_list")
+        response = client.get(url)
+        assert response.status_code == 200
+        assert [s.name for s in response.context["suites"]] == [
+            "Other Suite",
+            "Test Suite",
+        ]
+        response = client.get(url, {"project": project.pk})
+        assert [s.name for s in response.context["suites"]] == ["Test Suite"]
+        assert "Test Project" in response.content.decode()
+
+    def test_suite_list_requires_login(self, client):
+        response = client.get(reverse("suite_list"))
+        assert response.status_code == 302
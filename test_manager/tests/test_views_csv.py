@@ -5,7 +5,9 @@ import io
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from test_manager.models import Project, TestSuite, TestCase, TestStep
+from django.core.management import call_command
+from test_manager import views_csv
+from test_manager.models import Project, TestSuite, TestCase, TestStep, ImportJob
 
 User = get_user_model()
 
@@ -140,7 +142,8 @@ class TestCSVViews:
         response = client.get(url)
         assert response.status_code == 200
         assert response["Content-Type"] == "text/csv"
-        content = response.content.decode("utf-8")
+        assert response.streaming
+        content = b"".join(response.streaming_content).decode("utf-8")
 
         # プロジェクトのデータが含まれていることを確認
         assert "Test Project" in content
@@ -182,7 +185,8 @@ class TestCSVViews:
         response = client.get(url)
         assert response.status_code == 200
         assert response["Content-Type"] == "text/csv"
-        content = response.content.decode("utf-8")
+        assert response.streaming
+        content = b"".join(response.streaming_content).decode("utf-8")
 
         # 各レコードが含まれていることを確認
         assert "Test Project" in content
@@ -191,6 +195,81 @@ class TestCSVViews:
         assert "Test Step" in content
         assert "Expected Result" in content
 
+    def test_csv_export_order_and_queries(
+        self, client, admin_user, django_assert_max_num_queries
+    ):
+        client.login(username="admin", password="adminpass")
+
+        project = Project.objects.create(name="Test Project")
+        for i in range(3):
+            suite = TestSuite.objects.create(project=project, name=f"Suite {i}")
+            for j in range(5):
+                case = TestCase.objects.create(suite=suite, title=f"Case {i}-{j}")
+                for order in (2, 1):
+                    TestStep.objects.create(
+                        test_case=case, order=order, description=f"Step {order}"
+                    )
+
+        response = client.get(
+            reverse("project_csv_export", kwargs={"project_id": project.id})
+        )
+        # スイート・ケース・ステップの件数によらず一定のクエリ数で出力される
+        with django_assert_max_num_queries(4):
+            content = b"".join(response.streaming_content).decode("utf-8")
+
+        rows = list(csv.reader(io.StringIO(content)))
+        assert rows[0][0] == "project_name"
+        assert [row[1] for row in rows[1:5]] == ["project", "suite", "case", "step"]
+        assert rows[2][3] == "Suite 0"
+        assert rows[3][3] == "Case 0-0"
+        # ステップはorder順に並ぶ
+        assert [rows[4][5], rows[5][5]] == ["1", "2"]
+        assert len(rows) == 1 + 1 + 3 + 15 + 30
+
+    def test_csv_export_in_chunks(
+        self, client, admin_user, monkeypatch, django_assert_num_queries
+    ):
+        """チャンクの境界をまたいでも、各行が親の直後に並ぶ"""
+        monkeypatch.setattr(views_csv, "EXPORT_CHUNK_SIZE", 2)
+        client.login(username="admin", password="adminpass")
+
+        expected = []
+        for p in range(3):
+            project = Project.objects.create(name=f"Project {p}")
+            expected.append(["project", f"Project {p}"])
+            # プロジェクト0にはスイートがない
+            for i in range(p):
+                suite = TestSuite.objects.create(project=project, name=f"Suite {p}-{i}")
+                expected.append(["suite", f"Suite {p}-{i}"])
+                for j in range(3):
+                    case = TestCase.objects.create(
+                        suite=suite, title=f"Case {p}-{i}-{j}"
+                    )
+                    expected.append(["case", f"Case {p}-{i}-{j}"])
+                    for order in range(1, j + 1):
+                        TestStep.objects.create(
+                            test_case=case, order=order, description=f"Step {order}"
+                        )
+                        expected.append(["step", f"Step {order}"])
+        # 後から作成した、前のプロジェクトのスイート
+        suite = TestSuite.objects.create(
+            project=Project.objects.get(name="Project 1"), name="Suite 1-1"
+        )
+        index = expected.index(["project", "Project 2"])
+        expected.insert(index, ["suite", "Suite 1-1"])
+
+        response = client.get(reverse("csv_export"))
+        # プロジェクト3件、スイート4件、ケース9件をそれぞれ2件ずつ読み込み
+        # （件数がちょうどチャンクの倍数の場合は、空のチャンクまで読む）、
+        # ケースのチャンクごとにステップを読み込む
+        with django_assert_num_queries(2 + 3 + 5 + 5):
+            content = b"".join(response.streaming_content).decode("utf-8")
+
+        rows = list(csv.reader(io.StringIO(content)))[1:]
+        assert [
+            [row[1], row[4] if row[1] == "step" else row[3]] for row in rows
+        ] == expected
+
     def test_csv_import(self, client, admin_user, csv_data):
         client.login(username="admin", password="adminpass")
 
@@ -201,11 +280,27 @@ class TestCSVViews:
         )
         response = client.post(url, {"file": csv_file})
         assert response.status_code == 302
-        assert response.url == reverse("project_list")
+        job = ImportJob.objects.get()
+        assert response.url == f"{reverse('csv_management')}?job={job.pk}"
+        assert job.status == "PENDING"
+        assert job.file_name == "test_data.csv"
+        assert job.created_by == "admin"
+        # アップロード時点ではまだインポートされていない
+        assert Project.objects.count() == 0
 
-        # リダイレクト先を確認
+        # リダイレクト先では受け付けたジョブを強調表示する
         response = client.get(response.url)
         assert response.status_code == 200
+        assert response.context["current_job_id"] == job.pk
+        content = response.content.decode("utf-8")
+        assert "test_data.csv" in content
+        assert "table-primary current-job" in content
+
+        # ワーカーがジョブを処理する
+        call_command("run_import_worker", "--once", stdout=io.StringIO())
+        job.refresh_from_db()
+        assert job.status == "SUCCEEDED"
+        assert job.processed_rows == job.total_rows == 4
 
         # データが正しくインポートされたことを確認
         assert Project.objects.count() == 1
@@ -231,6 +326,43 @@ class TestCSVViews:
         assert step.description == "Test Step"
         assert step.expected_result == "Expected Result"
 
+    def test_import_job_status(self, client, admin_user):
+        client.login(username="admin", password="adminpass")
+        job = ImportJob.objects.create(
+            file_name="test_data.csv",
+            content="",
+            status="RUNNING",
+            total_rows=200,
+            processed_rows=50,
+        )
+        response = client.get(reverse("import_job_status", kwargs={"pk": job.pk}))
+        assert response.status_code == 200
+        data = response.json()
+        assert data["id"] == job.pk
+        assert data["status"] == "RUNNING"
+        assert data["progress"] == 25
+        assert data["finished"] is False
+
+    def test_import_job_status_only_for_owner(self, client):
+        job = ImportJob.objects.create(
+            file_name="test_data.csv", content="", created_by="owner", error="secret"
+        )
+        url = reverse("import_job_status", kwargs={"pk": job.pk})
+        User.objects.create_user(username="owner", password="pass")
+        User.objects.create_user(username="other", password="pass")
+
+        client.login(username="other", password="pass")
+        assert client.get(url).status_code == 404
+        client.login(username="owner", password="pass")
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.json()["id"] == job.pk
+
+    def test_import_job_status_not_found(self, client, admin_user):
+        client.login(username="admin", password="adminpass")
+        response = client.get(reverse("import_job_status", kwargs={"pk": 999}))
+        assert response.status_code == 404
+
     def test_csv_import_no_file(self, client, admin_user):
         client.login(username="admin", password="adminpass")
         url = reverse("csv_import")
@@ -32,6 +32,11 @@ urlpatterns = [
         name="project_csv_export",
     ),
     path("csv/import/", views_csv.CSVImportView.as_view(), name="csv_import"),
+    path(
+        "csv/import/jobs/<int:pk>/",
+        views_csv.ImportJobStatusView.as_view(),
+        name="import_job_status",
+    ),
     path("csv/", views.CSVManagementView.as_view(), name="csv_management"),
     # プロジェクト管理
     path("", views.ProjectListView.as_view(), name="project_list"),
@@ -82,6 +87,8 @@ urlpatterns = [
         "case/<int:pk>/delete/", views.TestCaseDeleteView.as_view(), name="case_delete"
     ),
     path("cases/", views.TestCaseListView.as_view(), name="case_list"),
+    path("suites/", views.TestSuiteListView.as_view(), name="suite_list"),
+    path("search/", views.SearchView.as_view(), name="search"),
     path(
         "case/<int:case_pk>/execute/",
         views.TestExecutionCreateView.as_view(),
@@ -97,6 +104,11 @@ urlpatterns = [
         views.TestSessionExecuteView.as_view(),
         name="test_session_execute",
     ),
+    path(
+        "test-session/<int:pk>/executions/",
+        views.TestSessionExecutionListView.as_view(),
+        name="test_session_executions",
+    ),
     path(
         "test-session/<int:pk>/skip-all/",
         views.TestSessionSkipAllView.as_view(),
@@ -137,6 +149,7 @@ urlpatterns = [
         api.TestCaseDetail.as_view(),
         name="testcase-detail",
     ),
+    path("api/search/", api.TestCaseSearch.as_view(), name="testcase-search"),
     path(
         "api/projects/<int:project_id>/test-sessions/",
         api.TestSessionList.as_view(),
@@ -148,6 +161,11 @@ urlpatterns = [
         api.execute_test_case,
         name="execute-test-case",
     ),
+    path(
+        "api/test-sessions/<int:test_session_id>/execute/bulk/",
+        api.execute_test_cases_bulk,
+        name="execute-test-cases-bulk",
+    ),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
@@ -1,9 +1,20 @@
 from datetime import date
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.text import Truncator
 from logging import getLogger
 
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Project, TestSuite, TestCase, TestSession, TestExecution
+from .models import (
+    Project,
+    TestSuite,
+    TestCase,
+    TestStep,
+    TestSession,
+    TestExecution,
+    ImportJob,
+)
 from django.views.generic import (
     ListView,
     DetailView,
@@ -18,16 +29,34 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
 from .forms import (
     ProjectForm,
     ProjectMemberForm,
     TestSuiteForm,
     TestCaseForm,
     TestStepFormSet,
+    SearchForm,
+    TestCaseFilterForm,
+    TestSuiteFilterForm,
+    TestSessionFilterForm,
     UserEditForm,
     TestSessionForm,  # Add TestSessionForm
 )
-from .mixins import ProjectManagerRequired, TestEditorRequired, TestExecutorRequired
+from django.utils.decorators import method_decorator
+from .conditional import conditional_get, content_state
+from .middleware import request_metrics
+from .search import search_test_cases
+from .mixins import (
+    FragmentCacheMixin,
+    KeysetPaginationMixin,
+    ListFilterMixin,
+    ProjectManagerRequired,
+    TestEditorRequired,
+    TestExecutorRequired,
+)
 from rest_framework.authtoken.models import Token
 
 User = get_user_model()
@@ -43,7 +72,11 @@ class AdminDashboardView(LoginRequiredMixin, UserPassesTestMixin, View):
         return self.request.user.is_superuser
 
     def get(self, request, *args, **kwargs):
-        return render(request, self.template_name)
+        context = {
+            "request_metrics_enabled": settings.REQUEST_METRICS_ENABLED,
+            "request_metrics": request_metrics.summary(),
+        }
+        return render(request, self.template_name, context)
 
 
 class CSVManagementView(LoginRequiredMixin, UserPassesTestMixin, View):
@@ -53,7 +86,15 @@ class CSVManagementView(LoginRequiredMixin, UserPassesTestMixin, View):
         return self.request.user.is_superuser
 
     def get(self, request, *args, **kwargs):
-        return render(request, self.template_name)
+        import_jobs = ImportJob.objects.defer("content").order_by("-created_at")[:10]
+        # アップロード直後はリダイレクト先のjobパラメータで受け付けたジョブを強調表示する
+        job_id = request.GET.get("job", "")
+        current_job_id = int(job_id) if job_id.isdigit() else None
+        return render(
+            request,
+            self.template_name,
+            {"import_jobs": import_jobs, "current_job_id": current_job_id},
+        )
 
 
 class UserListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
@@ -242,12 +283,13 @@ class TestSessionCreateView(TestExecutorRequired, CreateView):
 
         _logger.debug(f"TestSessionCreateView.form_valid 2: {selected_test_case_instances}")
 
-        # Now call super().form_valid(form) to save the TestSession instance
-        # This will create self.object
-        response = super().form_valid(form)
+        with transaction.atomic():
+            # Now call super().form_valid(form) to save the TestSession instance
+            # This will create self.object
+            response = super().form_valid(form)
 
-        # Now that self.object (TestSession instance) exists, initialize executions
-        if self.object and selected_test_case_instances:
+            # Now that self.object (TestSession instance) exists, initialize executions.
+            # selected_cases is a QuerySet, so it is passed as is without being evaluated here
             self.object.initialize_executions(selected_test_case_instances)
 
         return response
@@ -288,30 +330,15 @@ class TestSessionExecuteView(LoginRequiredMixin, View):
             return redirect("test_session_detail", pk=test_session.pk)
 
         # TestSession詳細にリダイレクトしない場合、残ったTestExecutionに対する処理を進める
-        # 現在のテストケースが何番目かを計算する
-        current_execution_number = 1
-        if test_case_id:
-            for execution in test_session.executions.all():
-                if execution.test_case.id == int(test_case_id):
-                    break
-                current_execution_number += 1
-        else:
-            for execution in test_session.executions.all():
-                if execution.status == "NOT_TESTED":
-                    break
-                current_execution_number += 1
-
-        executions = test_session.executions.all()
-        total_count = executions.count()
-        completed_count = executions.exclude(status="NOT_TESTED").count()
-        progress = (completed_count / total_count) * 100 if total_count > 0 else 0
-
         context = {
             "test_session": test_session,
-            "total_count": total_count,
-            "completed_count": completed_count,
-            "progress": progress,
-            "current_execution_number": current_execution_number,
+            "total_count": test_session.total_count,
+            "completed_count": test_session.completed_count,
+            "progress": test_session.progress,
+            # 現在のテストケースが何番目か
+            "current_execution_number": test_session.get_execution_number(
+                next_execution
+            ),
         }
         context["current_case"] = next_execution.test_case
         return render(request, self.template_name, context)
@@ -335,6 +362,11 @@ class TestSessionExecuteView(LoginRequiredMixin, View):
             )
 
         # テスト実行フォームからの送信の場合
+        if request.POST["status"] not in dict(TestExecution.STATUS_CHOICES):
+            messages.error(request, "実行結果の状態が不正です")
+            return redirect(
+                f"{reverse('test_session_execute', kwargs={'pk': pk})}?test_case_id={test_case.id}"
+            )
         execution = test_session.executions.get(test_case__id=test_case.id)
         execution.status = request.POST["status"]
         execution.executed_by = test_session.executed_by
@@ -347,6 +379,61 @@ class TestSessionExecuteView(LoginRequiredMixin, View):
         return redirect("test_session_execute", pk=pk)
 
 
+class TestSessionExecutionListView(LoginRequiredMixin, View):
+    """実行画面のテストケース一覧用に、TestExecutionをposition順にJSONで返す。
+
+    afterに前のページの最後のpositionを指定すると続きを返す。
+    sinceに前回のレスポンスのsynced_atを指定すると、それ以降に変更された行だけを返す"""
+
+    DEFAULT_LIMIT = 200
+    MAX_LIMIT = 1000
+
+    def get(self, request, pk):
+        test_session = get_object_or_404(TestSession, pk=pk)
+        try:
+            after = int(request.GET.get("after", 0))
+            limit = min(int(request.GET.get("limit", self.DEFAULT_LIMIT)), self.MAX_LIMIT)
+        except ValueError:
+            return JsonResponse({"error": "Invalid after or limit"}, status=400)
+        if limit < 1:
+            return JsonResponse({"error": "Invalid after or limit"}, status=400)
+
+        # 取得中に変更された行を次回の差分に含めるため、クエリより前の時刻を返す
+        synced_at = timezone.now()
+        executions = test_session.executions.filter(position__gt=after)
+        since = request.GET.get("since")
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return JsonResponse({"error": "Invalid since"}, status=400)
+            executions = executions.filter(updated_at__gte=since)
+
+        status_display = dict(TestExecution.STATUS_CHOICES)
+        rows = [
+            {
+                "id": row["id"],
+                "position": row["position"],
+                "test_case_id": row["test_case_id"],
+                "title": row["test_case__title"],
+                "status": row["status"],
+                "status_display": status_display[row["status"]],
+                "notes": Truncator(row["notes"]).words(10),
+            }
+            for row in executions.values(
+                "id", "position", "test_case_id", "test_case__title", "status", "notes"
+            )[: limit + 1]
+        ]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return JsonResponse(
+            {
+                "executions": rows,
+                "next": rows[-1]["position"] if has_more else None,
+                "synced_at": synced_at.isoformat(),
+            }
+        )
+
+
 class TestSessionSkipAllView(LoginRequiredMixin, View):
     """テストセッション内の未実行のテストケースをすべてスキップにして完了する"""
 
@@ -363,38 +450,88 @@ class TestSessionDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        executions = self.object.executions.all()
         context.update(
             {
-                "pass_count": executions.filter(status="PASS").count(),
-                "fail_count": executions.filter(status="FAIL").count(),
-                "blocked_count": executions.filter(status="BLOCKED").count(),
-                "skipped_count": executions.filter(status="SKIPPED").count(),
+                "pass_count": self.object.pass_count,
+                "fail_count": self.object.fail_count,
+                "blocked_count": self.object.blocked_count,
+                "skipped_count": self.object.skipped_count,
+                # 各行でテストケースのタイトルを表示するため、まとめて取得する
+                "executions": self.object.executions.select_related("test_case"),
             }
         )
         return context
 
 
-class ProjectListView(ListView):
+class ProjectListView(KeysetPaginationMixin, ListView):
     model = Project
     template_name = "test_manager/project_list.html"
     context_object_name = "projects"
+    paginate_by = 20
+    sort_orders = {"name": ("名前順", ("name", "pk"))}
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["test_sessions"] = TestSession.objects.all().order_by("-started_at")[
-            :10
-        ]
+        context["test_sessions"] = TestSession.objects.select_related(
+            "project"
+        ).order_by("-started_at")[:10]
+        if self.request.user.is_authenticated:
+            context["projects"] = self._with_summaries(context["projects"])
         return context
 
+    def _with_summaries(self, projects):
+        """各プロジェクトにスイート数・ケース数・最新のセッションの集計値を付与する"""
+        projects = list(projects)
+        summaries = Project.summaries([project.pk for project in projects])
+        session_summaries = TestSession.summaries(
+            [
+                summary["latest_session_id"]
+                for summary in summaries.values()
+                if summary["latest_session_id"] is not None
+            ]
+        )
+        for project in projects:
+            summary = summaries.get(project.pk, {})
+            project.suite_count = summary.get("suite_count", 0)
+            project.case_count = summary.get("case_count", 0)
+            project.latest_session = session_summaries.get(
+                summary.get("latest_session_id")
+            )
+        return projects
+
+
+def _sessions_state(sessions):
+    # セッションの追加・削除と完了を検知する
+    return [
+        (sessions, "started_at"),
+        (sessions.filter(completed_at__isnull=False), "completed_at"),
+    ]
+
+
+def _project_detail_state(request, pk):
+    last_modified, state = content_state(
+        Project.objects.filter(pk=pk),
+        TestSuite.objects.filter(project_id=pk),
+        TestCase.objects.filter(suite__project_id=pk),
+        *_sessions_state(TestSession.objects.filter(project_id=pk)),
+        TestExecution.objects.filter(test_case__suite__project_id=pk),
+    )
+    return (last_modified, state) if state[0][1] else None
+
 
-class ProjectDetailView(LoginRequiredMixin, DetailView):
+@method_decorator(conditional_get(_project_detail_state, per_user=True), name="get")
+class ProjectDetailView(LoginRequiredMixin, FragmentCacheMixin, DetailView):
     model = Project
     template_name = "test_manager/project_detail.html"
     context_object_name = "project"
 
+    def get_fragment_cache_project_id(self):
+        return self.object.pk
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # フラグメントキャッシュがない場合のみ評価される
+        context["test_suites"] = self.object.test_suites.prefetch_related("test_cases")
         # 最近の実行結果を取得（全テストスイートの全テストケースから）
         recent_executions = (
             TestExecution.objects.filter(test_case__suite__project=self.object)
@@ -435,43 +572,58 @@ class TestSuiteDeleteView(TestEditorRequired, DeleteView):
         return reverse_lazy("project_detail", kwargs={"pk": self.object.project.pk})
 
 
-class TestSuiteListView(LoginRequiredMixin, ListView):
+class TestSuiteListView(
+    LoginRequiredMixin, ListFilterMixin, KeysetPaginationMixin, ListView
+):
     model = TestSuite
     template_name = "test_manager/suite_list.html"
     context_object_name = "suites"
+    filter_form_class = TestSuiteFilterForm
+    sort_orders = {
+        "name": ("名前順", ("name", "pk")),
+        "updated": ("更新日時の新しい順", ("-updated_at", "-pk")),
+    }
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("project")
+
+
+def _suite_detail_state(request, pk):
+    last_modified, state = content_state(
+        TestSuite.objects.filter(pk=pk),
+        Project.objects.filter(test_suites=pk),
+        TestCase.objects.filter(suite_id=pk),
+        *_sessions_state(TestSession.objects.filter(project__test_suites=pk)),
+        TestExecution.objects.filter(test_case__suite_id=pk),
+    )
+    return (last_modified, state) if state[0][1] else None
 
 
-class TestSuiteDetailView(LoginRequiredMixin, DetailView):
+@method_decorator(conditional_get(_suite_detail_state, per_user=True), name="get")
+class TestSuiteDetailView(LoginRequiredMixin, FragmentCacheMixin, DetailView):
     model = TestSuite
     template_name = "test_manager/suite_detail.html"
     context_object_name = "suite"
 
+    def get_fragment_cache_project_id(self):
+        return self.object.project_id
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["test_cases"] = self.object.test_cases.all()
 
         # テスト実行の結果を事前に計算
         # Changed filter: sessions with executions of test cases in this suite
+        # 合格数・合計数・合格率はTestSessionのカウンタから得る
         recent_test_sessions = (
             TestSession.objects.filter(
                 project=self.object.project,
                 executions__test_case__suite=self.object
             )
             .distinct() # Avoid duplicates if a session has multiple cases from this suite
-            .prefetch_related("executions")
             .order_by("-started_at")[:5]
         )
 
-        for session in recent_test_sessions:
-            session.pass_count = session.executions.filter(status="PASS").count()
-            session.total_count = session.executions.count()
-            if session.total_count > 0:
-                session.pass_percentage = (
-                    session.pass_count * 100
-                ) // session.total_count
-            else:
-                session.pass_percentage = 0
-
         context["recent_test_sessions"] = recent_test_sessions
         return context
 
@@ -545,14 +697,60 @@ class TestCaseDeleteView(TestEditorRequired, DeleteView):
     model = TestCase
     template_name = "test_manager/case_confirm_delete.html"
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["execution_summary"] = self.object.executions.aggregate(
+            count=Count("id"), last_executed_at=Max("executed_at")
+        )
+        return context
+
     def get_success_url(self):
         return reverse_lazy("suite_detail", kwargs={"pk": self.object.suite.pk})
 
 
-class TestCaseListView(LoginRequiredMixin, ListView):
+class TestCaseListView(
+    LoginRequiredMixin, ListFilterMixin, KeysetPaginationMixin, ListView
+):
     model = TestCase
     template_name = "test_manager/case_list.html"
     context_object_name = "cases"
+    filter_form_class = TestCaseFilterForm
+    sort_orders = {
+        "updated": ("更新日時の新しい順", ("-updated_at", "-pk")),
+        "created": ("作成日時の新しい順", ("-created_at", "-pk")),
+        "title": ("タイトル順", ("title", "pk")),
+    }
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("suite__project")
+
+
+class SearchView(LoginRequiredMixin, ListView):
+    """テストケースとステップを全文検索し、関連度の高い順に表示する"""
+
+    template_name = "test_manager/search.html"
+    context_object_name = "results"
+    paginate_by = 20
+
+    def get(self, request, *args, **kwargs):
+        self.form = SearchForm(request.GET or None)
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        if not self.form.is_valid():
+            return []
+        return search_test_cases(
+            self.form.cleaned_data["q"], self.form.cleaned_data["project"]
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["form"] = self.form
+        # ページ送りのリンクに検索条件を引き継ぐ
+        params = self.request.GET.copy()
+        params.pop("page", None)
+        context["query_string"] = params.urlencode()
+        return context
 
 
 class TestStepListView(TestEditorRequired, View):
@@ -588,22 +786,50 @@ class TestStepListView(TestEditorRequired, View):
         return get_object_or_404(TestCase, pk=self.kwargs["case_pk"]).suite.project
 
 
-class TestCaseDetailView(LoginRequiredMixin, DetailView):
+def _case_detail_state(request, pk):
+    last_modified, state = content_state(
+        TestCase.objects.filter(pk=pk),
+        TestSuite.objects.filter(test_cases=pk),
+        Project.objects.filter(test_suites__test_cases=pk),
+        TestStep.objects.filter(test_case_id=pk),
+        TestExecution.objects.filter(test_case_id=pk),
+    )
+    return (last_modified, state) if state[0][1] else None
+
+
+@method_decorator(conditional_get(_case_detail_state, per_user=True), name="get")
+class TestCaseDetailView(LoginRequiredMixin, FragmentCacheMixin, DetailView):
     model = TestCase
     template_name = "test_manager/case_detail.html"
     context_object_name = "case"
 
+    def get_fragment_cache_project_id(self):
+        return self.object.suite.project_id
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["executions"] = self.object.executions.order_by("-executed_at")
+        context["executions"] = self.object.executions.select_related(
+            "test_session"
+        ).order_by("-executed_at")
+        context["execution_stats"] = self.object.executions.status_stats()
         return context
 
 
-class TestSessionListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class TestSessionListView(
+    LoginRequiredMixin,
+    UserPassesTestMixin,
+    ListFilterMixin,
+    KeysetPaginationMixin,
+    ListView,
+):
     model = TestSession
     template_name = "test_manager/test_session_list.html"
     context_object_name = "test_sessions"
-    ordering = ["-started_at"]
+    filter_form_class = TestSessionFilterForm
+    sort_orders = {
+        "started": ("開始日時の新しい順", ("-started_at", "-pk")),
+        "started_asc": ("開始日時の古い順", ("started_at", "pk")),
+    }
 
     def test_func(self):
         return self.request.user.is_superuser
@@ -613,22 +839,6 @@ class TestSessionListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         queryset = queryset.select_related("project")
         return queryset
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        for test_session in context["test_sessions"]:
-            executions = test_session.executions.all()
-            test_session.pass_count = executions.filter(status="PASS").count()
-            test_session.fail_count = executions.filter(status="FAIL").count()
-            test_session.blocked_count = executions.filter(status="BLOCKED").count()
-            test_session.skipped_count = executions.filter(status="SKIPPED").count()
-            test_session.total_count = executions.count()
-            test_session.pass_percentage = (
-                (test_session.pass_count * 100 // test_session.total_count)
-                if test_session.total_count > 0
-                else 0
-            )
-        return context
-
 
 class TestExecutionCreateView(TestExecutorRequired, CreateView):
     model = TestExecution
@@ -642,6 +852,14 @@ class TestExecutionCreateView(TestExecutorRequired, CreateView):
         "environment",
     ]
 
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        # 選択肢の表示(TestSession.__str__)でプロジェクト名を使うため、まとめて取得する
+        form.fields["test_session"].queryset = TestSession.objects.select_related(
+            "project"
+        )
+        return form
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         test_case = get_object_or_404(TestCase, pk=self.kwargs["case_pk"])
@@ -2,210 +2,237 @@ import csv
 from logging import getLogger
 import io
 
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views import View
-from django.db import transaction
-from .models import Project, TestSuite, TestCase, TestStep
+from .csv_importer import CSVImporter
+from .mixins import keyset_after
+from .models import Project, TestSuite, TestCase, TestStep, ImportJob
 
 
 _logger = getLogger("views")
 
 
-class ProjectCSVExportView(View):
-    @method_decorator(login_required)
-    def get(self, request, project_id, *args, **kwargs):
-        project = get_object_or_404(Project, pk=project_id)
-        response = HttpResponse(
-            content_type="text/csv",
-            headers={
-                "Content-Disposition": f'attachment; filename="test_data_{project.name}.csv"'
-            },
-        )
-
-        writer = csv.writer(response)
-        writer.writerow(
-            [
-                "project_name",
-                "type",
-                "parent",
-                "name",
-                "description",
-                "order",
-                "status",
-                "priority",
-                "prerequisites",
-                "expected_result",
-            ]
-        )
-
+# エクスポートするCSVのヘッダ
+CSV_HEADERS = [
+    "project_name",
+    "type",
+    "parent",
+    "name",
+    "description",
+    "order",
+    "status",
+    "priority",
+    "prerequisites",
+    "expected_result",
+]
+
+# エクスポート時に一度に読み込む行数
+EXPORT_CHUNK_SIZE = 500
+
+# エクスポートで読み込む各モデルの値と並び順。
+# 親のプロジェクト・スイートの順に並べ、Python側で親の行と突き合わせる
+PROJECT_EXPORT_FIELDS = ("id", "name", "description")
+PROJECT_EXPORT_ORDER = ("id",)
+SUITE_EXPORT_FIELDS = ("id", "project_id", "name", "description")
+SUITE_EXPORT_ORDER = ("project_id", "id")
+CASE_EXPORT_FIELDS = (
+    "id",
+    "suite__project_id",
+    "suite_id",
+    "title",
+    "description",
+    "status",
+    "priority",
+    "prerequisites",
+)
+CASE_EXPORT_ORDER = ("suite__project_id", "suite_id", "id")
+
+
+class _Echo:
+    """csv.writerの書き込み先として、書き込まれた値をそのまま返す疑似バッファ"""
+
+    def write(self, value):
+        return value
+
+
+def _iter_chunked(queryset, order):
+    """querysetの行をorderの並び順でEXPORT_CHUNK_SIZE件ずつ読み込んで順に返す。
+    2回目以降は前のチャンクの最後の行より後の範囲を読むため、OFFSETを使わず、
+    読み込んだ行を保持し続けることもない"""
+    queryset = queryset.order_by(*order)
+    chunk = list(queryset[:EXPORT_CHUNK_SIZE])
+    while chunk:
+        yield from chunk
+        if len(chunk) < EXPORT_CHUNK_SIZE:
+            return
+        values = [chunk[-1][field] for field in order]
+        chunk = list(queryset.filter(keyset_after(order, values))[:EXPORT_CHUNK_SIZE])
+
+
+def _iter_cases(projects):
+    """プロジェクト群のテストケースを順に返す。
+    ステップはケースのチャンクごとにまとめて読み込み、stepsとして付与する"""
+    cases = TestCase.objects.filter(suite__project__in=projects).values(
+        *CASE_EXPORT_FIELDS
+    )
+    chunk = []
+    for case in _iter_chunked(cases, CASE_EXPORT_ORDER):
+        chunk.append(case)
+        if len(chunk) == EXPORT_CHUNK_SIZE:
+            yield from _with_steps(chunk)
+            chunk = []
+    yield from _with_steps(chunk)
+
+
+def _with_steps(cases):
+    if not cases:
+        return []
+    steps = {case["id"]: [] for case in cases}
+    for step in (
+        TestStep.objects.filter(test_case_id__in=steps)
+        .order_by("test_case_id", "order", "id")
+        .values("test_case_id", "order", "description", "expected_result")
+    ):
+        steps[step["test_case_id"]].append(step)
+    for case in cases:
+        case["steps"] = steps[case["id"]]
+    return cases
+
+
+class _ChildRows:
+    """親の並び順に読み込んだ行から、親ごとにそれに属する行を取り出す"""
+
+    def __init__(self, rows, parent_key):
+        self._rows = iter(rows)
+        self._parent_key = parent_key
+        self._next = next(self._rows, None)
+
+    def of(self, key):
+        """親のキーがkeyの行を順に返す。
+        読み込み中に親が削除された場合など、それより前の親に属する行は読み飛ばす"""
+        while self._next is not None and self._parent_key(self._next) <= key:
+            row = self._next
+            self._next = next(self._rows, None)
+            if self._parent_key(row) == key:
+                yield row
+
+
+def _iter_rows(projects):
+    """プロジェクト群とそれに属するスイート・ケース・ステップのCSV行を順に返す。
+
+    プロジェクト・スイート・ケースはそれぞれ全体を通して親の順に
+    EXPORT_CHUNK_SIZE件ずつ読み込むため、件数やプロジェクト数によらず
+    メモリの使用量は一定で、クエリ数は行数/EXPORT_CHUNK_SIZEに比例する"""
+    suites = _ChildRows(
+        _iter_chunked(
+            TestSuite.objects.filter(project__in=projects).values(*SUITE_EXPORT_FIELDS),
+            SUITE_EXPORT_ORDER,
+        ),
+        lambda suite: suite["project_id"],
+    )
+    cases = _ChildRows(
+        _iter_cases(projects),
+        lambda case: (case["suite__project_id"], case["suite_id"]),
+    )
+
+    for project in _iter_chunked(
+        projects.values(*PROJECT_EXPORT_FIELDS), PROJECT_EXPORT_ORDER
+    ):
         # プロジェクトのエクスポート
-        writer.writerow(
-            [
-                project.name,  # project_name
-                "project",  # type
-                "",  # parent（プロジェクトの場合は空）
-                project.name,  # name
-                project.description,  # description
+        yield [
+            project["name"],  # project_name
+            "project",  # type
+            "",  # parent（プロジェクトの場合は空）
+            project["name"],  # name
+            project["description"],  # description
+            "",  # order
+            "",  # status
+            "",  # priority
+            "",  # prerequisites
+            "",  # expected_result
+        ]
+
+        # プロジェクトに属するテストスイートのエクスポート
+        for suite in suites.of(project["id"]):
+            yield [
+                project["name"],  # project_name
+                "suite",  # type
+                project["name"],  # parent（プロジェクト名）
+                suite["name"],  # name
+                suite["description"],  # description
                 "",  # order
                 "",  # status
                 "",  # priority
                 "",  # prerequisites
                 "",  # expected_result
             ]
-        )
 
-        # プロジェクトに属するテストスイートのエクスポート
-        for suite in project.test_suites.all():
-            writer.writerow(
-                [
-                    project.name,  # project_name
-                    "suite",  # type
-                    project.name,  # parent（プロジェクト名）
-                    suite.name,  # name
-                    suite.description,  # description
+            # スイートに属するテストケースのエクスポート
+            for case in cases.of((project["id"], suite["id"])):
+                yield [
+                    project["name"],  # project_name
+                    "case",  # type
+                    suite["name"],  # parent（スイート名）
+                    case["title"],  # name
+                    case["description"],  # description
                     "",  # order
-                    "",  # status
-                    "",  # priority
-                    "",  # prerequisites
+                    case["status"],  # status
+                    case["priority"],  # priority
+                    case["prerequisites"],  # prerequisites
                     "",  # expected_result
                 ]
-            )
 
-            # スイートに属するテストケースのエクスポート
-            for case in suite.test_cases.all():
-                writer.writerow(
-                    [
-                        project.name,  # project_name
-                        "case",  # type
-                        suite.name,  # parent（スイート名）
-                        case.title,  # name
-                        case.description,  # description
-                        "",  # order
-                        case.status,  # status
-                        case.priority,  # priority
-                        case.prerequisites,  # prerequisites
-                        "",  # expected_result
+                # テストケースに属するステップのエクスポート
+                for step in case["steps"]:
+                    yield [
+                        project["name"],  # project_name
+                        "step",  # type
+                        case["title"],  # parent（テストケースのタイトル）
+                        "",  # name（空欄）
+                        step["description"],  # description
+                        str(step["order"]),  # order
+                        "",  # status
+                        "",  # priority
+                        "",  # prerequisites
+                        step["expected_result"],  # expected_result
                     ]
-                )
 
-                # テストケースに属するステップのエクスポート
-                for step in case.steps.all():
-                    writer.writerow(
-                        [
-                            project.name,  # project_name
-                            "step",  # type
-                            case.title,  # parent（テストケースのタイトル）
-                            "",  # name（空欄）
-                            step.description,  # description
-                            str(step.order),  # order
-                            "",  # status
-                            "",  # priority
-                            "",  # prerequisites
-                            step.expected_result,  # expected_result
-                        ]
-                    )
-
-        return response
+
+def _stream_csv(projects):
+    """指定したプロジェクト群(QuerySet)をCSVの行単位の文字列として順に返す"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADERS)
+    for row in _iter_rows(projects):
+        yield writer.writerow(row)
+
+
+class ProjectCSVExportView(View):
+    @method_decorator(login_required)
+    def get(self, request, project_id, *args, **kwargs):
+        project = get_object_or_404(Project, pk=project_id)
+        return StreamingHttpResponse(
+            _stream_csv(Project.objects.filter(pk=project.pk)),
+            content_type="text/csv",
+            headers={
+                "Content-Disposition": f'attachment; filename="test_data_{project.name}.csv"'
+            },
+        )
 
 
 class CSVExportView(View):
     @method_decorator(login_required)
     def get(self, request, *args, **kwargs):
-        response = HttpResponse(
+        return StreamingHttpResponse(
+            _stream_csv(Project.objects.all()),
             content_type="text/csv",
             headers={"Content-Disposition": 'attachment; filename="test_data.csv"'},
         )
 
-        writer = csv.writer(response)
-        writer.writerow(
-            [
-                "project_name",
-                "type",
-                "parent",
-                "name",
-                "description",
-                "order",
-                "status",
-                "priority",
-                "prerequisites",
-                "expected_result",
-            ]
-        )
-
-        # プロジェクトのエクスポート
-        for project in Project.objects.all():
-            writer.writerow(
-                [
-                    project.name,  # project_name
-                    "project",  # type
-                    "",  # parent（プロジェクトの場合は空）
-                    project.name,  # name
-                    project.description,  # description
-                    "",  # order
-                    "",  # status
-                    "",  # priority
-                    "",  # prerequisites
-                    "",  # expected_result
-                ]
-            )
-
-            # プロジェクトに属するテストスイートのエクスポート
-            for suite in project.test_suites.all():
-                writer.writerow(
-                    [
-                        project.name,  # project_name
-                        "suite",  # type
-                        project.name,  # parent（プロジェクト名）
-                        suite.name,  # name
-                        suite.description,  # description
-                        "",  # order
-                        "",  # status
-                        "",  # priority
-                        "",  # prerequisites
-                        "",  # expected_result
-                    ]
-                )
-
-                # スイートに属するテストケースのエクスポート
-                for case in suite.test_cases.all():
-                    writer.writerow(
-                        [
-                            project.name,  # project_name
-                            "case",  # type
-                            suite.name,  # parent（スイート名）
-                            case.title,  # name
-                            case.description,  # description
-                            "",  # order
-                            case.status,  # status
-                            case.priority,  # priority
-                            case.prerequisites,  # prerequisites
-                            "",  # expected_result
-                        ]
-                    )
-
-                    # テストケースに属するステップのエクスポート
-                    for step in case.steps.all():
-                        writer.writerow(
-                            [
-                                project.name,  # project_name
-                                "step",  # type
-                                case.title,  # parent（テストケースのタイトル）
-                                "",  # name（空欄）
-                                step.description,  # description
-                                str(step.order),  # order
-                                "",  # status
-                                "",  # priority
-                                "",  # prerequisites
-                                step.expected_result,  # expected_result
-                            ]
-                        )
-
-        return response
-
 
 class CSVImportView(View):
     @method_decorator(login_required)
@@ -259,130 +286,32 @@ class CSVImportView(View):
                     "Invalid CSV format: missing required headers", status=400
                 )
 
-            # 一時保存用の辞書
-            imported_objects = {"project": {}, "suite": {}, "case": {}, "step": {}}
-
-            with transaction.atomic():
-                current_project = None
-                current_suite = None
-                current_case = None
-
-                # Excel方言の改行対応を含むCSVを読むためにファイルオブジェクトにくるむ
-                reader = csv.DictReader(io.StringIO(csv_content, newline=""))
-
-                for row_num, row in enumerate(reader, 1):
-                    # print(f"{row_num}: {row['expected_result']}", file=f, flush=True)
-                    try:
-                        record_type = row["type"]
-
-                        if record_type == "project":
-                            current_project, created = Project.objects.update_or_create(
-                                name=row["name"],
-                                defaults={"description": row["description"]},
-                            )
-                            imported_objects["project"][row["name"]] = current_project
-
-                        elif record_type == "suite":
-                            project_name = row["project_name"]
-                            if not project_name:
-                                raise ValueError("Suite found without project_name")
-
-                            current_project = imported_objects["project"].get(
-                                project_name
-                            )
-                            if not current_project:
-                                current_project = Project.objects.get(name=project_name)
-                                imported_objects["project"][
-                                    project_name
-                                ] = current_project
-
-                            current_suite, created = TestSuite.objects.update_or_create(
-                                project=current_project,
-                                name=row["name"],
-                                defaults={"description": row["description"]},
-                            )
-                            imported_objects["suite"][
-                                f"{project_name}:{row['name']}"
-                            ] = current_suite
-
-                        elif record_type == "case":
-                            project_name = row["project_name"]
-                            parent_name = row["parent"]  # スイート名
-                            if not project_name or not parent_name:
-                                raise ValueError(
-                                    "Case found without project_name or parent"
-                                )
-
-                            current_project = imported_objects["project"].get(
-                                project_name
-                            )
-                            if not current_project:
-                                current_project = Project.objects.get(name=project_name)
-                                imported_objects["project"][
-                                    project_name
-                                ] = current_project
-
-                            current_suite = TestSuite.objects.get(
-                                project=current_project, name=parent_name
-                            )
-                            imported_objects["suite"][
-                                f"{project_name}:{parent_name}"
-                            ] = current_suite
-
-                            current_case, created = TestCase.objects.update_or_create(
-                                suite=current_suite,
-                                title=row["name"],
-                                defaults={
-                                    "description": row["description"],
-                                    "prerequisites": row["prerequisites"] or "",
-                                    "status": row["status"] or "DRAFT",
-                                    "priority": row["priority"] or "MEDIUM",
-                                },
-                            )
-                            imported_objects["case"][
-                                f"{parent_name}:{row['name']}"
-                            ] = current_case
-
-                        elif record_type == "step":
-                            project_name = row["project_name"]
-                            parent_name = row["parent"]  # テストケースのタイトル
-                            if not project_name or not parent_name:
-                                raise ValueError(
-                                    f"Step found without project_name or parent (row_num: {row_num})"
-                                )
-
-                            if not row["order"]:
-                                raise ValueError("Step order is required")
-
-                            current_project = imported_objects["project"].get(
-                                project_name
-                            )
-                            if not current_project:
-                                current_project = Project.objects.get(name=project_name)
-                                imported_objects["project"][
-                                    project_name
-                                ] = current_project
-
-                            current_case = TestCase.objects.get(
-                                suite__project=current_project, title=parent_name
-                            )
-
-                            TestStep.objects.update_or_create(
-                                test_case=current_case,
-                                order=int(row["order"]),
-                                defaults={
-                                    "description": row["description"],
-                                    "expected_result": row["expected_result"] or "",
-                                },
-                            )
-                        else:
-                            raise ValueError(f"Invalid record_type {record_type}")
-                    except (KeyError, ValueError) as e:
-                        raise ValueError(f"Invalid data format: {str(e)}")
-
-            messages.success(request, "CSVファイルのインポートが完了しました")
-            return redirect("project_list")
+            # 行の形式の誤りはDBにアクセスせずに判定できるため、受付時点でエラーにする
+            CSVImporter().parse(csv.DictReader(io.StringIO(csv_content, newline="")))
+
+            # インポート自体はrun_import_workerのワーカーがバックグラウンドで行う
+            job = ImportJob.objects.create(
+                file_name=csv_file.name,
+                content=csv_content,
+                created_by=request.user.username,
+            )
+
+            messages.success(request, "CSVファイルのインポートを受け付けました")
+            return redirect(f"{reverse('csv_management')}?job={job.pk}")
         except ValueError as e:
             return HttpResponse(f"Import failed: {str(e)}", status=400)
         except Exception as e:
             return HttpResponse(f"Import failed: Unexpected error occurred ({e})", status=400)
+
+
+class ImportJobStatusView(View):
+    """CSVインポートジョブの状態と進捗をJSONで返す。
+    参照できるのはジョブを登録したユーザーと管理者のみで、それ以外には存在を知らせず404を返す"""
+
+    @method_decorator(login_required)
+    def get(self, request, pk, *args, **kwargs):
+        jobs = ImportJob.objects.defer("content")
+        if not request.user.is_superuser:
+            jobs = jobs.filter(created_by=request.user.username)
+        job = get_object_or_404(jobs, pk=pk)
+        return JsonResponse(job.to_dict())